@@ -1,7 +1,12 @@
-import time
-import math
+import os
+import struct
 import displayio
 from adafruit_matrixportal.matrix import Matrix
+from flowanim import FrameEngine, FramePacer
+try:
+    import ulab.numpy as np
+except ImportError:
+    import numpy as np
 
 #--| User Config |-----------------------------------------
 SINGULARITIES = (
@@ -33,9 +38,22 @@ SING_COLOR = 0xADAF00 # singularities
 HEAD_COLOR = 0x00FFFF # leading particles
 TAIL_COLOR = 0x000A0A # trailing particles
 TAIL_LENGTH = 10      # length in pixels
-DELAY = 0.01          # smaller = faster
+TARGET_FPS = 30       # frames per second
+CACHE_FILE = '/flow_streamlines.bin' # None to always compute
 #----------------------------------------------------------
 
+# singularity types as numeric codes
+FREESTREAM = 0
+SOURCE = 1
+VORTEX = 2
+DOUBLET = 3
+SING_CODES = {'freestream': FREESTREAM, 'source': SOURCE,
+              'vortex': VORTEX, 'doublet': DOUBLET}
+MIN_R2 = 0.25         # avoids infinite velocity on a singularity
+CACHE_VERSION = 2
+CACHE_POINT_FMT = '<hhff' # streamlines can drift well outside the matrix
+CACHE_POINT_LEN = struct.calcsize(CACHE_POINT_FMT)
+
 # matrix and displayio setup
 matrix = Matrix(width=MATRIX_WIDTH, height=MATRIX_HEIGHT, bit_depth=6)
 display = matrix.display
@@ -43,6 +61,7 @@ group = displayio.Group()
 display.show(group)
 
 bitmap = displayio.Bitmap(display.width, display.height, 4)
+background = displayio.Bitmap(display.width, display.height, 4)
 
 palette = displayio.Palette(4)
 palette[0] = BACK_COLOR
@@ -56,116 +75,181 @@ group.append(tile_grid)
 # global to store streamline data
 STREAMLINES = []
 
-def compute_velocity(x, y):
-    '''Compute resultant velocity induced at (x, y) from all singularities.'''
-    vx = vy = 0
+# precomputed velocity field, flattened with row y starting at y * MATRIX_WIDTH
+FIELD_VX = None
+FIELD_VY = None
+
+def compute_field():
+    '''Compute the velocity induced by all singularities at every pixel.'''
+    global FIELD_VX, FIELD_VY
+    count = MATRIX_WIDTH * MATRIX_HEIGHT
+    idx = np.arange(count)
+    gy = np.floor(idx / MATRIX_WIDTH)
+    gx = idx - gy * MATRIX_WIDTH
+    vx = np.zeros(count)
+    vy = np.zeros(count)
     for s in SINGULARITIES:
-        if s[0] == 'freestream':
+        code = SING_CODES[s[0]]
+        if code == FREESTREAM:
             vx += s[2][0]
             vy += s[2][1]
-        else:
-            dx = x - s[1][0]
-            dy = y - s[1][1]
-            r2 = dx*dx + dy*dy
-            if s[0] == 'source':
-                vx += s[2] * dx / r2
-                vy += s[2] * dy / r2
-            elif s[0] == 'vortex':
-                vx -=  s[2] * dy / r2
-                vy +=  s[2] * dx / r2
-            elif s[0] == 'doublet':
-                vx += s[2] * (dy*dy - dx*dx) / (r2*r2)
-                vy -= s[2] * (2*dx*dy) / (r2*r2)
+            continue
+        dx = gx - s[1][0]
+        dy = gy - s[1][1]
+        r2 = np.maximum(dx*dx + dy*dy, MIN_R2)
+        if code == SOURCE:
+            vx += s[2] * dx / r2
+            vy += s[2] * dy / r2
+        elif code == VORTEX:
+            vx -= s[2] * dy / r2
+            vy += s[2] * dx / r2
+        elif code == DOUBLET:
+            vx += s[2] * (dy*dy - dx*dx) / (r2*r2)
+            vy -= s[2] * (2*dx*dy) / (r2*r2)
+    FIELD_VX = vx
+    FIELD_VY = vy
+
+def sample_field(x, y):
+    '''Bilinear interpolation of the velocity field at all the (x, y) positions.'''
+    x = np.clip(x, 0, MATRIX_WIDTH - 1.001)
+    y = np.clip(y, 0, MATRIX_HEIGHT - 1.001)
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = x - x0
+    fy = y - y0
+    i00 = np.array(y0 * MATRIX_WIDTH + x0, dtype=np.uint16)
+    i10 = i00 + 1
+    i01 = i00 + MATRIX_WIDTH
+    i11 = i01 + 1
+    w00 = (1 - fx) * (1 - fy)
+    w10 = fx * (1 - fy)
+    w01 = (1 - fx) * fy
+    w11 = fx * fy
+    vx = (np.take(FIELD_VX, i00) * w00 + np.take(FIELD_VX, i10) * w10
+          + np.take(FIELD_VX, i01) * w01 + np.take(FIELD_VX, i11) * w11)
+    vy = (np.take(FIELD_VY, i00) * w00 + np.take(FIELD_VY, i10) * w10
+          + np.take(FIELD_VY, i01) * w01 + np.take(FIELD_VY, i11) * w11)
     return vx, vy
 
 def compute_streamlines():
-    '''Compute streamline for each starting point (seed) defined.'''
-    for seed in SEEDS:
-        streamline = []
-        x, y = seed
-        px = round(x)
-        py = round(y)
-        vx, vy = compute_velocity(x, y)
-        streamline.append( ((px, py), (vx, vy)) )
-        steps = 0
-        while x < MATRIX_WIDTH and steps < 2 * MATRIX_WIDTH:
-            nx = round(x)
-            ny = round(y)
+    '''Compute streamline for all starting points (seeds) simultaneously
+       using midpoint (RK2) integration through the velocity field.'''
+    x = np.array([float(seed[0]) for seed in SEEDS])
+    y = np.array([float(seed[1]) for seed in SEEDS])
+    vx, vy = sample_field(x, y)
+    streamlines = []
+    last = []
+    for idx, seed in enumerate(SEEDS):
+        px = round(seed[0])
+        py = round(seed[1])
+        streamlines.append([((px, py), (vx[idx], vy[idx]))])
+        last.append((px, py))
+    active = [seed[0] < MATRIX_WIDTH for seed in SEEDS]
+    for _ in range(2 * MATRIX_WIDTH):
+        if not any(active):
+            break
+        vx, vy = sample_field(x, y)
+        vx, vy = sample_field(x + 0.5 * vx, y + 0.5 * vy)
+        x += vx
+        y += vy
+        for idx, streamline in enumerate(streamlines):
+            if not active[idx]:
+                continue
+            if x[idx] >= MATRIX_WIDTH:
+                active[idx] = False
+                continue
+            nx = round(x[idx])
+            ny = round(y[idx])
             # if we've moved to a new pixel, store the info
-            if nx != px or ny != py:
-                streamline.append( ((nx, ny), (vx, vy)) )
-                px = nx
-                py = ny
-            vx, vy = compute_velocity(x, y)
-            x += vx
-            y += vy
-            steps += 1
-        # add streamline to global store
-        STREAMLINES.append(streamline)
+            if (nx, ny) != last[idx]:
+                streamline.append( ((nx, ny), (vx[idx], vy[idx])) )
+                last[idx] = (nx, ny)
+    # add streamlines to global store
+    STREAMLINES.extend(streamlines)
+
+def cache_key():
+    '''Identify everything the streamlines depend on.'''
+    return repr((CACHE_VERSION, MATRIX_WIDTH, MATRIX_HEIGHT,
+                 SINGULARITIES, SEEDS)).encode()
+
+def load_streamlines():
+    '''Load streamlines from CACHE_FILE if it matches the configuration.'''
+    if CACHE_FILE is None:
+        return False
+    key = cache_key()
+    try:
+        with open(CACHE_FILE, 'rb') as fp:
+            if fp.read(len(key) + 2) != struct.pack('<H', len(key)) + key:
+                return False
+            count = struct.unpack('<H', fp.read(2))[0]
+            streamlines = []
+            for _ in range(count):
+                length = struct.unpack('<H', fp.read(2))[0]
+                data = fp.read(length * CACHE_POINT_LEN)
+                streamline = []
+                for offset in range(0, length * CACHE_POINT_LEN, CACHE_POINT_LEN):
+                    px, py, vx, vy = struct.unpack_from(CACHE_POINT_FMT, data, offset)
+                    streamline.append( ((px, py), (vx, vy)) )
+                streamlines.append(streamline)
+    except (OSError, ValueError, struct.error):
+        return False
+    STREAMLINES.extend(streamlines)
+    return True
+
+def save_streamlines():
+    '''Save streamlines to CACHE_FILE, CIRCUITPY is often read-only.'''
+    if CACHE_FILE is None:
+        return False
+    key = cache_key()
+    try:
+        with open(CACHE_FILE, 'wb') as fp:
+            fp.write(struct.pack('<H', len(key)) + key)
+            fp.write(struct.pack('<H', len(STREAMLINES)))
+            for streamline in STREAMLINES:
+                fp.write(struct.pack('<H', len(streamline)))
+                for (px, py), (vx, vy) in streamline:
+                    fp.write(struct.pack(CACHE_POINT_FMT, px, py, vx, vy))
+    except OSError:
+        return False
+    except struct.error:
+        # a point too far off the matrix, do not leave a partial file
+        try:
+            os.remove(CACHE_FILE)
+        except OSError:
+            pass
+        return False
+    return True
 
 def show_singularities():
-    '''Draw the singularites.'''
+    '''Draw the singularites on the background.'''
     for s in SINGULARITIES:
-        try:
-            x, y = s[1]
-            bitmap[round(x), round(y)] = 1
-        except:
-            pass # just don't draw it
-
-def show_streamlines():
-    '''Draw the streamlines.'''
-    for sl, head in enumerate(HEADS):
-        try:
-            streamline = STREAMLINES[sl]
-            index = round(head)
-            length = min(index, TAIL_LENGTH)
-            # draw tail
-            for data in streamline[index-length:index]:
-                x, y = data[0]
-                bitmap[round(x), round(y)] = 3
-            # draw head
-            bitmap[round(x), round(y)] = 2
-        except:
-            pass # just don't draw it
-
-def animate_streamlines():
-    '''Update the current location (head position) along each streamline.'''
-    reset_heads = True
-    for sl, head in enumerate(HEADS):
-        # get associated streamline
-        streamline = STREAMLINES[sl]
-        # compute index
-        index = round(head)
-        # get velocity
-        if index < len(streamline):
-            vx, vy = streamline[index][1]
-            reset_heads = False
-        else:
-            vx, vy = streamline[-1][1]
-        # move head
-        HEADS[sl] += math.sqrt(vx*vx + vy*vy)
-    if reset_heads:
-        # all streamlines have reached the end, so reset to start
-        for index, _ in enumerate(HEADS):
-            HEADS[index] = 0
-
-def update_display():
-    '''Update the matrix display.'''
-    display.auto_refresh = False
-    bitmap.fill(0)
-    show_singularities()
-    show_streamlines()
-    display.auto_refresh = True
+        if s[1] is None:
+            continue # freestream has no location
+        x = round(s[1][0])
+        y = round(s[1][1])
+        if 0 <= x < MATRIX_WIDTH and 0 <= y < MATRIX_HEIGHT:
+            background[x, y] = 1
 
 #==========
 # MAIN
 #==========
-print('Computing streamlines...', end='')
-compute_streamlines()
-print('DONE')
-HEADS = [0]*len(STREAMLINES)
+if load_streamlines():
+    print('Loaded streamlines from', CACHE_FILE)
+else:
+    print('Computing streamlines...', end='')
+    compute_field()
+    compute_streamlines()
+    print('DONE')
+    if save_streamlines():
+        print('Saved streamlines to', CACHE_FILE)
+show_singularities()
+bitmap.blit(0, 0, background)
+engine = FrameEngine(bitmap, background, STREAMLINES, TAIL_LENGTH)
+pacer = FramePacer(TARGET_FPS)
 print('Flowing...')
 while True:
-    animate_streamlines()
-    update_display()
-    time.sleep(DELAY)
+    engine.advance()
+    display.auto_refresh = False
+    engine.draw()
+    display.auto_refresh = True
+    pacer.wait()
@@ -2,12 +2,32 @@
 # NOTE: Run this on your PC, not the Matrix Portal.
 #======
 import sys
+import getopt
 import numpy as np
 from PIL import Image
 from ecoulements import systeme
+import flowfile
+
+# -b 1 or -b 2 writes the compact binary format with 8 or 16 bit values
+# instead of python source
+USAGE = "flow_runner.py [-b 1|2] geometry.png"
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "b:")
+    value_bytes = None
+    for opt, arg in opts:
+        if opt == "-b":
+            value_bytes = int(arg)
+            if value_bytes not in flowfile.TYPECODES:
+                raise ValueError("-b must be 1 or 2")
+    if len(args) != 1:
+        raise ValueError("one geometry image is needed")
+except (getopt.GetoptError, ValueError) as ex:
+    print(ex, file=sys.stderr)
+    print(USAGE, file=sys.stderr)
+    sys.exit(2)
 
 # load geometry
-grid = np.where(np.asarray(Image.open(sys.argv[1])), 1, 0)
+grid = np.where(np.asarray(Image.open(args[0])), 1, 0)
 
 # add inlet / outlet flows
 inlet = np.array([2] * grid.shape[0])
@@ -22,15 +42,19 @@ grid = np.vstack((wall, grid, wall))
 _, VX, VY, _ = systeme.sol(grid)
 
 # save results to file
-OUTFILE = "flow_solution.py"
-with open(OUTFILE , "w") as fp:
-    fp.write("nan = None\n")
-    fp.write("solution = {\n")
-    fp.write('"VX":\n')
-    fp.write(str(VX[1:-1, 1:-1].tolist()))
-    fp.write(',\n"VY":\n')
-    fp.write(str(VY[1:-1, 1:-1].tolist()))
-    fp.write("\n}\n")
+if value_bytes is not None:
+    OUTFILE = "flow_solution.bin"
+    flowfile.write_solution(OUTFILE, VX[1:-1, 1:-1], VY[1:-1, 1:-1], value_bytes)
+else:
+    OUTFILE = "flow_solution.py"
+    with open(OUTFILE , "w") as fp:
+        fp.write("nan = None\n")
+        fp.write("solution = {\n")
+        fp.write('"VX":\n')
+        fp.write(str(VX[1:-1, 1:-1].tolist()))
+        fp.write(',\n"VY":\n')
+        fp.write(str(VY[1:-1, 1:-1].tolist()))
+        fp.write("\n}\n")
 
 # done
 print("DONE! Results saved to", OUTFILE)
@@ -1,9 +1,10 @@
-### flow_viewer v2.2
+### flow_viewer v2.5
 ### Flow field visualizer based on potential flow
 
 ### Tested with an Adafruit PyPortal and CircuitPython 6.0.0
 
 ### copy this file to MatrixPortal or PyPortal board as code.py
+### with flowfile.py, flowanim.py and flow_solution.bin or flow_solution.py
 
 ### MIT License
 
@@ -32,9 +33,6 @@
 #======
 # NOTE: Run this on the Matrix Portal or PyPortal.
 #======
-import time
-import math
-
 import board
 import displayio
 
@@ -45,12 +43,25 @@ except ImportError:
     matrix_portal = False
     print("adafruit_matrixportal.matrix library not present - assuming PyPortal")
 
+import flowfile
+from flowanim import FrameEngine, FramePacer
+
+### The binary file from flow_runner -b is much quicker to load
+### and uses far less memory than the python version
+SOLUTION_FILE = "flow_solution.bin"
 try:
-    from flow_solution import solution
-except ImportError as ex:
-    print("A flow_solution.py data file needs to be present - "
-          "this is generated by flow_runner")
-    raise ex
+    field = flowfile.read_solution(SOLUTION_FILE)
+except (OSError, ValueError) as ex:
+    ### ValueError is a truncated file or one from another VERSION
+    print("Not using", SOLUTION_FILE, repr(ex), "- trying flow_solution.py")
+    try:
+        from flow_solution import solution
+    except ImportError as ex:
+        print("A flow_solution.bin or flow_solution.py data file needs to be present - "
+              "this is generated by flow_runner")
+        raise ex
+    field = flowfile.FlowField.from_lists(solution['VX'], solution['VY'])
+    del solution
 
 #--| User Config |-----------------------------------------
 BACK_COLOR = 0x000000 # background fill
@@ -58,14 +69,12 @@ SOLI_COLOR = 0xADAF00 # solids
 HEAD_COLOR = 0x00FFFF # leading particles
 TAIL_COLOR = 0x000A0A << (0 if matrix_portal else 3) # trailing particles
 TAIL_LENGTH = 10      # length in pixels
-DELAY = 0.0           # smaller = faster
+TARGET_FPS = 60       # frames per second
 #----------------------------------------------------------
 
 # use solution to define other items
-VX = solution['VX']
-VY = solution['VY']
-MATRIX_WIDTH = len(VX[0])
-MATRIX_HEIGHT = len(VX)
+MATRIX_WIDTH = field.width
+MATRIX_HEIGHT = field.height
 ### Starting locations specified as (x, y)
 SEEDS = ((0, y) for y in range(1, MATRIX_HEIGHT - 2, 2))
 
@@ -93,9 +102,9 @@ else:
 display.show(group)
 
 ### Draw the solids onto a bitmap used to initialise the frame
-for row in range(len(VX)):
-    for col, v in enumerate(VX[row]):
-        if v is None:
+for row in range(MATRIX_HEIGHT):
+    for col in range(MATRIX_WIDTH):
+        if field.solid(col, row):
             solids_bitmap[col, row] = 1
 
 palette = displayio.Palette(4)
@@ -118,8 +127,7 @@ def compute_streamlines():
         x, y = seed
         px = round(x)
         py = round(y)
-        vx = VX[py][px]
-        vy = VY[py][px]
+        vx, vy = field.velocity(px, py)
         streamline.append( ((px, py), (vx, vy)) )
         steps = 0
         while x < MATRIX_WIDTH and steps < 2 * MATRIX_WIDTH:
@@ -131,8 +139,7 @@ def compute_streamlines():
                 px = nx
                 py = ny
             if 0 <= nx < MATRIX_WIDTH and 0 <= ny < MATRIX_HEIGHT:
-                vx = VX[ny][nx]
-                vy = VY[ny][nx]
+                vx, vy = field.velocity(nx, ny)
             if vx is None or vy is None:
                 break
             x += vx
@@ -141,60 +148,20 @@ def compute_streamlines():
         # add streamline to global store
         STREAMLINES.append(streamline)
 
-def show_streamlines():
-    '''Draw the streamlines.'''
-    for sl, head in enumerate(HEADS):
-        try:
-            streamline = STREAMLINES[sl]
-            index = round(head)
-            length = min(index, TAIL_LENGTH)
-            # draw tail
-            for data in streamline[index-length:index]:
-                x, y = data[0]
-                bitmap[round(x), round(y)] = 3
-            # draw head
-            bitmap[round(x), round(y)] = 2
-        except:
-            pass # just don't draw it
-
-def animate_streamlines():
-    '''Update the current location (head position) along each streamline.'''
-    reset_heads = True
-    for sl, head in enumerate(HEADS):
-        # get associated streamline
-        streamline = STREAMLINES[sl]
-        # compute index
-        index = round(head)
-        # get velocity
-        if index < len(streamline):
-            vx, vy = streamline[index][1]
-            reset_heads = False
-        else:
-            vx, vy = streamline[-1][1]
-        # move head
-        HEADS[sl] += math.sqrt(vx*vx + vy*vy)
-    if reset_heads:
-        # all streamlines have reached the end, so reset to start
-        for index, _ in enumerate(HEADS):
-            HEADS[index] = 0
-
-### fill and redraw bitmap is 11.4ms on Pyportal, blit is 2.6ms
-def update_display():
-    '''Update the matrix display.'''
-    display.auto_refresh = False
-    bitmap.blit(0, 0, solids_bitmap)
-    show_streamlines()
-    display.auto_refresh = True
-
 #==========
 # MAIN
 #==========
 print('Computing streamlines...', end='')
 compute_streamlines()
 print('DONE')
-HEADS = [0]*len(STREAMLINES)
+### Only the pixels which change are drawn after the solids
+bitmap.blit(0, 0, solids_bitmap)
+engine = FrameEngine(bitmap, solids_bitmap, STREAMLINES, TAIL_LENGTH)
+pacer = FramePacer(TARGET_FPS)
 print('Flowing...')
 while True:
-    animate_streamlines()
-    update_display()
-    time.sleep(DELAY)
+    engine.advance()
+    display.auto_refresh = False
+    engine.draw()
+    display.auto_refresh = True
+    pacer.wait()
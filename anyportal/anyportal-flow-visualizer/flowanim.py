@@ -0,0 +1,169 @@
+### flowanim v1.1
+### Incremental drawing of particles moving along streamlines
+
+### copy this file to MatrixPortal or PyPortal board with flow.py or flow_viewer.py
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Rather than clearing the bitmap and drawing every tail on every frame
+### only the points which join or leave a tail or become or stop being
+### a head are changed, the work per frame depends on the number of
+### particles and how far they move rather than the size of the display
+###
+### A count of heads and tails on each pixel is kept so that where
+### streamlines cross a pixel only returns to the background colour
+### when no tail uses it
+
+import time
+from array import array
+
+
+OFFSCREEN = 0xffff
+
+
+class FrameEngine:
+    """Animate a particle with a tail along each streamline on bitmap.
+       streamlines are lists of ((x, y), (vx, vy)) from compute_streamlines,
+       background is a Bitmap of the same size with the static pixels.
+    """
+
+    def __init__(self, bitmap, background, streamlines, tail_length, *,
+                 head_colour=2, tail_colour=3):
+        self._bitmap = bitmap
+        self._background = background
+        self._width = bitmap.width
+        self._height = bitmap.height
+        self._tail_length = tail_length
+        self._head_colour = head_colour
+        self._tail_colour = tail_colour
+        ### 16 bit as many streamlines can converge on a pixel
+        self._tails = array("H", [0]) * (self._width * self._height)
+        self._heads = array("H", [0]) * (self._width * self._height)
+
+        ### x, y pairs with OFFSCREEN for x if the point is not drawable
+        self._coords = []
+        self._speeds = []
+        for streamline in streamlines:
+            coords = array("H", [OFFSCREEN]) * (2 * len(streamline))
+            speeds = array("f", [0.0]) * len(streamline)
+            for idx, ((x, y), (vx, vy)) in enumerate(streamline):
+                x = round(x)
+                y = round(y)
+                if 0 <= x < self._width and 0 <= y < self._height:
+                    coords[2 * idx] = x
+                    coords[2 * idx + 1] = y
+                speeds[idx] = (vx * vx + vy * vy) ** 0.5
+            self._coords.append(coords)
+            self._speeds.append(speeds)
+
+        count = len(streamlines)
+        self._positions = [0.0] * count
+        ### visible range of points as [lo, hi) with the head at hi - 1
+        self._lo = [0] * count
+        self._hi = [0] * count
+
+    def _refresh(self, offset, x, y):
+        if self._heads[offset]:
+            self._bitmap[x, y] = self._head_colour
+        elif self._tails[offset]:
+            self._bitmap[x, y] = self._tail_colour
+        else:
+            self._bitmap[x, y] = self._background[x, y]
+
+    def _change(self, coords, idx, counts, delta):
+        x = coords[2 * idx]
+        if x == OFFSCREEN:
+            return 0
+        y = coords[2 * idx + 1]
+        offset = y * self._width + x
+        counts[offset] += delta
+        self._refresh(offset, x, y)
+        return 1
+
+    def advance(self):
+        """Move the particles along at the speed of the flow, they all
+           start again when every one has reached the end of its streamline."""
+        restart = True
+        positions = self._positions
+        for sl, speeds in enumerate(self._speeds):
+            index = round(positions[sl])
+            if index < len(speeds):
+                restart = False
+            else:
+                index = len(speeds) - 1
+            positions[sl] += speeds[index]
+        if restart:
+            for sl in range(len(positions)):
+                positions[sl] = 0.0
+
+    def draw(self):
+        """Update the pixels for the particles returning the number changed."""
+        changed = 0
+        tails = self._tails
+        heads = self._heads
+        for sl, coords in enumerate(self._coords):
+            length = len(coords) // 2
+            index = round(self._positions[sl])
+            new_hi = min(index, length)
+            new_lo = max(0, index - self._tail_length)
+            new_lo = min(new_lo, new_hi)
+            old_lo = self._lo[sl]
+            old_hi = self._hi[sl]
+            if new_lo == old_lo and new_hi == old_hi:
+                continue
+
+            if old_hi > old_lo:
+                changed += self._change(coords, old_hi - 1, heads, -1)
+            ### points leaving the tail from either end
+            for idx in range(old_lo, min(old_hi, new_lo)):
+                changed += self._change(coords, idx, tails, -1)
+            for idx in range(max(old_lo, new_hi), old_hi):
+                changed += self._change(coords, idx, tails, -1)
+            ### points joining the tail at either end
+            for idx in range(new_lo, min(new_hi, old_lo)):
+                changed += self._change(coords, idx, tails, 1)
+            for idx in range(max(new_lo, old_hi), new_hi):
+                changed += self._change(coords, idx, tails, 1)
+            if new_hi > new_lo:
+                changed += self._change(coords, new_hi - 1, heads, 1)
+
+            self._lo[sl] = new_lo
+            self._hi[sl] = new_hi
+        return changed
+
+
+class FramePacer:
+    """Sleep to keep to a target frame rate, if a frame overruns
+       the schedule restarts rather than trying to catch up."""
+
+    def __init__(self, fps):
+        self._frame_ns = round(1_000_000_000 / fps)
+        self._next_ns = time.monotonic_ns() + self._frame_ns
+
+    def wait(self):
+        now_ns = time.monotonic_ns()
+        if now_ns < self._next_ns:
+            time.sleep((self._next_ns - now_ns) / 1_000_000_000)
+            self._next_ns += self._frame_ns
+        else:
+            self._next_ns = now_ns + self._frame_ns
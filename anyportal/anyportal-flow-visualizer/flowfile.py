@@ -0,0 +1,145 @@
+### flowfile v1.0
+### Compact binary file format for flow solutions from flow_runner
+
+### copy this file to MatrixPortal or PyPortal board with flow_viewer.py
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### The file is a header, a bitmask of the solid cells with each row
+### padded to a whole byte and the most significant bit on the left,
+### then the VX and VY planes as little-endian signed integers
+### which are multiplied by the scale in the header
+###
+### Cells are stored as 8 or 16 bit integers rather than float16
+### as neither struct nor ulab in CircuitPython have float16
+
+import struct
+from array import array
+
+
+MAGIC = b"FLOW"
+VERSION = 1
+HEADER_FMT = "<4sBBHHff"  ### magic, version, bytes per value, width, height, scales
+HEADER_LEN = struct.calcsize(HEADER_FMT)
+TYPECODES = {1: "b", 2: "h"}
+ROW_BLOCK = 8  ### rows read at a time
+
+
+class FlowField:
+    """Velocity field with solid cells stored in arrays, the values are
+       quantised integers with a scale or floats with a scale of 1.0."""
+
+    def __init__(self, width, height, vx, vy, vx_scale, vy_scale, mask):
+        self.width = width
+        self.height = height
+        self._vx = vx
+        self._vy = vy
+        self._vx_scale = vx_scale
+        self._vy_scale = vy_scale
+        self._mask = mask
+        self._row_bytes = (width + 7) // 8
+
+    @classmethod
+    def from_lists(cls, VX, VY):
+        """Make from the nested lists of flow_solution.py with None for solids."""
+        height = len(VX)
+        width = len(VX[0])
+        row_bytes = (width + 7) // 8
+        mask = bytearray(row_bytes * height)
+        vx = array("f", [0.0]) * (width * height)
+        vy = array("f", [0.0]) * (width * height)
+        for y in range(height):
+            for x in range(width):
+                if VX[y][x] is None or VY[y][x] is None:
+                    mask[y * row_bytes + (x >> 3)] |= 0x80 >> (x & 7)
+                else:
+                    vx[y * width + x] = VX[y][x]
+                    vy[y * width + x] = VY[y][x]
+        return cls(width, height, vx, vy, 1.0, 1.0, mask)
+
+    def solid(self, x, y):
+        return bool(self._mask[y * self._row_bytes + (x >> 3)] & (0x80 >> (x & 7)))
+
+    def velocity(self, x, y):
+        """The velocity at the cell as (vx, vy) or (None, None) for a solid."""
+        if self.solid(x, y):
+            return None, None
+        idx = y * self.width + x
+        return self._vx[idx] * self._vx_scale, self._vy[idx] * self._vy_scale
+
+
+def _read_plane(fp, width, height, value_bytes):
+    plane = array(TYPECODES[value_bytes], [0]) * (width * height)
+    view = memoryview(plane)
+    for row in range(0, height, ROW_BLOCK):
+        end = min(row + ROW_BLOCK, height)
+        block = view[row * width:end * width]
+        if fp.readinto(block) != len(block) * value_bytes:
+            raise ValueError("Truncated flow file")
+    return plane
+
+
+def read_solution(filename):
+    """Read a FlowField from a binary flow file."""
+    with open(filename, "rb") as fp:
+        header = fp.read(HEADER_LEN)
+        if len(header) != HEADER_LEN:
+            raise ValueError("Truncated flow file")
+        (magic, version, value_bytes,
+         width, height, vx_scale, vy_scale) = struct.unpack(HEADER_FMT, header)
+        if magic != MAGIC or version != VERSION or value_bytes not in TYPECODES:
+            raise ValueError("Not a version {:d} flow file".format(VERSION))
+        mask = bytearray((width + 7) // 8 * height)
+        if fp.readinto(mask) != len(mask):
+            raise ValueError("Truncated flow file")
+        vx = _read_plane(fp, width, height, value_bytes)
+        vy = _read_plane(fp, width, height, value_bytes)
+    return FlowField(width, height, vx, vy, vx_scale, vy_scale, mask)
+
+
+def write_solution(filename, VX, VY, value_bytes=1):
+    """Write the VX and VY arrays with NaN for solids as a binary flow file,
+       this is for a desktop as it needs NumPy."""
+    import numpy as np
+
+    vx = np.asarray(VX, dtype=np.float64)
+    vy = np.asarray(VY, dtype=np.float64)
+    solid = np.isnan(vx) | np.isnan(vy)
+    height, width = vx.shape
+    max_int = (1 << (8 * value_bytes - 1)) - 1
+    dtype = "<i" + str(value_bytes)
+
+    planes = []
+    scales = []
+    for plane in (vx, vy):
+        peak = np.max(np.abs(plane[~solid])) if np.any(~solid) else 0.0
+        scale = float(peak) / max_int if peak > 0.0 else 1.0
+        planes.append(np.where(solid, 0.0, np.round(plane / scale)).astype(dtype))
+        scales.append(scale)
+
+    with open(filename, "wb") as fp:
+        fp.write(struct.pack(HEADER_FMT, MAGIC, VERSION, value_bytes,
+                             width, height, scales[0], scales[1]))
+        fp.write(np.packbits(solid, axis=1).tobytes())
+        for plane in planes:
+            fp.write(plane.tobytes())
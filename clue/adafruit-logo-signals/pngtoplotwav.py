@@ -3,9 +3,9 @@
 
 import getopt
 import sys
-import array
-import struct
+import multiprocessing
 
+import numpy as np
 import imageio
 import wave
 
@@ -16,6 +16,7 @@ movie_file = False
 output = "twochanplot.wav"
 fps = 1
 threshold = 128
+jobs = 1
 
 max_dac_v = 3.3
 ### 16 bit wav files always use signed representation for data
@@ -27,18 +28,93 @@ bottomvalue  = round(0.00 / max_dac_v * 65535) - 32768
 
 
 def usage(exit_code):
-    print("pngtowav: [-f fps] [-h] [-m] [-o outputfilename] [-v]",
+    print("pngtowav: [-f fps] [-h] [-j jobs] [-m] [-o outputfilename] [-v]",
           file=sys.stderr)
     if exit_code is not None:
         sys.exit(exit_code)
 
+
+def image_samples(img):
+    """Return the two channel samples for an image as an (columns, 2) array.
+       Each column is the first index of img and is scanned along the
+       second index for the top and bottom lit pixels, this is the
+       orientation the spinning logo wav file was made with."""
+    if img.ndim == 3:
+        img = img[:, :, :3].mean(axis=2)  ### colour frames from gifs
+    lit = img > threshold
+    columns, col_len = lit.shape
+    found = lit.any(axis=1)
+    top = np.where(found, np.argmax(lit, axis=1), col_len // 2)
+    bottom = np.where(found,
+                      col_len - 1 - np.argmax(lit[:, ::-1], axis=1),
+                      col_len // 2)
+    screenyrange = topvalue - bottomvalue
+    samples = np.empty((columns, 2), dtype="<i2")
+    samples[:, 0] = np.round(topvalue - bottom / (col_len - 1) * screenyrange)
+    samples[:, 1] = np.round(topvalue - top / (col_len - 1) * screenyrange)
+    if verbose:
+        print("W,H", columns, col_len)
+        print("Lit columns", np.count_nonzero(found))
+    return samples
+
+
+def read_images(filename):
+    """Yield each frame of a video (animated gif) or the single image."""
+    if movie_file:
+        with imageio.get_reader(filename) as reader:
+            for img in reader:
+                yield np.asarray(img)
+    else:
+        yield np.asarray(imageio.imread(filename))
+
+
+def set_options(movie, thresh, verb):
+    """Pool initializer to copy the command line options to workers."""
+    global movie_file, threshold, verbose
+    movie_file = movie
+    threshold = thresh
+    verbose = verb
+
+
+def file_samples(filename):
+    """All the samples for one file as a list of arrays, this is
+       used by worker processes."""
+    return [image_samples(img) for img in read_images(filename)]
+
+
+class PlotWavWriter:
+    """Write frames to the wav file as they are produced, the
+       sample rate is set from the width of the first frame."""
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._wav_file = None
+        self.nframes = 0
+
+    def write(self, samples):
+        if self._wav_file is None:
+            framerate = round(len(samples) * fps)
+            if verbose: print("Writing wav file", self._filename,
+                              "with 2 channel(s) at rate", framerate)
+            self._wav_file = wave.open(self._filename, "w")
+            self._wav_file.setparams((2, 2, framerate, 0,
+                                      "NONE", "not compressed"))
+        self._wav_file.writeframes(samples.tobytes())
+        self.nframes += len(samples)
+
+    def close(self):
+        if self._wav_file is not None:
+            self._wav_file.close()
+            if verbose: print("Wrote", self.nframes, "samples")
+
+
 def main(cmdlineargs):
-    global debug, fps, movie_file, output
+    global debug, fps, jobs, movie_file, output
     global threshold, verbose
 
     try:
         opts, args = getopt.getopt(cmdlineargs,
-                                   "f:hmo:rs:v", ["help", "output="])
+                                   "f:hj:mo:rs:v", ["help", "output="])
     except getopt.GetoptError as err:
         print(err,
               file=sys.stderr)
@@ -48,6 +124,8 @@ def main(cmdlineargs):
             fps = float(arg)
         elif opt in ("-h", "--help"):
             usage(0)
+        elif opt == "-j":
+            jobs = int(arg)
         elif opt == "-m":
              movie_file = True
         elif opt in ("-o", "--output"):
@@ -59,64 +137,27 @@ def main(cmdlineargs):
                   file=sys.stderr)
             sys.exit(2)
 
-    raw_output = array.array("h", [])
-    raw_output = array.array("h", [])
-
     ### Reach each frame, either
     ### many single image filenames in args or
     ### one or more video (animated gifs) (needs -m on command line)
-    screenyrange = topvalue - bottomvalue
-    for arg in args:
-        if verbose: print("PROCESSING", arg)
-        if movie_file:
-            images = imageio.mimread(arg)
+    ### and write them to the wav file as they are converted
+    writer = PlotWavWriter(output)
+    try:
+        if jobs > 1:
+            ### Files are converted in parallel but written in order
+            with multiprocessing.Pool(jobs, initializer=set_options,
+                                      initargs=(movie_file, threshold, verbose)) as pool:
+                for arg, frames in zip(args, pool.imap(file_samples, args)):
+                    if verbose: print("PROCESSED", arg)
+                    for samples in frames:
+                        writer.write(samples)
         else:
-            images = [imageio.imread(arg)]
-
-        for img in images:
-            img_height, img_width = img.shape
-            x_nopixels = img_height // 2
-            if verbose: print("W,H", img_width, img_height)
-            for x_col in range(img_width):
-                top = None
-                bottom = None
-                for y_t in range(img_height):
-                    if img[x_col, y_t] > threshold:
-                        top = y_t
-                        break
-                if top is not None:
-                    for y_b in range(img_height - 1, y_t - 1, -1):
-                        if img[x_col, y_b] > threshold:
-                            bottom = y_b
-                            break
-                ### If not found then use the default value
-                if top is None and bottom is None:
-                    top = x_nopixels
-                    bottom = x_nopixels
-                if verbose: print("Adding top/bottom at pixels: ", top, bottom)
-                ch1_val = round(topvalue - bottom / (img_height - 1) * screenyrange)
-                ch2_val = round(topvalue - top / (img_height - 1) * screenyrange)
-                if verbose: print("Channel values: ", ch1_val, ch2_val)
-                raw_output.append(ch1_val)
-                raw_output.append(ch2_val)
-
-    ### Write wav file
-    wav_filename = output
-    wav_file = wave.open(wav_filename, "w")
-    nchannels = 2
-    sampwidth = 2
-    framerate = round(img_width * fps)
-    nframes = len(raw_output)
-    comptype = "NONE"
-    compname = "not compressed"
-    if verbose: print("Writing wav file", wav_filename,
-                      "with", nchannels,
-                      "channel(s) at rate", framerate,
-                      "with", nframes, "samples")
-    wav_file.setparams((nchannels, sampwidth, framerate, nframes,
-                       comptype, compname))
-    wav_file.writeframes(raw_output)
-    wav_file.close()
+            for arg in args:
+                if verbose: print("PROCESSING", arg)
+                for img in read_images(arg):
+                    writer.write(image_samples(img))
+    finally:
+        writer.close()
 
 
 if __name__ == "__main__":
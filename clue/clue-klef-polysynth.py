@@ -1,4 +1,4 @@
-### clue-klef-polysynth v0.3
+### clue-klef-polysynth v0.4
 ### Polyphonic synth for Kitronik KLEF with Adafruit CLUE
 
 ### Tested with an Adafruit CLUE (Alpha) and CircuitPython and 5.3.0
@@ -37,6 +37,11 @@ import displayio
 import math
 import array
 
+try:
+    import countio
+except ImportError:
+    countio = None
+
 from adafruit_bus_device.i2c_device import I2CDevice
 from adafruit_display_text.label import Label
 
@@ -56,6 +61,9 @@ def triangle(angle):
 
 debug = 3
 
+### Times the envelope service loop with increasing numbers of keys held
+BENCHMARK = False
+
 display = board.DISPLAY
 DISPLAY_WIDTH = display.width
 DISPLAY_HEIGHT = display.height
@@ -181,6 +189,8 @@ class KitronikPiano:
         pin1 = digitalio.DigitalInOut(data_ready_pin)
         pin1.pull = digitalio.Pull.UP
         self.pin_datanotready = pin1
+        self._data_ready_pin = data_ready_pin
+        self._change_counter = None
         self.last_key_press = 0
         self.initialised = False
         
@@ -263,8 +273,29 @@ class KitronikPiano:
                 device.readinto(buff3)
                 
         self.initialised = True
+        self._watch_change_pin()
         
         
+    def _watch_change_pin(self):
+        """Use an interrupt driven counter on the /change pin if the board
+           supports it so keys are only read over I2C after the chip
+           signals a change rather than polling the pin level."""
+        if countio is None:
+            return
+        try:
+            self.pin_datanotready.deinit()
+            self._change_counter = countio.Counter(self._data_ready_pin,
+                                                   edge=countio.Edge.FALL,
+                                                   pull=digitalio.Pull.UP)
+        except (AttributeError, TypeError, ValueError):
+            ### Older CircuitPython without edge/pull selection
+            self._change_counter = None
+            self.pin_datanotready = digitalio.DigitalInOut(self._data_ready_pin)
+            self.pin_datanotready.pull = digitalio.Pull.UP
+            return
+        ### A change could have happened before the counter started
+        self.last_key_press = self._readKeyPress()
+
     #Set sensitivity of capacitive touch keys, then initialise the IC.
     #A higher value increases the sensitivity (values can be in the range 1 - 32).
     def setKeySensitivity(self, sensitivity):
@@ -313,7 +344,11 @@ class KitronikPiano:
         return keyPressed
 
     def bufferedKeyPress(self):
-        if self.pin_datanotready.value:
+        if self._change_counter is not None:
+            if self._change_counter.count == 0:
+                return self.last_key_press
+            self._change_counter.reset()
+        elif self.pin_datanotready.value:
             return self.last_key_press
         self.last_key_press = self._readKeyPress()
         return self.last_key_press
@@ -393,7 +428,92 @@ KEYS = [piano.PianoKeys.KEY_K9,
         piano.PianoKeys.KEY_K7]
 
 
-def processKeys(mxr, notes, ADSR_voices, old_mask, new_mask):
+### Envelope times in seconds, these approximate the old fixed steps per loop
+ATTACK_TIME = 0.080
+RELEASE_TIME = 0.600
+SUSTAIN_LEVEL = 0.8
+
+PHASE_IDLE = 0
+PHASE_ATTACK = 1
+PHASE_SUSTAIN = 2
+PHASE_RELEASE = 3
+
+
+class EnvelopeScheduler:
+    """Attack, sustain, release envelopes for mixer voices with levels
+       calculated from the time since each phase started so the
+       envelope is independent of the loop speed and I2C delays.
+       Only voices which are ramping are in the active list,
+       sustained and idle voices cost nothing per service() call.
+    """
+
+    def __init__(self, mxr, notes, attack=ATTACK_TIME,
+                 release=RELEASE_TIME, sustain=SUSTAIN_LEVEL):
+        self._mixer = mxr
+        self._notes = notes
+        self._attack_ns = round(attack * 1e9)
+        self._release_ns = round(release * 1e9)
+        self._sustain = sustain
+        voices = len(mxr.voice)
+        self._phase = bytearray(voices)
+        self._start_ns = [0] * voices
+        self._start_level = [0.0] * voices
+        self._active = []
+
+    def note_on(self, idx, now_ns):
+        voice = self._mixer.voice[idx]
+        if self._phase[idx] == PHASE_IDLE:
+            voice.play(self._notes[idx - 1], loop=True)
+            self._start_level[idx] = 0.0
+        else:
+            ### Start the attack from the current level if still releasing
+            self._start_level[idx] = voice.level
+        self._set_phase(idx, PHASE_ATTACK, now_ns)
+
+    def note_off(self, idx, now_ns):
+        if self._phase[idx] in (PHASE_ATTACK, PHASE_SUSTAIN):
+            self._start_level[idx] = self._mixer.voice[idx].level
+            self._set_phase(idx, PHASE_RELEASE, now_ns)
+
+    def _set_phase(self, idx, phase, now_ns):
+        self._phase[idx] = phase
+        self._start_ns[idx] = now_ns
+        if phase in (PHASE_ATTACK, PHASE_RELEASE):
+            if idx not in self._active:
+                self._active.append(idx)
+
+    def service(self, now_ns):
+        """Update the levels of voices which are ramping."""
+        active = self._active
+        ### Iterate backwards to allow removal during the loop
+        for a_idx in range(len(active) - 1, -1, -1):
+            idx = active[a_idx]
+            elapsed = now_ns - self._start_ns[idx]
+            voice = self._mixer.voice[idx]
+            start_level = self._start_level[idx]
+            if self._phase[idx] == PHASE_ATTACK:
+                if elapsed >= self._attack_ns:
+                    voice.level = self._sustain
+                    self._phase[idx] = PHASE_SUSTAIN
+                    del active[a_idx]
+                else:
+                    voice.level = (start_level
+                                   + (self._sustain - start_level) * elapsed / self._attack_ns)
+            else:
+                if elapsed >= self._release_ns:
+                    voice.level = 0.0
+                    voice.stop()
+                    self._phase[idx] = PHASE_IDLE
+                    del active[a_idx]
+                else:
+                    voice.level = start_level * (1.0 - elapsed / self._release_ns)
+
+    @property
+    def active_count(self):
+        return len(self._active)
+
+
+def processKeys(envelopes, old_mask, new_mask, now_ns):
 
     ### xor the values
     diff_mask = old_mask ^ new_mask
@@ -402,50 +522,55 @@ def processKeys(mxr, notes, ADSR_voices, old_mask, new_mask):
     for st, key in enumerate(KEYS):
         if diff_mask & key:
             if new_mask & key:  ### note on 
-                ADSR_voices[st + 1] = "A"
+                envelopes.note_on(st + 1, now_ns)
             else:  ### note off
-                ADSR_voices[st + 1] = "R"
-
-
-def processADSR(mxr, notes, ADSR_voices):
-    """Very simple AR for ADSR with no time/level parameters..."""
-
-    ### This modified ADSR_voices too
-    for idx in range(1, len(ADSR_voices)):
-        adsr = ADSR_voices[idx]
-        level = mxr.voice[idx].level
-        if adsr == "A":
-            if level < 0.8:
-                if level == 0.0:
-                    mxr.voice[idx].play(notes[idx - 1], loop=True)
-                mxr.voice[idx].level += 0.0125
-            else:
-                ADSR_voices[idx] = "S"
-        elif adsr == "R":
-            if level > 0.0:
-                if level > 0.0015625:
-                    mxr.voice[idx].level -= 0.0015625
-                else:
-                    mxr.voice[idx].level = 0.0
-                    mxr.voice[idx].stop()
-                    ADSR_voices[idx] = ""
-
-
-ADSR = [""] * len(mixer.voice)
+                envelopes.note_off(st + 1, now_ns)
+
+
+def benchmark(envelopes, loops=500):
+    """Print the average loop time with 0 to all keys held to show the
+       cost does not increase once voices reach sustain."""
+    key_mask = 0
+    for held in range(len(KEYS) + 1):
+        new_mask = 0
+        for key in KEYS[:held]:
+            new_mask |= key
+        processKeys(envelopes, key_mask, new_mask, time.monotonic_ns())
+        key_mask = new_mask
+        ### Let the attack finish before timing
+        while envelopes.active_count:
+            envelopes.service(time.monotonic_ns())
+        t1 = time.monotonic_ns()
+        for _ in range(loops):
+            piano.bufferedKeyPress()
+            envelopes.service(time.monotonic_ns())
+        t2 = time.monotonic_ns()
+        print("BENCH", held, "keys", (t2 - t1) / loops / 1000, "us per loop")
+    processKeys(envelopes, key_mask, 0, time.monotonic_ns())
+
+
+envelopes = EnvelopeScheduler(mixer, note_samples)
+
+if BENCHMARK:
+    benchmark(envelopes)
 
 last_key_mask = 0
 while True:
     key_mask = piano.bufferedKeyPress()
     ##print("LOOP", f"{key_mask:016b}")   
 
+    now_ns = time.monotonic_ns()
     if key_mask != last_key_mask:
-        print("CHNG", f"{key_mask:016b}")
-        processKeys(mixer, note_samples, ADSR,
-                    last_key_mask, key_mask)
+        d_print(2, "CHNG", f"{key_mask:016b}")
+        processKeys(envelopes, last_key_mask, key_mask, now_ns)
         last_key_mask = key_mask
 
-    processADSR(mixer, note_samples, ADSR)
-    time.sleep(0.001)
+    if envelopes.active_count:
+        envelopes.service(now_ns)
+        time.sleep(0.001)
+    else:
+        ### Nothing to ramp so only the keys need checking
+        time.sleep(0.002)
 
 
 ### Still getting occasional - restart of program is workaround here. could also try catching it
@@ -1,4 +1,4 @@
-### cpx-basic-square-duosynth v1.2
+### cpx-basic-square-duosynth v1.3
 ### CircuitPython (on CPX) two oscillator synth module (needs some external hardware)
 ### Duophonic velocity sensitive synth with pitch bend and mod wheel
 ### and ADSR control
@@ -50,6 +50,9 @@ import neopixel
 import adafruit_midi
 ##import audioio
 
+### Copy synthfunctions.py or its mpy version to CPX too
+from synthfunctions import BlockEnvelope, BlockLFO
+
 A4refhz = 440
 midinoteC4 = 60
 midinoteA4 = 69
@@ -117,9 +120,10 @@ osc2 = pulseio.PWMOut(board.A6, duty_cycle=2**15, frequency=441, variable_freque
 ### [Oscillator PWMOut, VCA PWMOut, 
 ### midi channel number (0-15), note number,
 ### velocity (0 indicates voice not active),
-### key trigger time, key release time, volume at release]
-oscvcas.append([osc1, vca1pwm, -1, 0, 0, 0.0, 0.0, 0.0])
-oscvcas.append([osc2, vca2pwm, -1, 0, 0, 0.0, 0.0, 0.0])
+### key trigger time, key release time, volume at release,
+### envelope rendered in blocks]
+oscvcas.append([osc1, vca1pwm, -1, 0, 0, 0.0, 0.0, 0.0, BlockEnvelope()])
+oscvcas.append([osc2, vca2pwm, -1, 0, 0, 0.0, 0.0, 0.0, BlockEnvelope()])
 
 ### Not in use
 #dac = analogio.AnalogOut(board.A0)
@@ -189,64 +193,6 @@ def assignvoice(oscvcas, nextoscvca):
 ### The next oscillator / vca to use to 
 nextoscvca = 0
 
-### Returns volume as a float based on simple ADSR envelope
-### this will be <= velocity and 0.0 if at end of envelope
-### release_t should be 0.0 until key is released
-### attack is seconds
-### decay is seconds
-### sustain is fraction of velocity, e.g. 0.6 is 60%
-### release is seconds
-### vol_release is the volume when key was released
-def ADSR(velocity, trigger_t, release_t, current_t,
-         attack, decay, sustain, release,
-         vol_release):
-    vol = velocity
-    rel_t = current_t - trigger_t
-
-    if release_t == 0.0:
-        if (rel_t < attack):
-            ### Attack phase
-            vol_attack = vol * rel_t / attack
-            ### bit of a fudge to stop attack starting at 0.0 as this return
-            ### value is used to signify end of envelope
-            if vol_attack > 1.0:
-                return vol_attack
-            else:
-                return 1.0
-
-        ### Decay/Sustain phase
-        if decay != 0.0 and sustain != 1.0:
-            sus_t = rel_t - attack
-            ### Calculate a new vol level
-            if sus_t < decay:
-                vol = vol - sus_t / decay * (1.0 - sustain) * vol
-            else:
-                vol = vol * sustain
-        
-        return vol
-    else:
-        ### Release phase
-        if release == 0.0:
-            return 0.0  ### no release and need to prevent div by zero
-        vol = vol_release - vol_release * ((current_t - release_t) / release)
-        if vol > 0.0:
-            return vol
-        else:
-            return 0.0   ### end of release/note
-
-
-### Return an LFO value between 0.0 and 1.0
-def LFO(start_t, now_t, rate, shape):
-    ### phase will be 0.0 at start to 1.0 at end
-    wavelengths = (now_t - start_t) * rate
-    phase = wavelengths - int(wavelengths)
-    if shape == "triangle":
-        value = 1.0 - 2 * abs(0.5 - phase)
-    else:
-        raise ValueError("Unsupported LFO wave shape")
-
-    return value            
-
 ### Initial ADSR values
 attack  = 0.050
 release = 0.500
@@ -266,6 +212,7 @@ lfovalue = 0.0  ### Initial value
 lforate = 1     ### Initial rate in Hz
 lfostart_t = time.monotonic()
 lfoshape = "triangle"
+lfo = BlockLFO(lfostart_t, lforate, lfoshape)
 
 print("Ready to play")
 
@@ -298,6 +245,9 @@ while True:
         oscvcas[oscvcatouse][5] = time.monotonic()
         oscvcas[oscvcatouse][6] = 0.0
         oscvcas[oscvcatouse][7] = 0.0
+        ### Envelope parameters are fixed at note trigger
+        oscvcas[oscvcatouse][8].trigger(oscvcas[oscvcatouse][5], msg.velocity,
+                                        attack, decay, sustain, release)
         
         noteled(pixels, msg.note, msg.velocity)
 
@@ -313,11 +263,9 @@ while True:
                 ### Insert calculated volume and then
                 ### insert release time               
                 now_t = time.monotonic()
-                voice[7] = ADSR(voice[4],
-                                voice[5], voice[6], now_t,
-                                attack, decay, sustain, release,
-                                voice[7])
+                voice[7] = voice[8].value(now_t)
                 voice[6] = now_t
+                voice[8].release(now_t)
                 
         noteled(pixels, msg.note, 0)
         
@@ -348,9 +296,9 @@ while True:
         elif msg.control == 84:  # what is this? using for sustain level
             sustain = maxsustain * msg.value / 127
         elif msg.control == 91:  # LFO rate
-            ### Changing this while playing a note often sounds unpleasant
-            ### phase matching for old and new rates would solve this
+            ### BlockLFO keeps the phase continuous when the rate changes
             lforate = lfomin * math.pow(2, lfopow2range * msg.value / 127)
+            lfo.set_rate(time.monotonic(), lforate)
         elif msg.control == 93:  # LFO depth
             pass  ### TODO
 
@@ -360,13 +308,10 @@ while True:
 
     ### Create envelopes for any active voices
     now_t = time.monotonic()
-    lfovalue = LFO(lfostart_t, now_t, lforate, lfoshape)
+    lfovalue = lfo.value(now_t)
     for voiceidx, voice in enumerate(oscvcas):
         if voice[4] > 0:   ### velocity is used as indicator for active voice
-            ADSRvol = ADSR(voice[4],
-                           voice[5], voice[6], now_t,
-                           attack, decay, sustain, release,
-                           voice[7])
+            ADSRvol = voice[8].value(now_t)
             envampl = round(math.pow(ADSRvol, velcurve) * veltovolc040)
             ### TODO BUG - somewhere as this breached 0 - 65535 during S/B
             voice[1].duty_cycle = envampl
@@ -1,4 +1,4 @@
-### cpx-basic-square-monosynth v1.4
+### cpx-basic-square-monosynth v1.5
 ### CircuitPython (on CPX) synth module using internal speaker
 ### Monophonic synth with some velocity sensitivity and a few
 ### different waveforms
@@ -53,6 +53,9 @@ from adafruit_midi.control_change   import ControlChange
 from adafruit_midi.pitch_bend       import PitchBend
 from adafruit_midi.program_change   import ProgramChange
 
+### Copy synthfunctions.py or its mpy version to CPX too
+from synthfunctions import make_waveforms, WavetableBank
+
 ### TODO - deal with max sample playback rate of 350000
 
 ### TODO - add control over this
@@ -123,102 +126,11 @@ def flashpatch(pixels, patchnum):
 ### Discussions in this area
 ### https://forums.adafruit.com/viewtopic.php?f=60&t=148191
 
-### All just intonation
-### TODO - consider putting in some 32768 values on square and sawtooths
-###        to make them finish on midpoint and remove any under
-###        the covers slewing 
-### TODO - check frequencies are correct on the cyclelength ones
-def makewaves(waves, type, samplerate):
-    cyclelength = round(samplerate // A4refhz)
-    length = cyclelength  ### a default which some waves will change
-
-    #cycles = 1
-    #cycles = 3    ### for perfect fifth
-    #cycles = 4    ### for major chord
-
-    ### TODO consider volume modification for internal speaker
-    ### vs non speaker use
-
-    ### major chord has longer sample which initially works
-    ### but will blow up later with four levels
-    if type == "majorchord":
-        volumes = [23000]   ### 32000 would go out of bounds
-    else:
-        volumes = [30000]  # running too tight on memory for multiple values at 96 samples TODO review this
-
-    ### Make some waves at different volumes
-    for vol in volumes:
-        ### Need to create a new array here as audio.RawSample appears not
-        if type == "square":
-            waveraw = array.array("h", [-vol] * (length // 2) + [vol] * (length - length // 2))
-        else:
-            if type == "sawtooth":
-                waveraw = array.array("h", [0] * length)
-                for i in range(length):
-                    waveraw[i] = round((i / (length - 1) - 0.5) * 2 * vol)
-            elif type == "supersaw":
-                waveraw = array.array("h", [0] * length)
-                halflength    = length // 2
-                quarterlength = length // 4
-                for i in range(length):
-                    ### TODO replace this with a gen function similar to sine
-                    waveraw[i] = round(((i / (length - 1) - 0.5 +
-                                         i % halflength / (halflength - 1) - 0.5 +
-                                         i % quarterlength / (quarterlength - 1) - 0.5)
-                                       ) * 2 / 3 * vol)
-            elif type == "supersupersaw":
-                cycles = 2
-                length = cycles * cyclelength
-                waveraw = array.array("h", [0] * length)
-                ### TODO add two 5ths
-                twothirdsclen = 2 * cyclelength // 3
-                halfclen    = cyclelength // 2
-                thirdclen   = cyclelength // 3
-                quarterclen = cyclelength // 4
-                sixthclen   = cyclelength // 6
-                eighthlen   = cyclelength // 8
-                for i in range(length):
-                    ### TODO replace this with a gen function similar to sine
-                    waveraw[i] = round((
-                                        2/8 * (i                 / (cyclelength - 1) - 0.5) +
-                                        1/8 * (i % twothirdsclen / (twothirdsclen - 1) - 0.5) +
-                                        1/8 * (i % halfclen      / (halfclen - 1) - 0.5) +
-                                        1/8 * (i % thirdclen     / (thirdclen - 1) - 0.5) +
-                                        1/8 * (i % quarterclen   / (quarterclen - 1) - 0.5) + 
-                                        1/8 * (i % sixthclen     / (sixthclen - 1) - 0.5) +
-                                        1/8 * (i % eighthlen     / (eighthlen - 1) - 0.5)
-                                       ) * 2 * vol)
-            elif type == "sine":
-                waveraw = array.array("h", [0] * length)
-                for i in range(length):
-                    waveraw[i] = round(math.sin(math.pi * 2 * i / length) * vol)
-            elif type == "sineoct2":
-                waveraw = array.array("h", [0] * length)
-                for i in range(length):
-                    waveraw[i] = round((math.sin(math.pi * 2 * i / length) * 2/3 +
-                                        math.sin(math.pi * 2 * i / length * 2) * 1/3
-                                       ) * vol)
-            elif type == "sinefifth":
-                cycles = 2
-                length = cycles * cyclelength
-                waveraw = array.array("h", [0] * length)
-                for i in range(length):
-                    waveraw[i] = round((math.sin(math.pi * 2 * i / cyclelength) +
-                                        math.sin(math.pi * 2 * i / cyclelength * 3/2)
-                                       ) * vol / 2)
-            # elif type == "sinemajorchord":
-                # cycles = 4
-                # length = cycles * cyclelength
-                # waveraw = array.array("h", [0] * length)
-                # for i in range(length):
-                    # waveraw[i] = round((math.sin(math.pi * 2 * i / cyclelength) +
-                                        # math.sin(math.pi * 2 * i / cyclelength * 5/4) +
-                                        # math.sin(math.pi * 2 * i / cyclelength * 6/4)
-                                       # ) * vol / 2.5)
-            else:
-                raise ValueError("Unknown type")
-
-        waves.append(audioio.RawSample(waveraw))
+### The waves come from the shared wavetable bank in synthfunctions which
+### saves them to flash so changing waveform is quick after the first time,
+### only two are kept in memory as it is very tight with 96 sample waves
+wavebank = WavetableBank(max_tables=2)
+wavevolumes = [30000]  # running too tight on memory for multiple values at 96 samples TODO review this
 
 ### 0 is MIDI channel 1
 midi = adafruit_midi.MIDI(midi_in=usb_midi.ports[0], in_channel=0)
@@ -240,7 +152,7 @@ lastnote = None
 modwheel = 0
 
 waves = []
-makewaves(waves, wavename, basesamplerate)
+make_waveforms(waves, wavename, basesamplerate, wavevolumes, wavebank)
 
 while True:
     msg = midi.receive()
@@ -310,4 +222,4 @@ while True:
                 print("changing from", wavename, "to", newwave)
                 wavename = newwave
                 waves.clear()
-                makewaves(waves, wavename, basesamplerate)
+                make_waveforms(waves, wavename, basesamplerate, wavevolumes, wavebank)
@@ -1,4 +1,4 @@
-### cpx-ir-shutter-remote v1.9
+### cpx-ir-shutter-remote v1.12
 ### Circuit Playground Express (CPX) shutter remote using infrared for Sony Cameras
 
 ### copy this file to CPX as code.py
@@ -38,8 +38,20 @@
 ### The default interval is thirty seconds and this can be changed
 ### by reduced with the left button and increased with the right button
 
+### Spoken intervals are joined into one wav file per phrase in num/phrase
+### the first time they are used so they play without gaps between words,
+### this needs CIRCUITPY to be writeable by CircuitPython
+### otherwise the words are played in turn with the next file
+### opened while the current one plays, a boot.py on the CPX can call
+### storage.remount("/", readonly=False) when the left button
+### (board.BUTTON_A) is held during a reset, the slide switch
+### is not used for this as it selects the mode, see
+### https://learn.adafruit.com/circuitpython-essentials/circuitpython-storage
 
+
+import os
 import time
+import struct
 
 import board
 import digitalio
@@ -55,6 +67,9 @@ import adafruit_irremote
 
 
 WAV_DIR = "num"
+PHRASE_DIR = WAV_DIR + "/phrase"
+WORD_GAP_S = 0.050
+COMMA_GAP_S = 0.150
 SHUTTER_CMD_COLOUR = 0x080000
 IMPENDING_COLOUR = 0x070400
 BLACK = 0x000000
@@ -101,23 +116,181 @@ def fire_shutter():
                         repeat=2, delay=0.005, nbits=20)
 
 
-def say_interval(number_as_words):
-    words = number_as_words.split() + ["seconds"]
-    for word in words:
-        if word == ",":
-            time.sleep(0.15)
-        else:
-            play_file(WAV_DIR + "/" + word + ".wav")
-        time.sleep(0.050)
-
-
-def play_file(filename):
-    speaker_enable.value = True
-    with WaveFile(open(filename, "rb")) as wavefile:
-        audio_out.play(wavefile)
-        while audio_out.playing:
-            pass
-    speaker_enable.value = False
+def wav_format(fh):
+    """Read the header of a wav file leaving fh at the start of the sample data,
+       returns the fmt chunk values and the length of the data in bytes."""
+    header = fh.read(12)
+    if len(header) != 12 or header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Not a wav file")
+    fmt = None
+    while True:
+        chunk = fh.read(8)
+        if len(chunk) != 8:
+            raise ValueError("No data in wav file")
+        ck_id, ck_len = struct.unpack("<4sI", chunk)
+        if ck_id == b"data":
+            if fmt is None:
+                raise ValueError("No fmt in wav file")
+            return fmt, ck_len
+        if ck_id == b"fmt ":
+            ### format, channels, rate, byte rate, block align, bits
+            fmt = struct.unpack("<HHIIHH", fh.read(16))
+            ck_len -= 16
+        fh.seek(fh.tell() + ck_len + (ck_len & 1))
+
+
+def build_phrase(words, filename, buf):
+    """Join the wav files for words into one file with short
+       silences between them and longer ones for commas.
+       The file is written to a temporary name and renamed when complete
+       so an interrupted build is never used, returns False if there
+       are no words."""
+    if all(word == "," for word in words):
+        return False
+    fmt = None
+    data_len = 0
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as out:
+        out.write(bytes(44))  ### header is written at the end
+        for word in words:
+            if word != ",":
+                with open(WAV_DIR + "/" + word + ".wav", "rb") as fh:
+                    word_fmt, remaining = wav_format(fh)
+                    if fmt is None:
+                        fmt = word_fmt
+                        silence = bytes((0x80 if fmt[5] == 8 else 0,)) * 256
+                    elif word_fmt != fmt:
+                        raise ValueError("Different format for " + word)
+                    mv = memoryview(buf)
+                    while remaining > 0:
+                        count = fh.readinto(mv[:min(remaining, len(buf))])
+                        if not count:
+                            break
+                        out.write(mv[:count])
+                        remaining -= count
+                        data_len += count
+            if fmt is None:
+                continue
+            gap_s = COMMA_GAP_S if word == "," else WORD_GAP_S
+            gap_len = round(gap_s * fmt[2]) * fmt[4]
+            while gap_len > 0:
+                count = min(gap_len, len(silence))
+                out.write(silence[:count])
+                gap_len -= count
+                data_len += count
+        out.seek(0)
+        out.write(struct.pack("<4sI4s4sIHHIIHH4sI",
+                              b"RIFF", 36 + data_len, b"WAVE",
+                              b"fmt ", 16, *fmt,
+                              b"data", data_len))
+    os.rename(tmp_filename, filename)
+    return True
+
+
+def wav_ok(filename):
+    """Check the file exists and starts with a RIFF WAVE header."""
+    try:
+        with open(filename, "rb") as fh:
+            header = fh.read(12)
+    except OSError:
+        return False
+    return header[0:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+class Speech:
+    """Play a queue of wav files without blocking, service() must be called
+       frequently to start the next file. The next file is opened while
+       the current one plays to minimise the gap between them.
+    """
+
+    def __init__(self, audio, enable):
+        self._audio = audio
+        self._enable = enable
+        self._queue = []   ### (filename, gap after in ns)
+        self._current = None
+        self._next = None
+        self._pause_until_ns = None
+        ### Each WaveFile double buffers using halves of these
+        self._buffers = (bytearray(512), bytearray(512))
+        self._buf_idx = 0
+        self._copy_buf = bytearray(512)
+
+    def _open(self, filename):
+        self._buf_idx = 1 - self._buf_idx
+        fh = open(filename, "rb")
+        return (WaveFile(fh, self._buffers[self._buf_idx]), fh,
+                self._queue.pop(0)[1])
+
+    def play(self, filename, gap_s=0.0):
+        self._queue.append((filename, round(gap_s * S_TO_NS)))
+        self.service()
+
+    def say(self, words):
+        """Say a phrase using a single joined file if possible."""
+        name = "-".join("_" if word == "," else word for word in words)
+        filename = PHRASE_DIR + "/" + name + ".wav"
+        if not wav_ok(filename):
+            try:
+                try:
+                    os.mkdir(PHRASE_DIR)
+                except OSError:
+                    pass  ### most likely exists already
+                ### remove any invalid file, e.g. a partial one
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+                if not build_phrase(words, filename, self._copy_buf):
+                    filename = None
+            except (OSError, ValueError) as ex:
+                print("Cannot make phrase", filename, ex)
+                try:
+                    os.remove(filename + ".tmp")
+                except OSError:
+                    pass
+                filename = None
+        if filename is not None:
+            self.play(filename)
+            return
+        for word in words:
+            if word == ",":
+                if self._queue:
+                    self._queue[-1] = (self._queue[-1][0], round(COMMA_GAP_S * S_TO_NS))
+            else:
+                self.play(WAV_DIR + "/" + word + ".wav", WORD_GAP_S)
+
+    def service(self):
+        """Start the next file when needed returning True if still speaking."""
+        if self._audio.playing:
+            if self._next is None and self._queue:
+                self._next = self._open(self._queue[0][0])
+            return True
+        now_ns = time.monotonic_ns()
+        if self._current is not None:
+            wavefile, fh, gap_ns = self._current
+            wavefile.deinit()
+            fh.close()
+            self._current = None
+            self._pause_until_ns = now_ns + gap_ns
+        if self._pause_until_ns is not None:
+            if now_ns < self._pause_until_ns:
+                return True
+            self._pause_until_ns = None
+        if self._next is None and self._queue:
+            self._next = self._open(self._queue[0][0])
+        if self._next is None:
+            self._enable.value = False
+            return False
+        self._current = self._next
+        self._next = None
+        self._enable.value = True
+        self._audio.play(self._current[0])
+        return True
+
+    @property
+    def speaking(self):
+        return (self._current is not None or self._next is not None
+                or bool(self._queue))
 
 
 S_TO_NS = 1_000_000_000
@@ -155,12 +328,20 @@ shot_num = 1
 auto_shot_num = None
 first_cmd_ns = time.monotonic_ns()
 first_auto_cmd_ns = None
+speech = Speech(audio_out, speaker_enable)
+impending_pixels = False
 
 while True:
+    ### Speech plays in the background and the impending colour
+    ### is shown until the announcement finishes
+    if not speech.service() and impending_pixels:
+        pixels.fill(BLACK)
+        impending_pixels = False
+
     ### CPX switch to left
     if switch_left.value:
         if intervalometer:
-            play_file(manual_trig_wav)
+            speech.play(manual_trig_wav)
             intervalometer = False
 
         ### Only fire shutter if it's been a while since last press
@@ -177,12 +358,12 @@ while True:
                 pixels.fill(BLACK)
             shot_num += 1
             while button_right.value:
-                pass  ### wait for button release
+                speech.service()  ### wait for button release
 
         elif button_left.value:
             pixel_indication = not pixel_indication
             while button_left.value:
-                pass  ### wait for button release
+                speech.service()  ### wait for button release
 
     ### CPX switch to right
     else:
@@ -194,18 +375,18 @@ while True:
         if button_left.value and interval_idx > 0:
             interval_idx -= 1
             while button_left.value:
-                pass  ### wait for button release
+                speech.service()  ### wait for button release
             say_and_reset = True
 
         ### Right button (B) increases time
         elif button_right.value and interval_idx < len(intervals) - 1:
             interval_idx += 1
             while button_right.value:
-                pass  ### wait for button release
+                speech.service()  ### wait for button release
             say_and_reset = True
 
         if say_and_reset:
-            say_interval(interval_words[interval_idx])
+            speech.say(interval_words[interval_idx].split() + ["seconds"])
             first_auto_cmd_ns = time.monotonic_ns()
             auto_shot_num = 1
             say_and_reset = False
@@ -235,6 +416,6 @@ while True:
               and not impending
               and now_ns - first_auto_cmd_ns >= cum_interval_ns - IMPENDING_NS):
             pixels.fill(IMPENDING_COLOUR)
-            play_file(impending_wav)
-            pixels.fill(BLACK)
+            speech.play(impending_wav)
             impending = True
+            impending_pixels = True
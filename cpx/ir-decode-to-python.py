@@ -1,9 +1,9 @@
-### ir-decode-to-python v1.0
+### ir-decode-to-python v1.1
 ### Circuit Playground Express (CPX) IR code generator
 ### Read infrared codes as a user presses each one and names them to 
 ### generate array and dict data for python code to use
 
-### copy this file to CPX as main.py
+### copy this file to CPX as main.py with ir_stream.py
 
 ### MIT License
 
@@ -33,7 +33,8 @@ import micropython
 
 import pulseio
 import board
-import adafruit_irremote
+
+from ir_stream import IRStreamDecoder, PROTOCOL_NAMES
 
 ### Based on the code from
 ### https://learn.adafruit.com/infrared-ir-receive-transmit-circuit-playground-express-circuit-python/ir-test-with-remote
@@ -41,100 +42,55 @@ import adafruit_irremote
 ### See also LIRC database http://lirc.org/ - probably a better source for this data!
 ### and http://rcoid.de/remotefiles.html looks interesting
 
-### TODO would be useful to understand why max_pulse is set to 5000 in
-### https://learn.adafruit.com/hacking-ikea-lamps-with-circuit-playground-express/circuitpython-remote-lamp
+### Decoding is now done by ir_stream as the pulses arrive rather
+### than after waiting for a timeout, this replaces my_read_pulses
+### and GenericDecode which only handled NEC-type remotes
+### https://github.com/adafruit/Adafruit_CircuitPython_IRRemote/issues/16
 
 memdebug = 0
 
 # Create a 'pulseio' input, to listen to infrared signals on the IR receiver
 pulsein = pulseio.PulseIn(board.IR_RX, maxlen=200, idle_state=True)
-# Create a decoder that will take pulses and turn them into numbers
-decoder = adafruit_irremote.GenericDecode()
 
 ### names might be more naturally represented as a dictionary but
 ### collections.OrderedDict is not available so list works well instead
 codes = []
+protocols = []
 names = []
 
-### Dervived from https://github.com/adafruit/Adafruit_CircuitPython_IRRemote/blob/master/adafruit_irremote.py
-### to investigate improving timeout behaviour
-### https://github.com/adafruit/Adafruit_CircuitPython_IRRemote/issues/16
-def my_read_pulses(input_pulses, max_pulse=10000, blocking=True, timeout=None):
-    """Read out a burst of pulses until a pulse is longer than ``max_pulse`` microseconds.
-       :param ~pulseio.PulseIn input_pulses: Object to read pulses from
-       :param int max_pulse: Pulse duration to end a burst
-       :param bool blocking: If True, will block until pulses found.
-           If False, will return None if no pulses.
-           Defaults to True for backwards compatibility
-       :param timeout: set to number of microseconds to wait after a pulse
-           or "max_pulse" to set to max_pulse value, default is no timeout.
-       """
-    if not input_pulses and not blocking:
-        return None
-    received = []
-    if isinstance(timeout,str):
-        if timeout == "max_pulse":
-            timeout = max_pulse
-        else:
-            raise ValueError("bogus max_pulse")
-    while True:
-        t1 = time.monotonic()
-        ### Wait for some IR pulses to be received
-        while not input_pulses:
-            if timeout is not None and received:
-                durationus = (time.monotonic() - t1) * 1e6
-                if (durationus > timeout):
-                    ## print("TIMEOUT ({:f}",durationus)
-                    return received ### timeout
-            else:
-                pass  ### nothing received yet
-        while input_pulses:
-            pulse = input_pulses.popleft()
-            ### This print() completely changes timing - may cause or mask bugs
-            ## print('input_pulses={:d} received={:d} latest={:d}'.format(len(input_pulses), len(received), pulse))
-            if pulse > max_pulse:
-                if not received:
-                    continue
-                else:
-                    return received
-            received.append(pulse)
-    return received
+received = []
+
+def on_frame(protocol, nbits, value, repeat):
+    ### Held buttons send repeats, only the first frame is wanted
+    if repeat:
+        print(PROTOCOL_NAMES[protocol], "repeat")
+    else:
+        received.append((protocol, nbits, value))
+
+decoder = IRStreamDecoder(on_frame)
 
 print("Press button on the remote, then type name of button")
 print("Press any button and enter an empty name to finish")
 print("Enter IGNORE to not record a bogus value")
 
-pulses = None
 while True:
-    ### Relocated - see further down
-    ##pulsein.clear()
-    ### 
-    pulses = my_read_pulses(pulsein, timeout="max_pulse")
-    print("Decoding {:d} pulses".format(len(pulses)))
-    try:
-        # Attempt to convert received pulses into numbers
-        received_code = decoder.decode_bits(pulses, debug=False)
-    except adafruit_irremote.IRNECRepeatException:
-        # We got an unusual short code, probably a 'repeat' signal
-        print("Try again: " + "NEC repeat!")
-        continue
-    except adafruit_irremote.IRDecodeException as e:
-        # Something got distorted or maybe its not an NEC-type remote?
-        print("Try again: " + "Failed to decode: ", e.args)
-        continue
-
-    print("NEC Infrared code received: ", received_code)
+    while not received:
+        decoder.service(pulsein)
+
+    protocol, nbits, value = received.pop(0)
+    ### list of bytes like GenericDecode.decode_bits()
+    received_code = list(value.to_bytes((nbits + 7) // 8, "big"))
+    print(PROTOCOL_NAMES[protocol], "Infrared code received: ", received_code)
     codename = input("Enter a unique name for button: ")
     if codename == "":
         break
-    ### An attempt to reduce memory fragmentation but pulsein implementation
-    ### may use a preallocated buffer and python/micropython memory management
-    ### may not do as we wish here
     pulsein.clear()  ### also needed to throw away any extra repeat codes
-    del pulses
-    if codename != "IGNORE":        
+    decoder.reset()
+    received.clear()
+    if codename != "IGNORE":
         names.append(codename)
         codes.append(received_code)
+        protocols.append(PROTOCOL_NAMES[protocol])
 
 
 #if memdebug: micropython.mem_info(1)
@@ -143,7 +99,7 @@ while True:
 ### previous string concatentation version would blow up with
 ### MemoryError: memory allocation failed, allocating 767 bytes
 ### with just 18 IR codes
-del pulses
+del decoder
 del pulsein
 
 if memdebug: micropython.mem_info(1)
@@ -151,8 +107,8 @@ if memdebug: micropython.mem_info(1)
 ### Generate python code to represent data (pprint not available)
 print("### Python code")
 print("ircodes = [")
-for c in codes:
-    print("           " + str(c) + ",")
+for c, p in zip(codes, protocols):
+    print("           " + str(c) + ",  ### " + p)
 print("          ]")
 
 print("irnames = {")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+### ir-stream-bench.py v1.1
+### Check and time ir_stream decoding with generated or recorded pulses
+
+### This runs on a desktop, e.g.
+### ./ir-stream-bench.py
+### ./ir-stream-bench.py -c 8 recorded-pulses.txt
+### recorded pulses are durations in microseconds separated by
+### whitespace or commas, e.g. printed from PulseIn on a CPX
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Generated pulses have a random jitter and the marks are lengthened
+### and spaces shortened like a typical IR receiver module does,
+### every decoded frame is checked against what was generated and
+### any difference is printed as a MISMATCH
+###
+### The decoder's clock is simulated from the pulse durations with a
+### button release counting as RELEASE_US so the results do not depend
+### on how fast the desktop runs, some presses use the same code as
+### the previous one to check these are not seen as repeats
+
+import getopt
+import random
+import re
+import sys
+import time
+
+from ir_stream import (IRStreamDecoder, NEC, SIRC, RC5,
+                       PROTOCOL_NAMES, TIMINGS, SHORT, LONG,
+                       HDR_MARK, HDR_SPACE, RPT_SPACE)
+
+
+chunk_len = 16
+repeats = 3
+frame_count = 300
+verbose = False
+
+JITTER_US = 60
+RECEIVER_SKEW_US = 80
+FRAME_GAP_US = 40000
+RELEASE_PULSE = 0xffff  ### longest pulse from PulseIn
+RELEASE_US = 500_000
+SAME_CODE_CHANCE = 0.2
+
+
+def usage(exit_code):
+    print("ir-stream-bench: [-h] [-c chunk_len] [-n frames] [-r repeats] [-v] [pulses.txt]",
+          file=sys.stderr)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def nec_pulses(value):
+    t = TIMINGS[NEC]
+    pulses = [t[HDR_MARK], t[HDR_SPACE]]
+    for shift in range(31, -1, -1):
+        pulses.extend((t[SHORT], t[LONG] if value >> shift & 1 else t[SHORT]))
+    pulses.append(t[SHORT])
+    return pulses
+
+
+def nec_repeat_pulses():
+    t = TIMINGS[NEC]
+    return [t[HDR_MARK], t[RPT_SPACE], t[SHORT]]
+
+
+def sirc_pulses(nbits, value):
+    t = TIMINGS[SIRC]
+    pulses = [t[HDR_MARK]]
+    for shift in range(nbits - 1, -1, -1):
+        pulses.extend((t[SHORT], t[LONG] if value >> shift & 1 else t[SHORT]))
+    return pulses
+
+
+def rc5_pulses(value):
+    """Manchester encode 14 bits merging adjacent halves at the same level,
+       the leading and trailing spaces are not seen by PulseIn."""
+    halves = []
+    for shift in range(13, -1, -1):
+        bit = value >> shift & 1
+        halves.extend((not bit, bool(bit)))
+    pulses = []
+    level = None
+    for mark in halves:
+        if mark == level:
+            pulses[-1] += TIMINGS[RC5][SHORT]
+        elif pulses or mark:
+            pulses.append(TIMINGS[RC5][SHORT])
+        level = mark
+    if not level:
+        pulses.pop()
+    return pulses
+
+
+def receiver(pulses):
+    """Add the distortion of a receiver module."""
+    out = []
+    for idx, pulse in enumerate(pulses):
+        skew = RECEIVER_SKEW_US if idx % 2 == 0 else -RECEIVER_SKEW_US
+        out.append(max(1, pulse + skew + random.randint(-JITTER_US, JITTER_US)))
+    return out
+
+
+def new_code():
+    """A random code as protocol, number of bits, value and its pulses."""
+    proto = random.choice((NEC, SIRC, RC5))
+    if proto == NEC:
+        addr = random.randrange(256)
+        cmd = random.randrange(256)
+        value = addr << 24 | (addr ^ 0xff) << 16 | cmd << 8 | (cmd ^ 0xff)
+        nbits = 32
+        frame = nec_pulses(value)
+    elif proto == SIRC:
+        nbits = random.choice((12, 15, 20))
+        value = random.randrange(1 << nbits)
+        frame = sirc_pulses(nbits, value)
+    else:
+        nbits = 14
+        value = 0b11 << 12 | random.randrange(1 << 12)
+        frame = rc5_pulses(value)
+    return proto, nbits, value, frame
+
+
+def generate(count, repeat_count):
+    """Pulses for count button presses each followed by repeat_count
+       repeats and the list of frames expected."""
+    pulses = []
+    expected = []
+    last_press = None
+    for _ in range(count):
+        if last_press is not None and random.random() < SAME_CODE_CHANCE:
+            proto, nbits, value, frame = last_press
+        else:
+            proto, nbits, value, frame = new_code()
+        last_press = (proto, nbits, value, frame)
+        for rpt in range(repeat_count + 1):
+            if proto == NEC and rpt:
+                pulses.extend(receiver(nec_repeat_pulses()))
+            else:
+                pulses.extend(receiver(frame))
+            pulses.append(FRAME_GAP_US)
+            expected.append((proto, nbits, value, rpt > 0))
+        pulses.append(RELEASE_PULSE)
+    return pulses, expected
+
+
+def read_pulses(filename):
+    with open(filename, "r") as fh:
+        return [int(num) for num in re.findall(r"\d+", fh.read())]
+
+
+def run(pulses, chunk):
+    """Feed the pulses chunk at a time like drain() from PulseIn
+       returning the frames and the time taken.
+       A release always starts a new chunk as the idle time
+       before it would be seen by service() calling drain()."""
+    chunks = []
+    clock_ns = 0
+    start = 0
+    for idx, pulse in enumerate(pulses):
+        if pulse == RELEASE_PULSE and idx > start:
+            chunks.append((start, idx, clock_ns))
+            start = idx
+        clock_ns += (RELEASE_US if pulse == RELEASE_PULSE else pulse) * 1000
+        if idx + 1 - start == chunk:
+            chunks.append((start, idx + 1, clock_ns))
+            start = idx + 1
+    if start < len(pulses):
+        chunks.append((start, len(pulses), clock_ns))
+
+    frames = []
+    now_ns = [0]
+    decoder = IRStreamDecoder(lambda *frame: frames.append(frame),
+                              clock_ns=lambda: now_ns[0])
+    t1 = time.perf_counter()
+    for start, end, clock_ns in chunks:
+        now_ns[0] = clock_ns
+        decoder.feed(pulses[start:end])
+        decoder.decode()
+    decoder.flush()
+    t2 = time.perf_counter()
+    return frames, t2 - t1, decoder
+
+
+def main(cmdlineargs):
+    global chunk_len, frame_count, repeats, verbose
+
+    try:
+        opts, args = getopt.getopt(cmdlineargs,
+                                   "c:hn:r:v", ["help"])
+    except getopt.GetoptError as err:
+        print(err,
+              file=sys.stderr)
+        usage(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt == "-c":
+            chunk_len = int(arg)
+        elif opt == "-n":
+            frame_count = int(arg)
+        elif opt == "-r":
+            repeats = int(arg)
+        elif opt == "-v":
+            verbose = True
+    if len(args) > 1:
+        usage(2)
+
+    random.seed(0)
+    if args:
+        pulses = read_pulses(args[0])
+        expected = None
+    else:
+        pulses, expected = generate(frame_count, repeats)
+
+    frames, duration, decoder = run(pulses, chunk_len)
+    if verbose:
+        for proto, nbits, value, repeat in frames:
+            print("{:s} {:d} bits 0x{:x}{:s}".format(PROTOCOL_NAMES[proto], nbits, value,
+                                                     " repeat" if repeat else ""))
+
+    mismatches = 0
+    if expected is not None:
+        for idx in range(max(len(frames), len(expected))):
+            got = frames[idx] if idx < len(frames) else None
+            want = expected[idx] if idx < len(expected) else None
+            if got != want:
+                mismatches += 1
+                if mismatches <= 10:
+                    print("MISMATCH", idx, "got", got, "expected", want)
+
+    print("Decoded {:d} frames from {:d} pulses in {:.3f}s"
+          " {:.0f} frames/s {:.2f}us/pulse errors={:d} mismatches={:d}".format(
+              len(frames), len(pulses), duration,
+              len(frames) / duration, duration / max(1, len(pulses)) * 1e6,
+              decoder.errors, mismatches))
+    return mismatches
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(sys.argv[1:]) else 0)
@@ -0,0 +1,342 @@
+### ir_stream.py v1.1
+### Streaming decoder for NEC, Sony SIRC and RC5 infrared remote controls
+
+### copy this file to CPX alongside code.py
+### ir-stream-bench.py checks and times this on a desktop
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Pulses are copied from PulseIn into an array ring buffer and decoded
+### one at a time by a state machine so a frame is emitted when its last
+### pulse arrives rather than after the gap which follows it
+###
+### Durations are classified by looking up the duration in 64us units
+### in a bytearray per protocol made when this module is imported,
+### this avoids comparisons against ranges for every pulse
+###
+### The first pulse of a frame is a mark (carrier on) as PulseIn
+### is used with idle_state=True, marks are the even pulses
+###
+### SIRC frames have 12, 15 or 20 bits so the shorter ones can
+### only be emitted when the next pulse or a timeout shows the end
+###
+### Repeats are timed with a clock rather than by adding up pulses
+### as PulseIn limits the gap between presses to 65535us, the time of
+### a frame is when the pulses were drained less the duration of the
+### pulses after it which are still in the ring
+###
+### A held NEC button sends repeat frames and SIRC repeats have gaps
+### well under 65535us so a full NEC or SIRC frame after a gap PulseIn
+### has capped is a new press, RC5 has a toggle bit for this instead
+
+import time
+from array import array
+
+
+NEC = 0
+SIRC = 1
+RC5 = 2
+PROTOCOL_NAMES = ("NEC", "SIRC", "RC5")
+
+### Duration classes
+INVALID = 0
+SHORT = 1
+LONG = 2
+HDR_MARK = 3
+HDR_SPACE = 4
+RPT_SPACE = 5
+
+### Nominal durations in microseconds for each class
+TIMINGS = ({HDR_MARK: 9000, HDR_SPACE: 4500, RPT_SPACE: 2250,
+            SHORT: 562, LONG: 1687},
+           {HDR_MARK: 2400, SHORT: 600, LONG: 1200},
+           {SHORT: 889, LONG: 1778})
+
+TOLERANCE = 0.4  ### receivers lengthen marks and shorten spaces
+QUANT_SHIFT = 6
+TABLE_LEN = 256
+GAP_US = 10000  ### longer than any pulse within a frame, as max_pulse was
+MAX_PULSE = 0xffff  ### PulseIn reports longer pulses as this
+REPEAT_US = 150_000  ### same code again within this is a repeat
+
+SIRC_BITS = (12, 15, 20)
+RC5_HALVES = 28
+
+
+def _nearest(timings, duration_us, tolerance):
+    """The class with the nominal duration closest by ratio
+       to duration_us or INVALID if none are within tolerance."""
+    best = INVALID
+    best_ratio = 1.0 + tolerance
+    for cls, nominal in timings.items():
+        ratio = max(duration_us, nominal) / min(duration_us, nominal)
+        if ratio < best_ratio:
+            best = cls
+            best_ratio = ratio
+    return best
+
+
+def make_class_table(timings, tolerance=TOLERANCE):
+    table = bytearray(TABLE_LEN)
+    for idx in range(TABLE_LEN):
+        centre_us = (idx << QUANT_SHIFT) + (1 << (QUANT_SHIFT - 1))
+        table[idx] = _nearest(timings, centre_us, tolerance)
+    return table
+
+
+def make_start_table(tolerance=TOLERANCE):
+    """Protocol + 1 indexed by the quantised duration of the first mark,
+       RC5 has no header so its first mark is a short or long one."""
+    starts = {}  ### keys are two per protocol starting at 1
+    for proto, timings in enumerate(TIMINGS):
+        if HDR_MARK in timings:
+            starts[proto * 2 + 1] = timings[HDR_MARK]
+        else:
+            starts[proto * 2 + 1] = timings[SHORT]
+            starts[proto * 2 + 2] = timings[LONG]
+    table = bytearray(TABLE_LEN)
+    for idx in range(TABLE_LEN):
+        centre_us = (idx << QUANT_SHIFT) + (1 << (QUANT_SHIFT - 1))
+        key = _nearest(starts, centre_us, tolerance)
+        if key != INVALID:
+            table[idx] = (key - 1) // 2 + 1
+    return table
+
+
+CLASS_TABLES = tuple(make_class_table(t) for t in TIMINGS)
+START_TABLE = make_start_table()
+
+
+class IRStreamDecoder:
+    """Decodes pulses as they arrive calling on_frame(protocol, nbits, value, repeat)
+       for each frame. value has the first bit received as its most
+       significant bit. An NEC repeat frame is reported as the previous
+       NEC code with repeat True.
+       clock_ns is the time source for the gap timeout and repeats.
+    """
+
+    def __init__(self, on_frame, *, size=256, gap_us=GAP_US,
+                 clock_ns=time.monotonic_ns):
+        if size & (size - 1):
+            raise ValueError("size must be a power of two")
+        self._on_frame = on_frame
+        self._ring = array("H", [0]) * size
+        self._mask = size - 1
+        self._head = 0
+        self._tail = 0
+        self._gap_us = gap_us
+        self._clock_ns = clock_ns
+        self._last_pulse_ns = clock_ns()
+        self.frames = 0
+        self.errors = 0
+        self.overruns = 0
+        self.reset()
+
+    def reset(self):
+        """Discard any partial frame, buffered pulses and the last codes."""
+        self._tail = self._head
+        self._pending_us = 0
+        self._last = [None, None, None]  ### (nbits, value) per protocol
+        self._last_frame_ns = None
+        self._capped_gap = False
+        self._proto = None
+        self._index = 0
+        self._nbits = 0
+        self._value = 0
+        self._halves = 0
+        self._first_half = False
+
+    def _put(self, pulse):
+        if self._head - self._tail > self._mask:
+            self._pending_us -= self._ring[self._tail & self._mask]
+            self._tail += 1
+            self.overruns += 1
+        self._ring[self._head & self._mask] = pulse
+        self._head += 1
+        self._pending_us += pulse
+
+    def drain(self, pulsein):
+        """Copy all the pulses from pulsein into the ring returning the count."""
+        count = len(pulsein)
+        popleft = pulsein.popleft
+        for _ in range(count):
+            self._put(popleft())
+        if count:
+            self._last_pulse_ns = self._clock_ns()
+        return count
+
+    def feed(self, pulses):
+        """Add pulses from any iterable, e.g. a recording on a desktop."""
+        for pulse in pulses:
+            self._put(pulse)
+        self._last_pulse_ns = self._clock_ns()
+
+    def decode(self):
+        """Decode the pulses in the ring returning the number of frames emitted."""
+        frames = self.frames
+        ring = self._ring
+        mask = self._mask
+        step = self._step
+        while self._tail != self._head:
+            pulse = ring[self._tail & mask]
+            self._tail += 1
+            self._pending_us -= pulse
+            step(pulse)
+        return self.frames - frames
+
+    def service(self, pulsein):
+        """Drain, decode and end any frame which has been idle for longer
+           than the gap returning the number of frames emitted."""
+        self.drain(pulsein)
+        frames = self.decode()
+        if (self._proto is not None
+                and self._clock_ns() - self._last_pulse_ns > self._gap_us * 1000):
+            frames += self.flush()
+        return frames
+
+    def flush(self):
+        """End the current frame as if a gap had been received."""
+        frames = self.frames
+        self._end_frame()
+        return self.frames - frames
+
+    def _emit(self, proto, nbits, value, repeat=None):
+        code = (nbits, value)
+        now_ns = self._last_pulse_ns - self._pending_us * 1000
+        if repeat is None:
+            repeat = (self._last[proto] == code
+                      and self._last_frame_ns is not None
+                      and now_ns - self._last_frame_ns < REPEAT_US * 1000
+                      and (proto == RC5 or not self._capped_gap))
+        self._last[proto] = code
+        self._last_frame_ns = now_ns
+        self._capped_gap = False
+        self._proto = None
+        self.frames += 1
+        self._on_frame(proto, nbits, value, repeat)
+
+    def _error(self):
+        self._proto = None
+        self.errors += 1
+
+    def _end_frame(self):
+        ### the last pulse of a SIRC frame is a mark
+        if self._proto == SIRC and self._index % 2 == 0 and self._nbits in SIRC_BITS:
+            self._emit(SIRC, self._nbits, self._value)
+        elif self._proto is not None and self._index > 1:
+            self.errors += 1
+        self._proto = None
+
+    def _step(self, pulse):
+        if pulse >= MAX_PULSE:
+            self._capped_gap = True
+        if pulse >= self._gap_us:
+            self._end_frame()
+            return
+        qdur = pulse >> QUANT_SHIFT
+        if qdur >= TABLE_LEN:
+            qdur = TABLE_LEN - 1
+
+        proto = self._proto
+        if proto is None:
+            ### This must be the first mark of a frame
+            start = START_TABLE[qdur]
+            if not start:
+                self.errors += 1
+                return
+            proto = self._proto = start - 1
+            self._index = 0
+            self._nbits = 0
+            self._value = 0
+            if proto == RC5:
+                ### first half of the start bit is an unseen space
+                self._halves = 1
+                self._first_half = False
+                self._rc5_level(True, 2 if CLASS_TABLES[RC5][qdur] == LONG else 1)
+            return
+
+        index = self._index = self._index + 1
+        cls = CLASS_TABLES[proto][qdur]
+        mark = not index & 1
+        if proto == NEC:
+            self._nec(index, cls, mark)
+        elif proto == SIRC:
+            self._sirc(index, cls, mark)
+        elif cls == SHORT or cls == LONG:
+            self._rc5_level(mark, cls)  ### values are the number of halves
+        else:
+            self._error()
+
+    def _nec(self, index, cls, mark):
+        if index == 1:
+            if cls == RPT_SPACE:
+                self._nbits = -1
+            elif cls != HDR_SPACE:
+                self._error()
+        elif mark:
+            if cls != SHORT:
+                self._error()
+            elif self._nbits < 0:
+                last = self._last[NEC]
+                if last is None:
+                    self._proto = None
+                else:
+                    self._emit(NEC, last[0], last[1], True)
+            elif self._nbits == 32:
+                self._emit(NEC, 32, self._value)
+        elif cls == SHORT or cls == LONG:
+            self._value = (self._value << 1) | (cls == LONG)
+            self._nbits += 1
+        else:
+            self._error()
+
+    def _sirc(self, index, cls, mark):
+        if not mark:
+            if cls != SHORT:
+                self._error()
+        elif cls == SHORT or cls == LONG:
+            self._value = (self._value << 1) | (cls == LONG)
+            self._nbits += 1
+            if self._nbits == SIRC_BITS[-1]:
+                self._emit(SIRC, self._nbits, self._value)
+        else:
+            self._error()
+
+    def _rc5_level(self, mark, halves):
+        """Add halves of a Manchester bit at one level,
+           space then mark is a 1, mark then space is a 0."""
+        for _ in range(halves):
+            self._halves += 1
+            if self._halves & 1:
+                self._first_half = mark
+            elif self._first_half == mark:
+                self._error()
+                return
+            else:
+                self._value = (self._value << 1) | mark
+                self._nbits += 1
+        if self._halves == RC5_HALVES:
+            self._emit(RC5, RC5_HALVES // 2, self._value)
+        elif self._halves == RC5_HALVES - 1 and mark:
+            ### the last bit is a 0 and ends with a space which is not seen
+            self._emit(RC5, RC5_HALVES // 2, (self._value << 1))
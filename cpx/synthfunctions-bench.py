@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+### synthfunctions-bench.py v1.1
+### Render a note sequence using synthfunctions envelopes to a wav file
+### and benchmark the scalar and block envelope implementations
+
+### This runs on a desktop with NumPy, e.g.
+### ./synthfunctions-bench.py -o duosynth.wav -v 8
+### -p uses array blocks rather than NumPy ones like a CPX without ulab
+### -w writes the wavetables for the synths to a directory, e.g.
+### ./synthfunctions-bench.py -w /media/CIRCUITPY/wavetables -s 42240
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+import getopt
+import sys
+import time
+import wave
+
+import numpy as np
+
+import synthfunctions
+from synthfunctions import ADSR, LFO, BlockEnvelope, BlockLFO, CONTROL_RATE
+from synthfunctions import WAVEFORMS, WavetableBank
+
+
+output = None
+sample_rate = 22050
+voices = 2
+verbose = False
+wave_dir = None
+wave_samplerates = []
+wave_volumes = [23000, 30000]
+
+### Values from cpx-basic-square-duosynth.py
+attack = 0.050
+decay = 0.1
+sustain = 0.8
+release = 0.500
+velcurve = 0.40
+lforate = 1.0
+
+### (start time, duration, MIDI note, velocity)
+SEQUENCE = ((0.0, 0.4, 60, 100),
+            (0.5, 0.4, 64, 90),
+            (1.0, 0.4, 67, 80),
+            (1.5, 1.2, 72, 127),
+            (1.5, 1.2, 48, 60),
+            (3.2, 0.2, 60, 40),
+            (3.4, 0.2, 62, 60),
+            (3.6, 0.2, 64, 80),
+            (3.8, 0.8, 65, 100))
+
+
+def usage(exit_code):
+    print("synthfunctions-bench: [-h] [-o output.wav] [-p] [-r samplerate] [-v voices]\n"
+          "                      [-w wavetable_dir [-s wave_samplerate]...]",
+          file=sys.stderr)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def render(sequence, rate, voice_count):
+    """Render the sequence with square waves using the LFO on duty cycle
+       like the duosynth with a simple oldest voice allocation."""
+    end_t = max(start + dur for start, dur, _, _ in sequence) + release + 0.1
+    length = round(end_t * rate)
+    out = np.zeros(length)
+    envs = [BlockEnvelope() for _ in range(voice_count)]
+    lfo = BlockLFO(0.0, lforate)
+    notes = [None] * voice_count
+    phases = np.zeros(voice_count)
+
+    events = []
+    for start, dur, note, vel in sequence:
+        events.append((start, 1, note, vel))
+        events.append((start + dur, 0, note, vel))
+    events.sort()
+
+    ### Run the envelopes at the control rate and hold values between steps
+    step = rate // CONTROL_RATE
+    next_voice = 0
+    ev_idx = 0
+    for pos in range(0, length, step):
+        now_t = pos / rate
+        while ev_idx < len(events) and events[ev_idx][0] <= now_t:
+            _, on, note, vel = events[ev_idx]
+            if on:
+                envs[next_voice].trigger(now_t, vel, attack, decay, sustain, release)
+                notes[next_voice] = note
+                next_voice = (next_voice + 1) % voice_count
+            else:
+                for v_idx in range(voice_count):
+                    if notes[v_idx] == note:
+                        envs[v_idx].release(now_t)
+            ev_idx += 1
+
+        duty = 0.5 + (4096 + 24576 * lfo.value(now_t)) / 65536 / 2
+        samples = min(step, length - pos)
+        for v_idx, env in enumerate(envs):
+            vol = env.value(now_t)
+            if vol == 0.0:
+                continue
+            ampl = (vol / 127.0) ** velcurve / voice_count
+            freq = 440.0 * 2 ** ((notes[v_idx] - 69) / 12.0)
+            ph = (phases[v_idx] + np.arange(1, samples + 1) * freq / rate) % 1.0
+            out[pos:pos + samples] += np.where(ph < duty, ampl, -ampl)
+            phases[v_idx] = ph[-1]
+
+    return np.round(np.clip(out, -1.0, 1.0) * 32767).astype("<i2")
+
+
+def benchmark(voice_count, duration=2.0, loop_rate=5000):
+    """Time the envelope updates for voice_count voices over duration seconds
+       of simulated main loop at loop_rate returning voices per ms."""
+    times = np.arange(0.0, duration, 1.0 / loop_rate).tolist()
+    results = {}
+
+    t1 = time.perf_counter()
+    for now_t in times:
+        LFO(0.0, now_t, lforate, "triangle")
+        for _ in range(voice_count):
+            ADSR(100, 0.0, 0.0, now_t, attack, decay, sustain, release, 0.0)
+    t2 = time.perf_counter()
+    results["scalar"] = voice_count * len(times) / ((t2 - t1) * 1e3)
+
+    envs = [BlockEnvelope() for _ in range(voice_count)]
+    for env in envs:
+        env.trigger(0.0, 100, attack, decay, sustain, release)
+    lfo = BlockLFO(0.0, lforate)
+    t1 = time.perf_counter()
+    for now_t in times:
+        lfo.value(now_t)
+        for env in envs:
+            env.value(now_t)
+    t2 = time.perf_counter()
+    results["block"] = voice_count * len(times) / ((t2 - t1) * 1e3)
+    return results
+
+
+def write_wavetables(directory, samplerates, volumes):
+    """Generate and save every waveform for the synths' sample rates
+       so a CPX with a read-only CIRCUITPY can load them."""
+    wavebank = WavetableBank(directory)
+    count = 0
+    for samplerate in samplerates:
+        for name in WAVEFORMS:
+            for vol in volumes:
+                if not wavebank.save(name, samplerate, vol,
+                                     wavebank.table(name, samplerate, vol)):
+                    raise OSError("Cannot write to " + directory)
+                count += 1
+    print("Written", count, "wavetables to", directory)
+
+
+def main(cmdlineargs):
+    global output, sample_rate, voices, wave_dir
+
+    try:
+        opts, args = getopt.getopt(cmdlineargs,
+                                   "ho:pr:s:v:w:", ["help", "output="])
+    except getopt.GetoptError as err:
+        print(err,
+              file=sys.stderr)
+        usage(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt == "-p":
+            synthfunctions.np = None
+        elif opt == "-r":
+            sample_rate = int(arg)
+        elif opt == "-s":
+            wave_samplerates.append(int(arg))
+        elif opt == "-v":
+            voices = int(arg)
+        elif opt == "-w":
+            wave_dir = arg
+    if args:
+        usage(2)
+
+    if wave_dir is not None:
+        ### The default rates of the standalone and three oscillator synths
+        write_wavetables(wave_dir, wave_samplerates or [42240, 5280], wave_volumes)
+
+    if output is not None:
+        pcm = render(SEQUENCE, sample_rate, voices)
+        with wave.open(output, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(pcm.tobytes())
+        print("Written", len(pcm), "samples to", output)
+
+    for voice_count in sorted({1, 2, voices}):
+        results = benchmark(voice_count)
+        print("voices={:d} scalar={:.1f} block={:.1f} voices/ms".format(voice_count,
+                                                                          results["scalar"],
+                                                                          results["block"]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
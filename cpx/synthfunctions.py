@@ -1,6 +1,8 @@
-### synthfunctions v1.0
+### synthfunctions v1.2
 
 ### Tested with CPX and CircuitPython 4.0.0 beta5 
+### The envelope and LFO functions and classes also work on desktop Python
+### as does the wavetable generation which uses ulab or NumPy if present
 
 ### copy this file or mpy version of this file to CPX
 
@@ -29,61 +31,222 @@
 import math
 import random
 import array
-import audioio
+import struct
+import os
+import gc
+
+try:
+    import audioio
+except ImportError:
+    audioio = None  ### desktop Python
+
+try:
+    from micropython import const
+except ImportError:
+    const = lambda x: x  ### desktop Python
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    try:
+        import numpy as np  ### desktop Python
+    except ImportError:
+        np = None
 
 ### TODO - review whether this should be set by user
 A4refhz = const(440)
 
+### Envelopes and LFOs are rendered in blocks of values at a fixed control rate
+CONTROL_RATE = 500  ### Hz
+BLOCK_LEN = 32
+
+### The wavetables are single cycles (or a few for the chords) of
+### length samplerate / A4refhz played back at a rate proportional
+### to the note frequency, each is a sum of components of
+### (shape, period as fraction of cycle length, weight)
+### which are band-limited by only summing harmonics below
+### the Nyquist frequency of the table
 ### All just intonation
-### TODO - consider putting in some 32768 values on square and sawtooths
-###        to make them finish on midpoint and remove any under
-###        the covers slewing 
-def make_waveforms(waves, type, samplerate):
-    cyclelength = round(samplerate // A4refhz)
-    length = cyclelength  ### a default which some waves will change
+WAVEFORMS = {"square": (1, (("square", 1, 1.0),)),
+             "sawtooth": (1, (("saw", 1, 1.0),)),
+             "supersaw": (1, (("saw", 1, 1/3),
+                              ("saw", 1/2, 1/3),
+                              ("saw", 1/4, 1/3))),
+             "supersupersaw": (2, (("saw", 1, 2/8),
+                                   ("saw", 2/3, 1/8),
+                                   ("saw", 1/2, 1/8),
+                                   ("saw", 1/3, 1/8),
+                                   ("saw", 1/4, 1/8),
+                                   ("saw", 1/6, 1/8),
+                                   ("saw", 1/8, 1/8))),
+             "sine": (1, (("sine", 1, 1.0),)),
+             "sineoct2": (1, (("sine", 1, 2/3),
+                              ("sine", 1/2, 1/3))),
+             "sinefifth": (2, (("sine", 1, 1/2),
+                               ("sine", 2/3, 1/2))),
+             "noise": (1, ())}
 
-    #cycles = 1
-    #cycles = 3    ### for perfect fifth
-    #cycles = 4    ### for major chord
+### Wavetable file header is magic, version, name, length, sample rate, volume
+_WT_MAGIC = b"WTBL"
+_WT_VERSION = 1
+_WT_HEADER = "<4sB15sHIH"
+_WT_HEADER_LEN = struct.calcsize(_WT_HEADER)
 
-    ### TODO consider volume modification for internal speaker
-    ### vs non speaker use
 
-    ### major chord has longer sample which initially works
-    ### but will blow up later with four levels
-    if type == "majorchord":
-        volumes = [23000]
+def _harmonics(shape, period):
+    """Return the (harmonic, amplitude) pairs for a shape between +/- 1.0
+       with a period in samples, limited to below half the sample rate."""
+    top = max(1, math.ceil(period / 2) - 1)
+    if shape == "sine":
+        return ((1, 1.0),)
+    elif shape == "saw":
+        ### Rising ramp from -1.0 to 1.0
+        return tuple((k, -2 / math.pi / k) for k in range(1, top + 1))
+    elif shape == "square":
+        ### Low for first half to match the original non band-limited waves
+        return tuple((k, -4 / math.pi / k) for k in range(1, top + 1, 2))
+    raise ValueError("Unknown shape")
+
+
+def generate_wavetable(type, samplerate, vol):
+    """Return an array("h") of a band-limited wave between +/- vol."""
+    if type not in WAVEFORMS:
+        raise ValueError("Unknown type")
+    cyclelength = round(samplerate // A4refhz)
+    cycles, components = WAVEFORMS[type]
+    length = cycles * cyclelength
+    waveraw = array.array("h", [0] * length)
+
+    if type == "noise":
+        for idx in range(length):
+            waveraw[idx] = random.randint(-vol, vol)
+        return waveraw
+
+    if np is not None:
+        values = np.zeros(length)
+        idxs = np.arange(0, length) * (2 * math.pi / cyclelength)
+        for shape, fraction, weight in components:
+            for k, ampl in _harmonics(shape, cyclelength * fraction):
+                values += np.sin(idxs * (k / fraction)) * (ampl * weight)
     else:
-        volumes = [23000]  ### 30000 clips 
-        #volumes = [10000, 18000, 23000, 30000]
+        values = [0.0] * length
+        for shape, fraction, weight in components:
+            for k, ampl in _harmonics(shape, cyclelength * fraction):
+                step = 2 * math.pi * k / fraction / cyclelength
+                ampl *= weight
+                for idx in range(length):
+                    values[idx] += math.sin(idx * step) * ampl
 
-    ### Make some waves at different volumes
-    for vol in volumes:
-        ### Need to create a new array here as audio.RawSample appears not
-        if type == "square":
-            waveraw = array.array("h", [-vol] * (length // 2) + [vol] * (length - length // 2))
-        else:
-            waveraw = array.array("h", [0] * length)
-            if type == "sawtooth":
-                for i in range(length):
-                    waveraw[i] = round((i / (length - 1) - 0.5) * 2 * vol)
-            elif type == "supersaw":
-                halflength    = length // 2
-                quarterlength = length // 4
-                for i in range(length):
-                    ### TODO replace this with a gen function similar to sine
-                    waveraw[i] = round(((i / (length - 1) - 0.5 +
-                                         i % halflength / (halflength - 1) - 0.5 +
-                                         i % quarterlength / (quarterlength - 1) - 0.5)
-                                       ) * 2 / 3 * vol)
-            elif type == "noise":
+    ### Band-limiting overshoots so scale down any peaks over 1.0
+    peak = max(1.0, max(abs(v) for v in values))
+    scale = vol / peak
+    for idx in range(length):
+        waveraw[idx] = round(values[idx] * scale)
+    return waveraw
+
+
+class WavetableBank:
+    """A cache of wavetables and their RawSample objects shared across
+       voices and synths. Tables are generated on first use and saved to
+       directory on flash so later runs only need to read them back.
+       The oldest tables are dropped if there are more than max_tables
+       to keep memory use down when switching between lots of waves.
+    """
+
+    def __init__(self, directory="/wavetables", max_tables=None):
+        self._directory = directory
+        self._max_tables = max_tables
+        self._samples = {}
+        self._order = []
+        self.generated = 0
+        self.loaded = 0
+
+    def filename(self, type, samplerate, vol):
+        return "{:s}/{:s}-{:d}-{:d}.wtb".format(self._directory,
+                                                type, samplerate, vol)
+
+    def load(self, type, samplerate, vol):
+        """Return the table from flash or None if it is not there."""
+        try:
+            with open(self.filename(type, samplerate, vol), "rb") as fh:
+                header = fh.read(_WT_HEADER_LEN)
+                if len(header) != _WT_HEADER_LEN:
+                    return None
+                (magic, version, name,
+                 length, f_samplerate, f_vol) = struct.unpack(_WT_HEADER, header)
+                if (magic != _WT_MAGIC or version != _WT_VERSION
+                        or name.rstrip(b"\x00") != type.encode()
+                        or f_samplerate != samplerate or f_vol != vol):
+                    return None
                 waveraw = array.array("h", [0] * length)
-                for i in range(length):
-                    waveraw[i] = random.randint(0, 65536)
-            else:
-                return ValueError("Unknown type")
+                if fh.readinto(waveraw) != length * waveraw.itemsize:
+                    return None
+        except (OSError, ValueError):
+            return None
+        return waveraw
+
+    def save(self, type, samplerate, vol, waveraw):
+        """Write the table to flash, returns False if the filesystem is
+           read-only (the CIRCUITPY default without a boot.py remount)."""
+        try:
+            try:
+                os.mkdir(self._directory)
+            except OSError:
+                pass  ### most likely already exists
+            with open(self.filename(type, samplerate, vol), "wb") as fh:
+                fh.write(struct.pack(_WT_HEADER, _WT_MAGIC, _WT_VERSION,
+                                     type.encode(), len(waveraw),
+                                     samplerate, vol))
+                fh.write(waveraw)
+        except OSError:
+            return False
+        return True
+
+    def table(self, type, samplerate, vol):
+        """Return the table loading it from flash or generating it."""
+        waveraw = self.load(type, samplerate, vol)
+        if waveraw is None:
+            waveraw = generate_wavetable(type, samplerate, vol)
+            self.generated += 1
+            self.save(type, samplerate, vol, waveraw)
+        else:
+            self.loaded += 1
+        return waveraw
+
+    def sample(self, type, samplerate, vol):
+        """Return the shared RawSample for this wave, the table itself
+           on desktop Python where there is no audioio."""
+        key = (type, samplerate, vol)
+        sample = self._samples.get(key)
+        if sample is not None:
+            return sample
+        if self._max_tables is not None:
+            while len(self._order) >= self._max_tables:
+                del self._samples[self._order.pop(0)]
+            gc.collect()
+        waveraw = self.table(type, samplerate, vol)
+        sample = audioio.RawSample(waveraw) if audioio is not None else waveraw
+        self._samples[key] = sample
+        self._order.append(key)
+        return sample
+
+    def clear(self):
+        self._samples.clear()
+        self._order.clear()
+
+
+bank = WavetableBank()
+
 
-        waves.append(audioio.RawSample(waveraw))
+### TODO - consider putting in some 32768 values on square and sawtooths
+###        to make them finish on midpoint and remove any under
+###        the covers slewing 
+def make_waveforms(waves, type, samplerate, volumes=(23000,), wavebank=None):
+    """Append a RawSample per volume to waves using the shared bank."""
+    ### 30000 clips, more volume levels need more memory
+    wavebank = bank if wavebank is None else wavebank
+    for vol in volumes:
+        waves.append(wavebank.sample(type, samplerate, vol))
 
 def waveform_names():
     return ["square", "sawtooth", "supersaw", "noise" ]
@@ -145,4 +308,171 @@ def LFO(start_t, now_t, rate, shape):
     else:
         raise ValueError("Unsupported LFO wave shape")
 
-    return value            
+    return value
+
+
+def _interp_block(block, block_t, step_t, bp_times, bp_levels):
+    """Fill block with values linearly interpolated from the breakpoints,
+       values are held at the first and last levels outside the breakpoints."""
+    if np is not None:
+        times = np.arange(0, len(block)) * step_t + block_t
+        block[:] = np.interp(times, np.array(bp_times), np.array(bp_levels))
+        return
+
+    seg = 0
+    last = len(bp_times) - 1
+    t = block_t
+    for idx in range(len(block)):
+        while seg < last and t >= bp_times[seg + 1]:
+            seg += 1
+        if t <= bp_times[0]:
+            block[idx] = bp_levels[0]
+        elif seg == last:
+            block[idx] = bp_levels[last]
+        else:
+            t1 = bp_times[seg]
+            t2 = bp_times[seg + 1]
+            block[idx] = (bp_levels[seg]
+                          + (bp_levels[seg + 1] - bp_levels[seg]) * (t - t1) / (t2 - t1))
+        t += step_t
+
+
+class BlockEnvelope:
+    """An ADSR envelope rendered a block at a time into a preallocated array.
+       The breakpoints of the envelope are only recomputed on trigger and release
+       and a new block is only rendered when value() runs off the end
+       of the current one, making the cost independent of the loop speed.
+       Values are the same as ADSR() including 0.0 for the end of the envelope.
+    """
+
+    def __init__(self, block_len=BLOCK_LEN, control_rate=CONTROL_RATE):
+        if np is not None:
+            self._block = np.zeros(block_len)
+        else:
+            self._block = array.array("f", [0.0] * block_len)
+        self._block_len = block_len
+        self._control_rate = control_rate
+        self._step_t = 1.0 / control_rate
+        self._block_dur = block_len / control_rate
+        self._trigger_t = 0.0
+        self._block_t = 0.0   ### start of current block relative to trigger
+        self._block_abs_t = 0.0
+        self._bp_times = [0.0]
+        self._bp_levels = [0.0]
+        self._release = 0.0
+        self._end_t = None
+        self.active = False
+
+    def trigger(self, now_t, velocity, attack, decay, sustain, release):
+        self._trigger_t = now_t
+        self._release = release
+        ### Like ADSR() attack starts at 1.0 as 0.0 signifies end
+        if decay != 0.0 and sustain != 1.0:
+            self._bp_times = [0.0, attack, attack + decay]
+            self._bp_levels = [1.0, float(velocity), velocity * sustain]
+        else:
+            self._bp_times = [0.0, attack]
+            self._bp_levels = [1.0, float(velocity)]
+        self._end_t = None
+        self.active = True
+        self._render(0.0)
+
+    def release(self, now_t):
+        if not self.active:
+            return
+        rel_t = now_t - self._trigger_t
+        vol_release = self.value(now_t)
+        if self._release == 0.0 or vol_release == 0.0:
+            self._end()
+            return
+        self._bp_times = [rel_t, rel_t + self._release]
+        self._bp_levels = [vol_release, 0.0]
+        self._end_t = rel_t + self._release
+        self._render(rel_t)
+
+    def _end(self):
+        self.active = False
+        self._block_abs_t = self._trigger_t
+        for idx in range(self._block_len):
+            self._block[idx] = 0.0
+
+    def _render(self, block_t):
+        self._block_t = block_t
+        self._block_abs_t = self._trigger_t + block_t
+        _interp_block(self._block, block_t, self._step_t,
+                      self._bp_times, self._bp_levels)
+
+    def value(self, now_t):
+        ### The fast path is a lookup in the current block, the release
+        ### segment is rendered as zeros after it ends
+        idx = int((now_t - self._block_abs_t) * self._control_rate)
+        if 0 <= idx < self._block_len:
+            return self._block[idx]
+        if not self.active:
+            return 0.0
+        if self._end_t is not None and now_t - self._trigger_t >= self._end_t:
+            self._end()
+            return 0.0
+        ### Keep blocks on the control rate grid
+        self._render(self._block_t + (idx // self._block_len) * self._block_dur)
+        return self._block[idx % self._block_len]
+
+    @property
+    def block(self):
+        return self._block
+
+
+class BlockLFO:
+    """A triangle LFO between 0.0 and 1.0 like LFO() rendered a block at a time.
+       Changing the rate keeps the phase continuous."""
+
+    def __init__(self, start_t, rate, shape="triangle",
+                 block_len=BLOCK_LEN, control_rate=CONTROL_RATE):
+        if shape != "triangle":
+            raise ValueError("Unsupported LFO wave shape")
+        if np is not None:
+            self._block = np.zeros(block_len)
+        else:
+            self._block = array.array("f", [0.0] * block_len)
+        self._block_len = block_len
+        self._step_t = 1.0 / control_rate
+        self._phase_t = start_t  ### time at which phase is _phase0
+        self._phase0 = 0.0
+        self._rate = rate
+        self._block_t = None
+
+    def set_rate(self, now_t, rate):
+        self._phase0 = self._phase(now_t)
+        self._phase_t = now_t
+        self._rate = rate
+        self._block_t = None
+
+    def _phase(self, now_t):
+        wavelengths = self._phase0 + (now_t - self._phase_t) * self._rate
+        return wavelengths - math.floor(wavelengths)
+
+    def _render(self, block_t):
+        self._block_t = block_t
+        block = self._block
+        if np is not None:
+            phases = (np.arange(0, self._block_len) * (self._step_t * self._rate)
+                      + self._phase(block_t))
+            phases = phases - np.floor(phases)
+            block[:] = 1.0 - 2 * abs(0.5 - phases)
+        else:
+            phase = self._phase(block_t)
+            step = self._step_t * self._rate
+            for idx in range(self._block_len):
+                block[idx] = 1.0 - 2 * abs(0.5 - phase)
+                phase += step
+                if phase >= 1.0:
+                    phase -= math.floor(phase)
+
+    def value(self, now_t):
+        if self._block_t is None:
+            self._render(now_t)
+        idx = int((now_t - self._block_t) / self._step_t)
+        if idx >= self._block_len or idx < 0:
+            self._render(now_t)
+            idx = 0
+        return self._block[idx]
@@ -1,4 +1,4 @@
-### cloud-status.py v1.0
+### cloud-status.py v1.2
 ### Show the status of popular rent-a-computer services
 
 ### Tested with Adafruit MagTag and CircuitPython 7.3.3
@@ -29,6 +29,13 @@
 
 ### GCP implementation is fragile as it's an html scraper with iffy parsing
 
+### The page is fetched with If-None-Match and If-Modified-Since using
+### the validators kept with the last status in alarm.sleep_memory
+### and the e-ink display is only refreshed when the status changes
+### or after FORCE_REDRAW_WAKES wakes to keep the timestamp recent,
+### range requests are not used as the table's position in the
+### page varies
+
 ### TODO AWS, IBM and the other lot
 ### TODO low power for battery
 ###      remember light sleep is no use on CircuitPython ESP32-S2
@@ -41,6 +48,8 @@
 import time
 import re
 import ssl
+import json
+import struct
 
 import board
 import displayio
@@ -74,7 +83,7 @@ def d_print(level, *args, **kwargs):
         print(*args, **kwargs)
 
 
-### Update every one or five minutes
+### Update every one or five minutes, the former if there is a problem
 TOTAL_UPDATE_TIME_S = 20
 FREQUENT_SLEEP_TIME_S = 1 * 60 - TOTAL_UPDATE_TIME_S
 NORMAL_SLEEP_TIME_S = 5 * 60 - TOTAL_UPDATE_TIME_S
@@ -82,6 +91,9 @@ EINK_REFRESH_PAUSE_S = 10
 WIFI_RECONNECT_PAUSE_S = 8
 FETCH_RETRY_PAUSE_S = 4
 GET_TIMEOUT_S = 22
+FETCH_LUMP_SIZE = 512
+CELL_CARRY_SIZE = 4096
+FORCE_REDRAW_WAKES = 12
 
 
 ### The four MagTag brightness levels
@@ -244,6 +256,121 @@ class CloudStatus():
                 self._display.refresh()
 
 
+class StatusCache():
+    """Keep a dict with the last status and the HTTP validators as json
+       in alarm.sleep_memory, this survives deep sleep but not a reset."""
+    _MAGIC = b"CSC1"
+    _HEADER_FMT = "<4sH"
+    _HEADER_LEN = struct.calcsize(_HEADER_FMT)
+
+    def __init__(self, memory):
+        self._memory = memory
+
+
+    def load(self):
+        magic, length = struct.unpack(self._HEADER_FMT,
+                                      bytes(self._memory[0:self._HEADER_LEN]))
+        end = self._HEADER_LEN + length
+        if magic != self._MAGIC or end > len(self._memory):
+            return None
+        try:
+            return json.loads(bytes(self._memory[self._HEADER_LEN:end]).decode())
+        except (ValueError, UnicodeError):
+            return None
+
+
+    def save(self, state):
+        data = json.dumps(state).encode()
+        if self._HEADER_LEN + len(data) > len(self._memory):
+            d_print(1, "Status too large for sleep memory", len(data))
+            self.clear()
+            return False
+        self._memory[self._HEADER_LEN:self._HEADER_LEN + len(data)] = data
+        self._memory[0:self._HEADER_LEN] = struct.pack(self._HEADER_FMT,
+                                                       self._MAGIC, len(data))
+        return True
+
+
+    def clear(self):
+        self._memory[0:len(self._MAGIC)] = bytes(len(self._MAGIC))
+
+
+class CellTokenizer():
+    """Find the <td> and <th> cells in html which is fed a lump of bytes
+       at a time calling handler(tag, data, attr_start, attr_end, node_start, node_end)
+       for each one where tag is b"td" or b"th" and the others are
+       indices into data for the attributes and the contents.
+       The end of a lump which may be part of a cell is copied into a fixed
+       buffer and joined to the next lump, a cell larger than the buffer
+       is dropped.
+    """
+    _WHITESPACE = (0x20, 0x09, 0x0d, 0x0a)  ### ints as bytes.__contains__ needs a buffer on CircuitPython
+
+    def __init__(self, handler, carry_size=CELL_CARRY_SIZE):
+        self._handler = handler
+        self._carry = bytearray(carry_size)
+        self._carry_len = 0
+        self.cells = 0
+        self.dropped = 0
+
+
+    def feed(self, lump):
+        if self._carry_len:
+            total = self._carry_len + len(lump)
+            if total <= len(self._carry):
+                self._carry[self._carry_len:total] = lump
+                data = bytes(memoryview(self._carry)[:total])
+            else:
+                self.dropped += 1
+                data = lump
+        else:
+            data = lump
+
+        keep = self._scan(data)
+        rest = len(data) - keep
+        if rest > len(self._carry):
+            self.dropped += 1
+            rest = 0
+        if rest:
+            self._carry[:rest] = memoryview(data)[keep:]
+        self._carry_len = rest
+
+
+    def _scan(self, data):
+        """Call the handler for each complete cell returning the index of
+           the first byte which may be part of an incomplete one."""
+        end = len(data)
+        pos = 0
+        while True:
+            start = data.find(b"<t", pos)
+            if start < 0:
+                ### A final < could be the start of a tag
+                return end - 1 if end > pos and data[end - 1] == 0x3c else end
+            if start + 4 > end:
+                return start
+            tag = data[start + 2]
+            after = data[start + 3]
+            if ((tag != 0x64 and tag != 0x68)
+                    or (after != 0x3e and after not in self._WHITESPACE)):
+                pos = start + 2  ### <table>, <thead>, <tr>, etc
+                continue
+            tag_end = data.find(b">", start + 3)
+            if tag_end < 0:
+                return start
+            search = tag_end + 1
+            while True:
+                close = data.find(b"</t", search)
+                if close < 0 or close + 5 > end:
+                    return start
+                if data[close + 3] in (0x64, 0x68) and data[close + 4] == 0x3e:
+                    break
+                search = close + 3
+            self.cells += 1
+            self._handler(data[start + 1:start + 3], data,
+                          start + 3, tag_end, tag_end + 1, close)
+            pos = close + 5
+
+
 class CloudStatusGCP(CloudStatus):
     _DEFAULT_PRODUCTS = ["Google Compute Engine",
                          "Persistent Disk",
@@ -281,6 +408,7 @@ class CloudStatusGCP(CloudStatus):
                "outage": "o",
                "warning": "w",
                }
+    _STATE_MARKERS = [(b"__" + state.encode(), code) for state, code in _STATES.items()]
 
     def __init__(self, display_, *, products=None):
         gcp_products = self._DEFAULT_PRODUCTS if products is None else products
@@ -291,6 +419,9 @@ class CloudStatusGCP(CloudStatus):
         self._data_product_status_ts = None
         self._data_locations_init = False
         self._data_products_init = False
+        self._etag = None
+        self._last_modified = None
+        self.modified = True
 
         logo_text = Label(text="Google Cloud",
                           font=bitmap_font.load_font(SPARTAN_FONT_FILE),
@@ -303,13 +434,46 @@ class CloudStatusGCP(CloudStatus):
         self._name_logo.append(logo_tg)
 
 
+    def state(self):
+        """The data and validators from the last fetch for StatusCache."""
+        return {"etag": self._etag,
+                "last_modified": self._last_modified,
+                "locations": self._data_locations,
+                "status": self._data_product_status,
+                "ts": self._data_product_status_ts}
+
+
+    def restore_state(self, state):
+        """Use the data from a previous fetch, this allows fetch()
+           to make a conditional request."""
+        self._etag = state.get("etag")
+        self._last_modified = state.get("last_modified")
+        self._data_locations = state.get("locations")
+        self._data_product_status = state.get("status")
+        self._data_product_status_ts = state.get("ts")
+        if self._data_locations is None or self._data_product_status is None:
+            self._etag = self._last_modified = None
+
+
+    def problem(self):
+        """True if any product is not available in any location."""
+        return any(value not in ("a", None)
+                   for row in (self._data_product_status or [])
+                   for value in row)
+
+
     def fetch(self):
         ok = True
         response=None
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
         for _ in range(3):
             try:
-                d_print(2, "Fetching", self._url)
-                response = requests.get(self._url, timeout=GET_TIMEOUT_S)
+                d_print(2, "Fetching", self._url, headers)
+                response = requests.get(self._url, headers=headers, timeout=GET_TIMEOUT_S)
                 break
             except (RuntimeError, OSError) as ex:
                 print("Failed GET request", repr(ex))
@@ -319,83 +483,35 @@ class CloudStatusGCP(CloudStatus):
             raise ex
 
         d_print(4, "Response headers", response.headers)
+        if response.status_code == 304:
+            d_print(2, "Not modified")
+            response.close()
+            self.modified = False
+            self._data_product_status_ts = re.sub("^\w+,\s*", "", response.headers["date"])
+            return True
+        if response.status_code != 200:
+            d_print(1, "HTTP status", response.status_code)
+            response.close()
+            return False
+
+        self.modified = True
+        self._etag = response.headers.get("etag")
+        self._last_modified = response.headers.get("last-modified")
+        self._parse_found_header = False
+        self._parse_header_row = False
+        self._parse_locations = []
+        self._parse_product_status = []
+        self._parse_current_product = None
+        tokenizer = CellTokenizer(self._parse_cell)
         lump_count = 0
-        ### lump_size must be big enough to hold the opening tag
-        lump_size = 512
-        text_buffer = ""
-        trim_tb_size = 4096
-        node_count = 0
-        found_header = False
-        header_row = False
-        ### This is slow
-        tdth_s = re.compile(r"<(t[dh])(>|\s+[^>]*)>")
-        tdth_e = re.compile(r"</(t[dh])>")
-        locations = []
-        product_status = []
-        current_product = None
-        for lump in response.iter_content(lump_size):
-            ### CircuitPython supportsutf-8 decode() only, no latin_1
-            ### re library has some bugs with unicode and regular expression matching
-            ### https://github.com/adafruit/circuitpython/issues/6860
-            ### Stripping high bit chars for now
-            ##text_buffer += lump.decode()
-            text_buffer += "".join([chr(b) for b in lump if b <= 127])
+        for lump in response.iter_content(FETCH_LUMP_SIZE):
+            tokenizer.feed(lump)
             lump_count += 1
-            while True:
-                m_s = tdth_s.search(text_buffer)
-                m_e = tdth_e.search(text_buffer)
-                if m_s and m_e:
-                    if m_s.start() < m_e.start():
-                        ### TODO - check tags match
-                        tag = m_s.groups()[0]
-                        attr = m_s.groups()[1]
-                        node = text_buffer[m_s.end():m_e.start()]
-                        if not found_header:
-                            if tag == "th" and attr.find("__product") >= 0:
-                                found_header = True
-                                header_row = True
-
-                        elif header_row:
-                            ## TODO d_print(2, "HR TAG", tag, "ATTR", attr, "NODE", node)
-                            if tag == "th" and attr.find("__location") >= 0:
-                                locations.append(node)
-                            else:
-                                header_row = False
-
-                        if found_header and not header_row:
-                            if tag == "th" and attr.find("__product") >= 0:
-                                current_product = node
-                                if current_product in self._products:
-                                    product_status.append([current_product])
-                            elif current_product in self._products and tag == "td" and attr.find("__cell") >= 0:
-                                status = None
-                                for state in self._STATES:
-                                    if node.find("__" + state) >= 0:
-                                        status = self._STATES[state]
-                                product_status[-1].append(status)
-
-                        d_print(5, "TAG", tag, "ATTR", attr, "NODE", node)
-                        node_count += 1
-                    else:
-                        d_print(2, "Found end tag first")
-                    text_buffer = text_buffer[m_e.end():]
-                    continue
-
-
-                ### If there was just a start tag then trim to that
-                ### and carry on reading more lumps
-                if m_s:
-                    if m_s.start() > 0:
-                        text_buffer = text_buffer[m_s.start():]
-                    if len(text_buffer) > trim_tb_size:
-                        text_buffer = text_buffer[lump_size:]
-                    break
-
-                ### No start or end tags so discard and read more lumps
-                ##text_buffer = ""  ### THIS IS WRONG AS IT CAN KILL HALF A TAG
-                break
+        locations = self._parse_locations
+        product_status = self._parse_product_status
 
-        d_print(3, "lumps", lump_count, "of size", lump_size, "T?", node_count)
+        d_print(3, "lumps", lump_count, "of size", FETCH_LUMP_SIZE,
+                "cells", tokenizer.cells, "dropped", tokenizer.dropped)
         d_print(3, "locations", locations)
         d_print(3, "product_status", product_status)
 
@@ -420,6 +536,47 @@ class CloudStatusGCP(CloudStatus):
         return ok
 
 
+    @staticmethod
+    def _text(data, start, end):
+        ### CircuitPython supports utf-8 decode() only, no latin_1
+        ### so high bit chars are stripped
+        return bytes(b for b in data[start:end] if b <= 127).decode()
+
+
+    def _parse_cell(self, tag, data, attr_start, attr_end, node_start, node_end):
+        """Handler for CellTokenizer, only the cells in the table
+           of interest have their attributes or contents examined."""
+        is_th = tag == b"th"
+        if not self._parse_found_header:
+            if is_th and data.find(b"__product", attr_start, attr_end) >= 0:
+                self._parse_found_header = True
+                self._parse_header_row = True
+
+        elif self._parse_header_row:
+            if is_th and data.find(b"__location", attr_start, attr_end) >= 0:
+                self._parse_locations.append(self._text(data, node_start, node_end))
+            else:
+                self._parse_header_row = False
+
+        if self._parse_found_header and not self._parse_header_row:
+            if is_th and data.find(b"__product", attr_start, attr_end) >= 0:
+                self._parse_current_product = self._text(data, node_start, node_end)
+                if self._parse_current_product in self._products:
+                    self._parse_product_status.append([self._parse_current_product])
+            elif (self._parse_current_product in self._products
+                  and not is_th
+                  and data.find(b"__cell", attr_start, attr_end) >= 0):
+                status = None
+                for state, code in self._STATE_MARKERS:
+                    if data.find(state, node_start, node_end) >= 0:
+                        status = code
+                self._parse_product_status[-1].append(status)
+
+        if debug >= 5:
+            d_print(5, "TAG", tag, "ATTR", data[attr_start:attr_end],
+                    "NODE", data[node_start:node_end])
+
+
     def update_display(self):
         if not self._data_locations_init or not self._data_products_init:
             locations = products = None
@@ -455,6 +612,12 @@ except OSError:
 
 status_page = CloudStatusGCP(board.DISPLAY)
 
+### sleep_memory is only meaningful after waking from deep sleep
+cache = StatusCache(alarm.sleep_memory)
+last_state = cache.load() if alarm.wake_alarm is not None else None
+if last_state:
+    status_page.restore_state(last_state)
+
 while True:
     ### TODO - rework exception/retry strategy
     try:
@@ -466,12 +629,29 @@ while True:
         supervisor.reload()
 
     if fetch_ok:
-        status_page.update_display()
+        new_state = status_page.state()
+        unchanged_wakes = 0
+        if (last_state
+                and new_state["locations"] == last_state.get("locations")
+                and new_state["status"] == last_state.get("status")):
+            unchanged_wakes = last_state.get("unchanged_wakes", 0) + 1
+
+        ### e-ink refresh is slow and uses a lot of power so only do it
+        ### when the status changes or the timestamp is getting old
+        if unchanged_wakes == 0 or unchanged_wakes >= FORCE_REDRAW_WAKES:
+            d_print(1, "Updating display, modified", status_page.modified)
+            status_page.update_display()
+            unchanged_wakes = 0
+        else:
+            d_print(1, "Unchanged", unchanged_wakes, "modified", status_page.modified)
+        new_state["unchanged_wakes"] = unchanged_wakes
+        cache.save(new_state)
     else:
         print("Failed to parse GET request")
+        cache.clear()
 
     ### Deep sleep wake-up alarm
-    sleep_time = NORMAL_SLEEP_TIME_S
+    sleep_time = FREQUENT_SLEEP_TIME_S if status_page.problem() else NORMAL_SLEEP_TIME_S
     time_alarm = alarm.time.TimeAlarm(monotonic_time=time.monotonic() + sleep_time)
     alarm.exit_and_deep_sleep_until_alarms(time_alarm)
     ### Even on USB power this is never reached
@@ -0,0 +1,222 @@
+### moisture_lut.py v1.1
+### Lookup table calibration and oversampled reading for soil moisture sensors
+
+### copy this file to Pi Pico alongside soil-moisture.py
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### The RP2040 ADC is 12 bit with values scaled up to 16 bit by CircuitPython
+### so a 4096 entry table indexed by the top 12 bits covers everything,
+### the bottom 4 bits are used for linear interpolation between entries
+
+import array
+import struct
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    np = None
+
+
+LUT_BITS = 12
+LUT_SIZE = 1 << LUT_BITS
+FRAC_BITS = 16 - LUT_BITS
+FRAC_MASK = (1 << FRAC_BITS) - 1
+
+### File header is magic, version, typecode, scale, entry count
+_LUT_MAGIC = b"MLUT"
+_LUT_VERSION = 2
+_LUT_HEADER = "<4sBcHHI"  ### magic, version, typecode, scale, count, key
+_LUT_HEADER_LEN = struct.calcsize(_LUT_HEADER)
+
+### "B" stores half percent steps, "H" stores hundredths of a percent
+SCALES = {"B": 2, "H": 100}
+
+
+def params_key(*params):
+    """A 32 bit FNV-1a hash of the repr of the parameters a table was
+       built from, a saved table with a different key is not loaded."""
+    key = 0x811c9dc5
+    for byte in repr(params).encode():
+        key = ((key ^ byte) * 0x01000193) & 0xffffffff
+    return key
+
+
+class MoistureLUT:
+    """A lookup table mapping a 16 bit raw ADC value to a moisture percentage.
+       The table has one extra entry at the end to make interpolation of the
+       highest values branch free.
+    """
+
+    def __init__(self, table, typecode="B", key=0):
+        if typecode not in SCALES:
+            raise ValueError("Unsupported typecode: " + typecode)
+        if len(table) != LUT_SIZE + 1:
+            raise ValueError("Table must have {:d} entries".format(LUT_SIZE + 1))
+        self._table = table
+        self._typecode = typecode
+        self._scale = SCALES[typecode]
+        self._key = key
+
+    @classmethod
+    def from_function(cls, raw_to_percent, typecode="B", key=0):
+        """Build a table by sampling a raw_to_percent function (a fitted model)
+           at every table index.
+        """
+        scale = SCALES[typecode]
+        top = 100 * scale
+        table = array.array(typecode, [0] * (LUT_SIZE + 1))
+        for idx in range(LUT_SIZE + 1):
+            raw = min(65535, idx << FRAC_BITS)
+            table[idx] = min(top, max(0, round(raw_to_percent(raw) * scale)))
+        return cls(table, typecode, key)
+
+    @classmethod
+    def from_points(cls, points, typecode="B", key=0):
+        """Build a table from calibration points, a sequence of
+           (raw_adc, percent) tuples captured by the user.
+           Values are linearly interpolated between points and
+           held constant beyond the first and last points.
+        """
+        if len(points) < 2:
+            raise ValueError("At least two calibration points are needed")
+        pts = sorted(points)
+
+        def piecewise(raw):
+            if raw <= pts[0][0]:
+                return pts[0][1]
+            for (r1, p1), (r2, p2) in zip(pts, pts[1:]):
+                if raw <= r2:
+                    if r2 == r1:
+                        return p2
+                    return p1 + (p2 - p1) * (raw - r1) / (r2 - r1)
+            return pts[-1][1]
+
+        return cls.from_function(piecewise, typecode, key)
+
+    @classmethod
+    def load(cls, filename, key=None):
+        """Load a table previously written by save, returns None if the file
+           does not exist, is not a valid table or was saved with
+           a different key."""
+        try:
+            with open(filename, "rb") as fh:
+                header = fh.read(_LUT_HEADER_LEN)
+                if len(header) != _LUT_HEADER_LEN:
+                    return None
+                (magic, version,
+                 typecode, _, count, file_key) = struct.unpack(_LUT_HEADER, header)
+                typecode = typecode.decode()
+                if (magic != _LUT_MAGIC or version != _LUT_VERSION
+                        or typecode not in SCALES or count != LUT_SIZE + 1
+                        or (key is not None and file_key != key)):
+                    return None
+                table = array.array(typecode, [0] * count)
+                if fh.readinto(table) != count * table.itemsize:
+                    return None
+        except (OSError, ValueError):
+            return None
+        return cls(table, typecode, file_key)
+
+    def save(self, filename):
+        """Write the table to flash, returns False if the filesystem is
+           read-only (the CIRCUITPY default without a boot.py remount)."""
+        try:
+            with open(filename, "wb") as fh:
+                fh.write(struct.pack(_LUT_HEADER, _LUT_MAGIC, _LUT_VERSION,
+                                     self._typecode.encode(), self._scale,
+                                     len(self._table), self._key))
+                fh.write(self._table)
+        except OSError:
+            return False
+        return True
+
+    def raw_to_percent(self, raw_adc):
+        """Convert a raw 16 bit value to a percentage using
+           interpolation between adjacent table entries."""
+        raw = int(raw_adc)
+        idx = raw >> FRAC_BITS
+        frac = raw & FRAC_MASK
+        low = self._table[idx]
+        return (low + (((self._table[idx + 1] - low) * frac) >> FRAC_BITS)) / self._scale
+
+    @property
+    def table(self):
+        return self._table
+
+    @property
+    def typecode(self):
+        return self._typecode
+
+    @property
+    def key(self):
+        return self._key
+
+
+class OverSampler:
+    """Take many readings from an analogio.AnalogIn into a preallocated
+       buffer and reduce them to one value with a median or a trimmed mean.
+       trim is the fraction discarded from each end for the trimmed mean.
+    """
+
+    def __init__(self, samples=64, *, reduction="median", trim=0.25):
+        if reduction not in ("median", "trimmed", "mean"):
+            raise ValueError("Unknown reduction: " + reduction)
+        self._samples = samples
+        self._reduction = reduction
+        self._trim = int(samples * trim)
+        if samples - 2 * self._trim < 1:
+            raise ValueError("trim is too large for samples")
+        if np is not None:
+            self._buffer = np.zeros(samples, dtype=np.uint16)
+        else:
+            self._buffer = array.array("H", [0] * samples)
+
+    def read(self, ain):
+        buf = self._buffer
+        for idx in range(self._samples):
+            buf[idx] = ain.value
+        return self.reduce()
+
+    def reduce(self):
+        buf = self._buffer
+        if self._reduction == "mean":
+            return sum(buf) / self._samples
+
+        ### ulab's sort is in C, the fallback sorted() has to allocate a list
+        ordered = np.sort(buf) if np is not None else sorted(buf)
+        if self._reduction == "median":
+            mid = self._samples // 2
+            if self._samples % 2:
+                return float(ordered[mid])
+            return (ordered[mid - 1] + ordered[mid]) / 2
+
+        kept = self._samples - 2 * self._trim
+        total = 0
+        for idx in range(self._trim, self._trim + kept):
+            total += ordered[idx]
+        return total / kept
+
+    @property
+    def buffer(self):
+        return self._buffer
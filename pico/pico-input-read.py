@@ -1,4 +1,4 @@
-### pico-input-read v1.2
+### pico-input-read v1.3
 ### Respond to simple serial commands with digital or analogue gpio
 
 ### Tested on Pi Pico W vs Pi Pico 2 W both running CircuitPython 10.1.3
@@ -33,6 +33,8 @@
 ### Responses to commands sent over a serial/UART connection
 ### with digital or adc value from GP26
 ### Multiple read commands addded for noise analysis
+### Commands can have a sequence number suffix, e.g. A#12,
+### which is returned at the start of the response, e.g. #12,1234.5
 
 ### Relevant Errata: RP2350-9 and RP2040-E11
 
@@ -105,8 +107,9 @@ while True:
     except (AttributeError, UnicodeError):
         cmds = []
 
-    for cmd in cmds:
+    for cmd_seq in cmds:
         value = None
+        cmd, _, seq = cmd_seq.partition("#")
         if cmd in (READ_ANA_CMD, READM_ANA_CMD):
             ### Ensure input is correct type
             if not isinstance(gpio, analogio.AnalogIn):
@@ -133,4 +136,7 @@ while True:
         elif len(cmd) > 0:
             value = ""
         if value is not None:
-            serial.write(f"{value}\n".encode("utf-8"))
+            if seq:
+                serial.write(f"#{seq},{value}\n".encode("utf-8"))
+            else:
+                serial.write(f"{value}\n".encode("utf-8"))
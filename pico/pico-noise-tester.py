@@ -1,4 +1,4 @@
-### pico-noise-tester v1.0
+### pico-noise-tester v1.2
 ### Another attempt at looking at noise between RP2040 and RP2350
 
 ### Tested on Pi Pico W vs Pi Pico 2 W both running CircuitPython 10.1.3
@@ -33,7 +33,10 @@
 
 ### Relevant Errata: RP2350-9
 
+import array
 import gc
+import math
+import struct
 import time
 
 import analogio
@@ -84,6 +87,24 @@ SETTLE_TIME_S = 5 * (IMP_GPIO + RCF_R) * RCF_C
 READ_ANA_CMD = "A"
 READ_DIG_CMD = "D"
 
+### pico-input-read.py v1.3 or later is needed for the sequence numbers
+SEQ_MODULO = 10000
+
+### Binary records are written to this file if CIRCUITPY is writeable
+### and are always printed as CSV, BATCH_RECORDS at a time
+OUTPUT_BIN_FILENAME = "/noise-tester.bin"
+BATCH_RECORDS = 50
+### start_ns, test_idx, dc_value, int_adc_smout, ext_adc_smout,
+### int_adc_res_smout, ext_adc_res_smout, input, rem_adc_res_smout,
+### c_pwm, sequential, rep_idx - NaN is used for NA values
+RECORD_FMT = "<QIHffffcfBBB"
+RECORD_LEN = struct.calcsize(RECORD_FMT)
+### local values are filled in after the record is added for the
+### command tag and the remote value when the response arrives
+LOCAL_FIELDS_FMT = "<ffff"
+LOCAL_FIELDS_OFFSET = struct.calcsize("<QIH")
+REM_FIELD_OFFSET = struct.calcsize("<QIHffffc")
+
 serial = busio.UART(tx=SERIAL_TX_PIN, rx=SERIAL_RX_PIN,
                     baudrate=SERIAL_BAUDRATE, timeout=RESPONSE_CHAR_WAIT_S)
 
@@ -122,16 +143,168 @@ except RuntimeError:
     pass
 
 SAMPLE_COUNT = 32
-samples = [0] * SAMPLE_COUNT
+TRIM_COUNT = 2  ### this must be 2 for get_sample
+samples = array.array("H", [0] * SAMPLE_COUNT)
 def get_sample(ana):
+    """Return the mean of SAMPLE_COUNT readings discarding the
+       lowest two and highest two for an IQR style arithmetic mean.
+       The extremes are found in one pass rather than with a sort."""
     for idx in range(SAMPLE_COUNT):
         samples[idx] = ana.value
-    samples.sort()
-    total = 0
-    ### Discard bottom few and top few for IQR style arithmetic mean
-    for idx in range(2, SAMPLE_COUNT - 2):
-        total += samples[idx]
-    return total / (SAMPLE_COUNT - 4)
+
+    low1 = low2 = 65536
+    high1 = high2 = -1
+    for value in samples:
+        if value < low2:
+            if value < low1:
+                low1, low2 = value, low1
+            else:
+                low2 = value
+        if value > high2:
+            if value > high1:
+                high1, high2 = value, high1
+            else:
+                high2 = value
+    return (sum(samples) - low1 - low2 - high1 - high2) / (SAMPLE_COUNT - 2 * TRIM_COUNT)
+
+
+def nan_to_na(value):
+    return NOT_AVAIL if value != value else value  ### NaN is not equal to itself
+
+
+class RemotePipeline:
+    """Send commands to the remote Pico with sequence numbers without
+       waiting for the response. Responses are collected with non-blocking
+       reads and matched to a tag supplied with the command.
+       The caller decides how many are in flight with wait() as the
+       experiment must control what overlaps with the local reads.
+    """
+
+    def __init__(self, uart, timeout_s=RESPONSE_CHAR_WAIT_S * 4):
+        self._uart = uart
+        self._timeout_ns = round(timeout_s * 1e9)
+        self._seq = 0
+        self._pending = {}
+        self._rx = bytearray(256)
+        self._rx_len = 0
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def send(self, cmd, tag, callback):
+        """Send cmd, callback(tag, response_value) is called from poll
+           with the first field of the response or None on timeout."""
+        seq = self._seq
+        self._seq = (seq + 1) % SEQ_MODULO
+        self._pending[seq] = (tag, callback, time.monotonic_ns())
+        self._uart.write("{:s}#{:d}\n".format(cmd, seq).encode("utf-8"))
+
+    def poll(self):
+        """Process any complete responses and expire old requests."""
+        waiting = self._uart.in_waiting
+        if waiting:
+            space = len(self._rx) - self._rx_len
+            mv = memoryview(self._rx)
+            got = self._uart.readinto(mv[self._rx_len:self._rx_len + min(waiting, space)])
+            if got:
+                self._rx_len += got
+
+            start = 0
+            while True:
+                eol = self._rx.find(b"\n", start, self._rx_len)
+                if eol < 0:
+                    break
+                self._process_line(bytes(mv[start:eol]))
+                start = eol + 1
+            if start:
+                self._rx[0:self._rx_len - start] = self._rx[start:self._rx_len]
+                self._rx_len -= start
+            elif self._rx_len == len(self._rx):
+                self._rx_len = 0  ### discard a line too long to be valid
+
+        if self._pending:
+            now_ns = time.monotonic_ns()
+            for seq in [s for s, (_, _, sent_ns) in self._pending.items()
+                        if now_ns - sent_ns > self._timeout_ns]:
+                tag, callback, _ = self._pending.pop(seq)
+                callback(tag, None)
+
+    def _process_line(self, line):
+        try:
+            if not line.startswith(b"#"):
+                return
+            seq_b, value_b = line[1:].split(b",", 2)[:2]
+            entry = self._pending.pop(int(seq_b), None)
+        except ValueError:
+            return
+        if entry is not None:
+            tag, callback, _ = entry
+            callback(tag, value_b.decode("utf-8").strip())
+
+    def wait(self, duration_s=None):
+        """Process responses for duration_s seconds or until
+           there are none in flight if duration_s is None."""
+        if duration_s is None:
+            while self._pending:
+                self.poll()
+        else:
+            end_ns = time.monotonic_ns() + round(duration_s * 1e9)
+            while time.monotonic_ns() < end_ns:
+                self.poll()
+
+
+class ResultBatch:
+    """A preallocated buffer of binary records which are flushed to a file and
+       printed as CSV in batches."""
+
+    def __init__(self, records, out_file=None):
+        self._buffer = bytearray(RECORD_LEN * records)
+        self._records = records
+        self._count = 0
+        self._out_file = out_file
+
+    @property
+    def full(self):
+        return self._count == self._records
+
+    def add(self, *fields):
+        offset = self._count * RECORD_LEN
+        struct.pack_into(RECORD_FMT, self._buffer, offset, *fields)
+        self._count += 1
+        return offset
+
+    def set_local(self, offset, values):
+        struct.pack_into(LOCAL_FIELDS_FMT, self._buffer,
+                         offset + LOCAL_FIELDS_OFFSET, *values)
+
+    def set_remote(self, offset, value):
+        struct.pack_into("<f", self._buffer, offset + REM_FIELD_OFFSET, value)
+
+    def flush(self):
+        if not self._count:
+            return
+        used = memoryview(self._buffer)[:self._count * RECORD_LEN]
+        if self._out_file:
+            self._out_file.write(used)
+            self._out_file.flush()
+        lines = []
+        for offset in range(0, self._count * RECORD_LEN, RECORD_LEN):
+            (start_ns, test_idx, dc_value, int_adc_smout, ext_adc_smout,
+             int_adc_res_smout, ext_adc_res_smout, cmd, rem_adc_res_smout,
+             c_pwm, sequential, rep_idx) = struct.unpack_from(RECORD_FMT, self._buffer, offset)
+            lines.append(",".join(str(v) for v in (start_ns, test_idx, dc_value,
+                                                   int_adc_smout,
+                                                   nan_to_na(ext_adc_smout),
+                                                   int_adc_res_smout,
+                                                   nan_to_na(ext_adc_res_smout),
+                                                   cmd.decode("utf-8"),
+                                                   nan_to_na(rem_adc_res_smout),
+                                                   "T" if c_pwm else "F",
+                                                   "T" if sequential else "F",
+                                                   rep_idx)))
+        print("\n".join(lines))
+        self._count = 0
 
 
 def triangle_waveform(step):
@@ -193,58 +366,90 @@ print(",".join(["start_ns",
                 "sequential",
                 "rep_idx"]))
 
+try:
+    out_file = open(OUTPUT_BIN_FILENAME, "ab")
+except OSError:
+    out_file = None
+
+pipeline = RemotePipeline(serial)
+results = ResultBatch(BATCH_RECORDS, out_file)
+
+
+def remote_response(cmd):
+    def store_response(offset, resp):
+        try:
+            ### Digital value comes back as integer 0 or 1
+            value = int(resp) if cmd == READ_DIG_CMD else float(resp)
+        except (TypeError, ValueError):
+            value = math.nan
+        results.set_remote(offset, value)
+    return store_response
+
+
+def local_reads():
+    ### Voltage is used for ADS1115 as it has variable gain and
+    ### an internal voltage reference
+    return (get_sample(adc_smout),
+            tiads_smout.voltage if tiads_smout else math.nan,
+            get_sample(adc_res_smout),
+            tiads_res_smout.voltage if tiads_res_smout else math.nan)
+
+
 cycle_count = 0
 while True:
     for continuous_pwm in (True, False):
         pwm_out = pwm_init(0) if continuous_pwm else None
         for cmd in (READ_ANA_CMD,):
+            store_response = remote_response(cmd)
+            cmd_byte = cmd.encode("utf-8")
             for step_gen in [rp2040adcdnl()]:
                 gc.collect()
                 cycle_count += 1
-                cmd_b = cmd.encode('utf-8') + bytes([ord("\n")])
                 for dc_value in step_gen:
+                    ### Responses from the previous step must all be in
+                    ### before the output changes or the remote Pico could
+                    ### read the new value for the old record
+                    pipeline.wait()
                     if continuous_pwm:
                         pwm_out.duty_cycle = dc_value
-                        time.sleep(SETTLE_TIME_S)
+                        pipeline.wait(SETTLE_TIME_S)
                     else:
                         ### This is only appropriate for large capacitors like 470uF
                         pwm_out = pwm_init(dc_value)
-                        time.sleep(SETTLE_TIME_S)
+                        pipeline.wait(SETTLE_TIME_S)
                         pwm_out.deinit()  ### return to high impedance input
 
                     for rep_idx in range(1, 5 + 1):
                         for method in ("parallel", "sequential"):
+                            if results.full:
+                                pipeline.wait()
+                                results.flush()
+                            if method == "sequential":
+                                ### Parallel request must be complete
+                                ### before the sequential local reads
+                                pipeline.wait()
+
                             start_ns = time.monotonic_ns()
-                            ### Voltage is used for ADS1115 as it has variable gain and
-                            ### an internal voltage reference
                             if method == "parallel":
-                                ### Issues read ADC or read digital input command
+                                ### Issue read ADC or read digital input command
                                 ### to remote Pi Pico 2 then
                                 ### do local reads while that's being sent/processed
-                                serial.write(cmd_b)
-
-                                int_adc_smout = get_sample(adc_smout)
-                                ext_adc_smout = tiads_smout.voltage if tiads_smout else NOT_AVAIL
-                                int_adc_res_smout = get_sample(adc_res_smout)
-                                ext_adc_res_smout = tiads_res_smout.voltage if tiads_res_smout else NOT_AVAIL
+                                offset = results.add(start_ns, cycle_count, dc_value,
+                                                     0.0, 0.0, 0.0, 0.0,
+                                                     cmd_byte, math.nan,
+                                                     continuous_pwm, False, rep_idx)
+                                pipeline.send(cmd, offset, store_response)
+                                local = local_reads()
                             else:
-                                int_adc_smout = get_sample(adc_smout)
-                                ext_adc_smout = tiads_smout.voltage if tiads_smout else NOT_AVAIL
-                                int_adc_res_smout = get_sample(adc_res_smout)
-                                ext_adc_res_smout = tiads_res_smout.voltage if tiads_res_smout else NOT_AVAIL
-
-                                serial.write(cmd_b)
-
-                            resp = serial.readline()  ### The timeout on the serial object does not work in all cases
-
-                            try:
-                                rars_str = resp.decode("utf-8").split(",")[0]
-                                ### Digital value comes back as integer 0 or 1
-                                rem_adc_res_smout = (int(rars_str) if cmd == READ_DIG_CMD
-                                                     else float(rars_str))
-                            except (AttributeError, UnicodeError, ValueError):
-                                rem_adc_res_smout = NOT_AVAIL
-
-                            sequential = "T" if method != "parallel" else "F"
-                            c_pwm = "T" if continuous_pwm else "F"
-                            print(f"{start_ns},{cycle_count},{dc_value},{int_adc_smout},{ext_adc_smout},{int_adc_res_smout},{ext_adc_res_smout},{cmd},{rem_adc_res_smout},{c_pwm},{sequential},{rep_idx}")
+                                local = local_reads()
+                                offset = results.add(start_ns, cycle_count, dc_value,
+                                                     0.0, 0.0, 0.0, 0.0,
+                                                     cmd_byte, math.nan,
+                                                     continuous_pwm, True, rep_idx)
+                                pipeline.send(cmd, offset, store_response)
+                                ### No overlap with the next local reads
+                                pipeline.wait()
+                            results.set_local(offset, local)
+
+                pipeline.wait()
+                results.flush()
@@ -1,7 +1,10 @@
-### servo-current-mcp3208 v1.4
+### servo-current-mcp3208 v1.7
 
 ### Measuring servo current using MCP3208 and optional external LM385 vref
 
+### Button A takes a fixed capture of samples, button B arms a trigger
+### for a capture of a current transient with pre-trigger samples
+
 ### Copy this file to EDU PICO board as code.py
 ### Potentiometer should be turned towards 0 to avoid exceeding
 ### ADC vref if lowered below 3.3V
@@ -96,6 +99,30 @@ console = False
 stats = True
 output_type = "bin"
 
+### The "bin" output is a header per capture of
+### magic b"SVC1", record count (uint32), period in ns (uint32),
+### number of MCP3208 channels (uint8) and 3 bytes padding
+### followed by one record per sample of
+### time in us from start (uint32), deviation from target time in us (int16),
+### RP2040 value (uint16), RP2040 value in PWM mode (uint16)
+### and then a uint16 for each MCP3208 channel, all little-endian
+BIN_HEADER_FMT = "<4sIIB3x"
+BIN_RECORD_FMT = "<IhHH"
+BIN_CHANNEL_FMT = "<H"
+RECORDS_PER_WRITE = 64
+
+### Transient capture on first MCP_BURST_CHANNELS channel
+### TRIGGER_LEVEL is a 16 bit scaled value like AnalogIn
+### TRIGGER_EDGE is "rising", "falling" or "level"
+TRANSIENT_SAMPLES = 512
+TRANSIENT_RATE = 2000  ### Hz
+TRIGGER_LEVEL = 400 << 4
+TRIGGER_EDGE = "rising"
+PRE_TRIGGER_FRACTION = 0.25
+### A transient has settled when it stays within this of the final value
+SETTLE_TOLERANCE = 8 << 4
+TRANSIENT_SHOW_TIME = 10.0  ### seconds or until a button is pressed
+
 ### CIRCUITPY will only be writeable if boot.py has made it so
 try:
     file_number = 1
@@ -149,6 +176,9 @@ spi = busio.SPI(clock=SPI_SCK, MISO=SPI_RX, MOSI=SPI_TX)
 cs = digitalio.DigitalInOut(SPI_CS)
 mcp = MCP.MCP3208(spi, cs, ref_voltage=LM385_REFV)
 ch0_adc = MCPAnalogIn(mcp, MCP.P0)
+### Channels read in a burst during sampling, first one is the servo current
+MCP_BURST_CHANNELS = (0,)
+MCP_BAUDRATE = 1_000_000
 edu_pico_pot = analogio.AnalogIn(EDU_PICO_POT_PIN)
 int_adc = analogio.AnalogIn(ADC_PIN)
 
@@ -196,50 +226,118 @@ display.auto_refresh = False
 display.root_group = main_group
 display.refresh()
 
-DEF_SAMPLE_COUNT = 200
+DEF_SAMPLE_COUNT = 1000
+DEF_SAMPLE_RATE = 500  ### Hz
 
 ### 'Q' is 8 bytes in size, 'L' is only 4 on CircuitPython with RP2040
+### microseconds in 'L' is fine for over an hour of sampling
 int_values_std = np.zeros(DEF_SAMPLE_COUNT, dtype=np.uint16)
-int_values_std_ts = array.array('Q', int_values_std)
-mcp_values = np.zeros(DEF_SAMPLE_COUNT, dtype=np.uint16)
-mcp_values_ts = array.array('Q', mcp_values)
+mcp_values = [np.zeros(DEF_SAMPLE_COUNT, dtype=np.uint16)
+              for _ in MCP_BURST_CHANNELS]
 int_values_lown = np.zeros(DEF_SAMPLE_COUNT, dtype=np.uint16)
-int_values_lown_ts = array.array('Q', int_values_lown)
+sample_ts_us = array.array('L', [0] * DEF_SAMPLE_COUNT)
+
+
+class MCP3208Burst:
+    """Read several MCP3208 channels directly over SPI with preallocated
+       buffers, holding the SPI lock for the duration of a capture
+       rather than per reading like adafruit_mcp3xxx.
+       Values are scaled to 16 bit to match adafruit_mcp3xxx.
+    """
+
+    def __init__(self, spi_bus, chip_select, channels, *, baudrate=MCP_BAUDRATE):
+        self._spi = spi_bus
+        self._cs = chip_select
+        self._baudrate = baudrate
+        ### Start bit, single-ended and the channel number spread over
+        ### two bytes so the 12 bit result is right aligned in last two bytes
+        self._out_bufs = [bytes((0x06 | (ch >> 2), (ch & 0x03) << 6, 0x00))
+                          for ch in channels]
+        self._in_buf = bytearray(3)
+
+    def __enter__(self):
+        while not self._spi.try_lock():
+            pass
+        self._spi.configure(baudrate=self._baudrate, polarity=0, phase=0)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._spi.unlock()
+
+    def read_into(self, dests, idx):
+        in_buf = self._in_buf
+        for dest, out_buf in zip(dests, self._out_bufs):
+            self._cs.value = False
+            self._spi.write_readinto(out_buf, in_buf)
+            self._cs.value = True
+            dest[idx] = (((in_buf[1] & 0x0f) << 8) | in_buf[2]) << 4
+
+    def read_one(self, chan_idx=0):
+        in_buf = self._in_buf
+        self._cs.value = False
+        self._spi.write_readinto(self._out_bufs[chan_idx], in_buf)
+        self._cs.value = True
+        return (((in_buf[1] & 0x0f) << 8) | in_buf[2]) << 4
+
+
+mcp_burst = MCP3208Burst(spi, cs, MCP_BURST_CHANNELS)
+
+
+def read_samples(cnt, period_ns):
+    """Take cnt samples paced against absolute target times
+       of period_ns apart so timing errors do not accumulate.
+       Returns the number of samples which started late by more than a period.
+    """
+    late = 0
+    with mcp_burst:
+        t_start = time.monotonic_ns() + period_ns
+        deadline = t_start
+        for idx in range(cnt):
+            t_sample = time.monotonic_ns()
+            while t_sample < deadline:
+                t_sample = time.monotonic_ns()
+
+            int_values_std[idx] = int_adc.value
+            mcp_burst.read_into(mcp_values, idx)
+            pico_ps_pwm_enable.value = True
+            int_values_lown[idx] = int_adc.value
+            pico_ps_pwm_enable.value = False
+
+            sample_ts_us[idx] = (t_sample - t_start) // 1000
+            if t_sample - deadline > period_ns:
+                late += 1
+            deadline += period_ns
+    return late
+
+
+def jitter_us(idx, period_ns):
+    """Difference between actual and target time for a sample in us."""
+    return sample_ts_us[idx] - (idx * period_ns) // 1000
+
+
+def output_samples(cnt, period_ns, *, pad=" ", pad_len=0, end=b"\x0d\x0a", encoding="ascii"):
+    """Write samples to console and/or data_file, the binary output is
+       packed into one preallocated buffer and written in large chunks."""
+
+    fixed_len = struct.calcsize(BIN_RECORD_FMT)
+    chan_len = struct.calcsize(BIN_CHANNEL_FMT)
+    rec_len = fixed_len + chan_len * len(MCP_BURST_CHANNELS)
+    out_bytes = bytearray(rec_len * RECORDS_PER_WRITE)
+    out_mv = memoryview(out_bytes)
+    offset = 0
+
+    if data_file and output_type == "bin":
+        data_file.write(struct.pack(BIN_HEADER_FMT, b"SVC1",
+                                    cnt, period_ns, len(MCP_BURST_CHANNELS)))
 
-
-def read_samples(cnt, dly):
     for idx in range(cnt):
-        t_int_value_std = time.monotonic_ns()
-        int_value_std = int_adc.value
-
-        t_mcp_value = time.monotonic_ns()
-        mcp_value = ch0_adc.value
-
-        pico_ps_pwm_enable.value = True
-        t_int_value_lown = time.monotonic_ns()
-        int_value_lown = int_adc.value
-        pico_ps_pwm_enable.value = False
-
-        ### Store values in arrays
-        int_values_std[idx] = int_value_std
-        int_values_std_ts[idx] = t_int_value_std - start_ns
-        mcp_values[idx] = mcp_value
-        mcp_values_ts[idx] = t_mcp_value - start_ns
-        int_values_lown[idx] = int_value_lown
-        int_values_lown_ts[idx] = t_int_value_lown - start_ns
-
-        time.sleep(dly)
-
-
-def output_samples(cnt, *, pad=" ", pad_len=0, end=b"\x0d\x0a", encoding="ascii"):
-
-    for idx in range(cnt):
-        out_bytes = bytearray()
-        for name, timestamps, values in (("RP2040 GP27", int_values_std_ts, int_values_std),
-                                         ("MCP3208 CH0", mcp_values_ts, mcp_values),
-                                         ("RP2040 GP27 PFM", int_values_lown_ts, int_values_lown)
-                                        ):
-            text = '{:d},{:d},"{:s}",{:d}'.format(timestamps[idx], idx, name, values[idx])
+        jitter = jitter_us(idx, period_ns)
+        if console or (data_file and output_type == "csv"):
+            text = '{:d},{:d},{:d},{:d},{:d}'.format(sample_ts_us[idx], idx, jitter,
+                                                     int_values_std[idx],
+                                                     int_values_lown[idx])
+            for values in mcp_values:
+                text += ",{:d}".format(values[idx])
 
             if pad and pad_len:
                 line_text = text + " " * (pad_len - len(text) - len(end))
@@ -248,24 +346,34 @@ def output_samples(cnt, *, pad=" ", pad_len=0, end=b"\x0d\x0a", encoding="ascii"
 
             if console:
                 print(line_text)
-            if data_file:
-                if output_type == "csv":
-                    out_bytes += line_text.encode(encoding) + end
-                elif output_type == "bin":
-                    ### TODO - implement padding
-                    out_bytes += struct.pack("!fH", timestamps[idx] * 1e-9, values[idx])
-
-        if data_file:
-            data_file.write(out_bytes)
+            if data_file and output_type == "csv":
+                data_file.write(line_text.encode(encoding) + end)
+
+        if data_file and output_type == "bin":
+            struct.pack_into(BIN_RECORD_FMT, out_bytes, offset,
+                             sample_ts_us[idx], max(-32768, min(32767, jitter)),
+                             int_values_std[idx], int_values_lown[idx])
+            offset += fixed_len
+            for values in mcp_values:
+                struct.pack_into(BIN_CHANNEL_FMT, out_bytes, offset, values[idx])
+                offset += chan_len
+            if offset == len(out_bytes):
+                data_file.write(out_bytes)
+                offset = 0
 
     if data_file:
+        if offset:
+            data_file.write(out_mv[:offset])
         data_file.flush()
 
     if stats:
         npfuncs = (np.min, np.mean, np.median, np.max, np.std)
         print("INT STD", [fn(int_values_std[:cnt]) for fn in npfuncs])
-        print("MCP3208", [fn(mcp_values[:cnt]) for fn in npfuncs])
+        for ch, values in zip(MCP_BURST_CHANNELS, mcp_values):
+            print("MCP3208 CH{:d}".format(ch), [fn(values[:cnt]) for fn in npfuncs])
         print("INT LWN", [fn(int_values_lown[:cnt]) for fn in npfuncs])
+        jitters = np.array([jitter_us(idx, period_ns) for idx in range(cnt)])
+        print("JITTER us", [fn(jitters) for fn in npfuncs])
 
 
 def display_message(new_text):
@@ -299,18 +407,190 @@ def adc_plot_value(value_16b):
         return round(math.log(value) * 4.6 + 24.7)  ### 48 to 63
 
 
-def multiple_samples(count=DEF_SAMPLE_COUNT, delay=0.045):
+def multiple_samples(count=DEF_SAMPLE_COUNT, rate=DEF_SAMPLE_RATE):
+    period_ns = round(1e9 / rate)
     gc.collect()
-    display_message("Sampling\nfor 10s")
+    display_message("Sampling\nfor {:.1f}s".format(count / rate))
     time.sleep(1)
-    read_samples(count, delay)
+    late = read_samples(count, period_ns)
+    if late:
+        print("Late samples:", late)
     display_message("Writing")
-    output_samples(count, pad_len=64)
+    output_samples(count, period_ns, pad_len=64)
     display_message("Complete")
     time.sleep(1)
     display_message(None)
 
 
+class TransientCapture:
+    """An oscilloscope style capture of one channel into a circular buffer
+       which fills continuously until a trigger then stops after the
+       post-trigger samples leaving pre-trigger samples in the buffer.
+    """
+
+    def __init__(self, size, rate, *, level, edge="rising", pre_fraction=0.25):
+        if edge not in ("rising", "falling", "level"):
+            raise ValueError("Unknown edge: " + edge)
+        self._size = size
+        self._period_ns = round(1e9 / rate)
+        self.level = level
+        self.edge = edge
+        self._pre = min(round(size * pre_fraction), size - 1)
+        self._buffer = np.zeros(size, dtype=np.uint16)
+        self.samples = None  ### time ordered samples after a capture
+
+    def _triggered(self, prev_value, value):
+        if self.edge == "rising":
+            return prev_value < self.level <= value
+        if self.edge == "falling":
+            return prev_value > self.level >= value
+        return value >= self.level
+
+    def capture(self, burst, abort=None):
+        """Sample until triggered and post-trigger samples are taken,
+           abort is polled periodically and returns False if it aborts.
+        """
+        buf = self._buffer
+        size = self._size
+        idx = 0
+        filled = 0
+        prev_value = None
+        remaining = None  ### post-trigger samples left to take
+        period_ns = self._period_ns
+        with burst:
+            deadline = time.monotonic_ns()
+            while remaining != 0:
+                t_sample = time.monotonic_ns()
+                while t_sample < deadline:
+                    t_sample = time.monotonic_ns()
+                deadline += period_ns
+
+                value = burst.read_one()
+                buf[idx] = value
+                idx = (idx + 1) % size
+                if remaining is None:
+                    filled += 1
+                    ### trigger sample ends up at index _pre with _pre
+                    ### samples before it and the rest after it
+                    if (filled > self._pre and prev_value is not None
+                            and self._triggered(prev_value, value)):
+                        remaining = size - self._pre - 1
+                    elif idx == 0 and abort is not None and abort():
+                        return False
+                    prev_value = value
+                else:
+                    remaining -= 1
+
+        ### oldest sample is at idx after the last write
+        self.samples = np.concatenate((buf[idx:], buf[:idx]))
+        return True
+
+    @property
+    def trigger_index(self):
+        return self._pre
+
+    @property
+    def period_ns(self):
+        return self._period_ns
+
+    def summary(self, tolerance=SETTLE_TOLERANCE):
+        """Return a dict of statistics for the captured transient, the RMS is
+           of the deviation from the pre-trigger mean."""
+        samples = np.array(self.samples, dtype=np.float)
+        baseline = np.mean(samples[:self._pre]) if self._pre else samples[0]
+        post = samples[self._pre:]
+        deviation = post - baseline
+        rms = np.sqrt(np.mean(deviation * deviation))
+
+        tail = post[-max(1, len(post) // 10):]
+        final = np.mean(tail)
+        outside = np.array(abs(post - final) > tolerance, dtype=np.uint8)
+        if np.max(outside):
+            ### Last sample outside tolerance found by searching from the end
+            last_out = len(outside) - 1 - np.argmax(outside[::-1])
+            settling_ns = (last_out + 1) * self._period_ns
+        else:
+            settling_ns = 0
+
+        return {"baseline": baseline,
+                "peak": np.max(post),
+                "peak_ms": np.argmax(post) * self._period_ns / 1e6,
+                "rms": rms,
+                "final": final,
+                "settling_ms": settling_ns / 1e6}
+
+    def plot(self, bitmap):
+        """Draw the capture on a 2 colour bitmap with a min/max
+           vertical line for each column and a tick for the trigger."""
+        bitmap.fill(0)
+        width = bitmap.width
+        height = bitmap.height
+        samples = self.samples
+        low = np.min(samples)
+        span = max(np.max(samples) - low, 1)
+        per_col = self._size / width
+        for x in range(width):
+            first = int(x * per_col)
+            column = samples[first:max(first + 1, int((x + 1) * per_col))]
+            y_top = height - 1 - int((np.max(column) - low) * (height - 1) / span)
+            y_bottom = height - 1 - int((np.min(column) - low) * (height - 1) / span)
+            for y in range(y_top, y_bottom + 1):
+                bitmap[x, y] = 1
+        trig_x = int(self._pre / per_col)
+        for y in range(0, height, 4):
+            bitmap[trig_x, y] = 1
+
+
+transient = TransientCapture(TRANSIENT_SAMPLES, TRANSIENT_RATE,
+                             level=TRIGGER_LEVEL, edge=TRIGGER_EDGE,
+                             pre_fraction=PRE_TRIGGER_FRACTION)
+
+
+def any_button():
+    return yellow_button_a() or cyan_button_b()
+
+
+def transient_capture():
+    """Wait for a trigger then summarise and plot the transient,
+       pressing a button while armed cancels it."""
+    while any_button():
+        pass
+    gc.collect()
+    display_message("Armed\n{:s} {:d}".format(transient.edge, transient.level >> 4))
+    if not transient.capture(mcp_burst, abort=any_button):
+        display_message("Cancelled")
+        time.sleep(1)
+        display_message(None)
+        return
+
+    summary = transient.summary()
+    print("TRANSIENT", summary)
+    display_message(None)
+    transient.plot(simple_plot_bmp)
+    left_num.text = "{:d}".format(round(summary["peak"]) >> 4)
+    right_num.text = "{:4d} {:5.1f}".format(round(summary["rms"]) >> 4,
+                                            summary["settling_ms"])
+    display.refresh()
+
+    while any_button():
+        pass
+    end_ns = time.monotonic_ns() + round(TRANSIENT_SHOW_TIME * 1e9)
+    while time.monotonic_ns() < end_ns and not any_button():
+        pass
+    ### Clear the capture and reset the rolling plot
+    simple_plot_bmp.fill(0)
+    for row_idx in range(plot_rows):
+        mcp_history[row_idx] = max_val
+        int_history[row_idx] = max_val
+
+
+def check_buttons():
+    if yellow_button_a():
+        multiple_samples()
+    elif cyan_button_b():
+        transient_capture()
+
+
 loop_idx = 0
 
 ### Move to middle
@@ -330,8 +610,7 @@ start_ns = time.monotonic_ns()
 offset = 0  ### 16bit scaled value
 
 while True:
-    if yellow_button_a():
-        multiple_samples()
+    check_buttons()
 
     new_offset = max((edu_pico_pot.value - 1800) // 40, 0)
     offset  = (offset >> 1) + (new_offset >> 1) + 1
@@ -359,7 +638,6 @@ while True:
     display.refresh()
     loop_idx +=1
     while time.monotonic_ns() < last_loop_ns + min_loop_ns:
-        if yellow_button_a():
-            multiple_samples()
+        check_buttons()
 
     last_loop_ns = time.monotonic_ns()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+### soil-log-decode.py v1.0
+### Decode the logs written by soil-monitor.py into NumPy arrays
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Usage: soil-log-decode.py [-o output.npz] [-s start_epoch] [-v] prefix
+### where prefix is the path to the logs without -raw.bin, e.g. /media/CIRCUITPY/soil
+
+import getopt
+import sys
+
+import numpy as np
+
+import soil_log
+
+
+verbose = False
+output = None
+start_override = None
+
+
+def usage(exit_code):
+    print("soil-log-decode: [-h] [-o output.npz] [-s start] [-v] prefix",
+          file=sys.stderr)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def read_records(filename):
+    """Return the header and a 2D uint8 array of records, oldest first."""
+    with open(filename, "rb") as fh:
+        header = soil_log.read_header(fh)
+        if header is None:
+            raise ValueError("Not a soil log: " + filename)
+        ring = np.fromfile(fh, dtype=np.uint8,
+                           count=header["capacity"] * header["record_len"])
+    ring = ring.reshape(header["capacity"], header["record_len"])
+    count = header["count"]
+    if count <= header["capacity"]:
+        return header, ring[:count], 0
+    split = count % header["capacity"]
+    return header, np.concatenate((ring[split:], ring[:split])), count - header["capacity"]
+
+
+def decode_raw(header, records, first_index):
+    """Vectorised version of soil_log.decode_raw returning float levels
+       in percent with NaN for missing or undecodable readings."""
+    keyframe = header["keyframe"]
+    indices = np.arange(first_index, first_index + len(records))
+    is_key = (indices % keyframe) == 0
+
+    deltas = records.astype(np.int8).astype(np.int32)
+    missing = np.where(is_key[:, np.newaxis],
+                       records == soil_log.MISSING_ABS,
+                       records == soil_log.MISSING_DELTA)
+    ### Keyframes restart the cumulative sum from their absolute values
+    ### or the baseline for missing sensors
+    steps = np.where(missing, 0, deltas)
+    key_values = np.where(missing, soil_log.BASELINE_LEVEL,
+                          records.astype(np.int32))
+    segment = np.cumsum(is_key) - 1
+    cum = np.cumsum(np.where(is_key[:, np.newaxis], 0, steps), axis=0)
+    key_rows = np.flatnonzero(is_key)
+    levels = np.full(records.shape, np.nan)
+    if len(key_rows):
+        valid = segment >= 0
+        seg = segment[valid]
+        levels[valid] = (key_values[key_rows][seg]
+                         + cum[valid] - cum[key_rows][seg])
+    levels[missing] = np.nan
+    return levels / 2.0
+
+
+def decode_rollup(header, records):
+    """Return min, mean, max arrays in percent with NaN for missing."""
+    rolls = records.reshape(len(records), header["sensors"], 3).astype(np.float64)
+    rolls[records.reshape(rolls.shape) == soil_log.MISSING_ABS] = np.nan
+    return rolls[:, :, 0] / 2.0, rolls[:, :, 1] / 2.0, rolls[:, :, 2] / 2.0
+
+
+def times(header, first_index, length):
+    start = header["start"] if start_override is None else start_override
+    return start + (first_index + np.arange(length)) * header["interval"]
+
+
+def main(cmdlineargs):
+    global output, start_override, verbose
+
+    try:
+        opts, args = getopt.getopt(cmdlineargs,
+                                   "ho:s:v", ["help", "output="])
+    except getopt.GetoptError as err:
+        print(err,
+              file=sys.stderr)
+        usage(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt == "-s":
+            start_override = int(arg)
+        elif opt == "-v":
+            verbose = True
+    if len(args) != 1:
+        usage(2)
+    prefix = args[0]
+
+    arrays = {}
+    header, records, first = read_records(prefix + "-raw.bin")
+    arrays["raw_time"] = times(header, first, len(records))
+    arrays["raw"] = decode_raw(header, records, first)
+
+    for name in ("hourly", "daily"):
+        header, records, first = read_records(prefix + "-" + name + ".bin")
+        ### Times are the start of each rollup period
+        arrays[name + "_time"] = times(header, first, len(records))
+        (arrays[name + "_min"],
+         arrays[name + "_mean"],
+         arrays[name + "_max"]) = decode_rollup(header, records)
+
+    if verbose or output is None:
+        for name, arr in arrays.items():
+            print(name, arr.shape)
+        if len(arrays["raw"]):
+            print("Latest", arrays["raw"][-1])
+    if output is not None:
+        np.savez_compressed(output, **arrays)
+
+    return arrays
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
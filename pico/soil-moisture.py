@@ -1,4 +1,4 @@
-### soil-moisture.py v1.3
+### soil-moisture.py v1.5
 ### Show soil moisture on SSD1306 screen using resistive and capacitive sensors
 
 ### Tested with Pi Pico and 6.2.0-beta.2-182-g24fdda038
@@ -53,6 +53,8 @@ import adafruit_display_shapes.triangle
 import adafruit_display_shapes.rect
 from adafruit_display_text.label import Label
 
+from moisture_lut import MoistureLUT, OverSampler, params_key
+
 
 debug = 1
 
@@ -77,6 +79,19 @@ MPP_BUTTON_MIDDLE_PIN = board.GP21
 MPP_BUTTON_RIGHT_PIN = board.GP22
 MPP_NEOPIXEL_PIN = board.GP28
 
+### Lookup tables replace the per reading sqrt/exp maths of the models,
+### these are saved to CIRCUITPY if boot.py has made it writeable
+USE_LUT = True
+LUT_DIR = "/"
+
+### Optional user captured calibration points as (raw_adc, percent) tuples,
+### e.g. ((65535, 0), (30000, 40), (10000, 100)), which add a third model
+SOIL_RES_CAL_POINTS = None
+SOIL_CAP_CAL_POINTS = None
+
+### Number of ADC readings per measurement, the middle half are averaged
+OVERSAMPLES = 64
+
 ### NeoPixel colours
 BLACK = (0, 0, 0)
 
@@ -89,18 +104,15 @@ def d_print(level, *args, **kwargs):
         print(*args, **kwargs)
 
 
-def get_value(ain, samples=500):
-    return sum([ain.value for _ in range(samples)]) / samples
-
-
 class Moisture:
     VREF = 3.3
+    MODEL_REV = 1  ### increment this if the model formulas change to rebuild saved tables
     GOOD_COLOUR = (0, 30, 0)     ### green
     DRY_COLOUR = (45, 18, 0)     ### orange
     TOODRY_COLOUR = (60, 0, 0)   ### red (used for flashing too)
     TOOWET_COLOUR = (40, 0, 40)  ### magneta
 
-    def __init__(self, sensor_type, model="linear", vref=VREF):
+    def __init__(self, sensor_type, model="linear", vref=VREF, *, points=None):
         if sensor_type.lower() == "generic resistive":
             ### A generic resisitive pcb soil sensor measuring voltage
             ### across soil with 1k on upper half of potential divider
@@ -120,16 +132,45 @@ class Moisture:
         self._range = abs(self._sodden - self._arid)
         self._inverted = (self._arid > self._sodden)
         self._vref = vref
+        self._points = points
 
         ### replace method
         if model == "linear":
             self.raw_to_percent = self.linear_raw_to_percent
         elif model == "datafit1":
             self.raw_to_percent = datafit1_rtp
+        elif model == "calibrated":
+            if points is None:
+                raise ValueError("calibrated model needs points")
+            self.raw_to_percent = MoistureLUT.from_points(points).raw_to_percent
         else:
             raise ValueError("Unknown model: " + model)
         self.model = model
 
+    def use_lut(self, directory=None, typecode="B"):
+        """Replace the conversion with a lookup table version of the current model,
+           the table is loaded from directory if present or built and saved there.
+           The saved table has a key from the parameters of the model so
+           a table from different parameters is rebuilt.
+        """
+        filename = None
+        lut = None
+        key = params_key(self.sensor_type, self.model, self.MODEL_REV,
+                         self._vref, self._arid, self._sodden, self._points)
+        if directory is not None:
+            filename = "{:s}{:s}-{:s}.lut".format(directory,
+                                                  self.sensor_type.replace(" ", "-"),
+                                                  self.model)
+            lut = MoistureLUT.load(filename, key)
+            if lut is not None and lut.typecode != typecode:
+                lut = None
+        if lut is None:
+            lut = MoistureLUT.from_function(self.raw_to_percent, typecode, key)
+            if filename is not None and not lut.save(filename):
+                d_print(2, "Cannot save", filename)
+        self.raw_to_percent = lut.raw_to_percent
+        return lut
+
     @classmethod
     def moisture_to_color(cls, percents):
         """Take multiple values and returns RGB colour and flashing boolean.
@@ -463,6 +504,10 @@ soil_res_conv = (Moisture(soil_res_type,
                  Moisture(soil_res_type,
                           model="datafit1",
                           vref=soil_res.reference_voltage))
+if SOIL_RES_CAL_POINTS is not None:
+    soil_res_conv += (Moisture(soil_res_type,
+                               model="calibrated",
+                               points=SOIL_RES_CAL_POINTS),)
 
 soil_cap_type = "grove capacitive"
 soil_cap = analogio.AnalogIn(SOIL_CAP_SIG_PIN)
@@ -472,6 +517,18 @@ soil_cap_conv = (Moisture(soil_cap_type,
                  Moisture(soil_cap_type,
                           model="datafit1",
                           vref=soil_cap.reference_voltage))
+if SOIL_CAP_CAL_POINTS is not None:
+    soil_cap_conv += (Moisture(soil_cap_type,
+                               model="calibrated",
+                               points=SOIL_CAP_CAL_POINTS),)
+
+if USE_LUT:
+    for conv in soil_res_conv + soil_cap_conv:
+        if conv.model != "calibrated":
+            conv.use_lut(LUT_DIR)
+    gc.collect()
+
+oversampler = OverSampler(OVERSAMPLES, reduction="trimmed", trim=0.25)
 
 ### Lower-case are risky due to descenders going from yellow
 ### into the cyan section of screen
@@ -562,10 +619,10 @@ while True:
         gc.collect()
         soil_res_pwr.value = True
         time.sleep(RES_SETTLE_TIME)
-        res_raw = get_value(soil_res)
+        res_raw = oversampler.read(soil_res)
         soil_res_pwr.value = False
 
-    cap_raw = get_value(soil_cap)
+    cap_raw = oversampler.read(soil_cap)
 
     if display and raw_mode:
         soil_res_raw_text.text = "{:5d}".format(round(res_raw))
@@ -0,0 +1,205 @@
+### soil-monitor.py v1.1
+### Log soil moisture from many sensors on multiplexed ADC channels with deep sleep
+
+### Tested with Pi Pico and 9.2.1
+
+### copy this file to Pi Pico as code.py with moisture_lut.py and soil_log.py
+### CIRCUITPY must be writeable by CircuitPython for the logs,
+### see edu-pico-boot.py for an example boot.py to do this
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### This reads capacitive sensors through a 74HC4051 8 channel analogue
+### multiplexer on GP26 with select lines on GP2, GP3, GP4 and
+### a resistive sensor directly on GP27 powered by GP16 only when read
+###
+### Each wake takes one reading of each sensor that is due, appends it
+### to soil-raw.bin and the hourly/daily rollup logs and then deep sleeps
+### until the next reading, soil-log-decode.py decodes the logs on a desktop
+
+import time
+import gc
+
+import board
+import digitalio
+import analogio
+import alarm
+import supervisor
+
+from moisture_lut import MoistureLUT, OverSampler, params_key
+from soil_log import SoilLog
+
+
+debug = 1
+
+READ_INTERVAL = 300  ### in seconds, must divide into an hour
+LOG_PREFIX = "/soil"
+### Tables built from calibration points are saved to save time on later wakes
+POINTS_LUT_FILE = "/soil-points-{:08x}.lut"
+
+MUX_SELECT_PINS = (board.GP2, board.GP3, board.GP4)
+MUX_SETTLE_TIME = 0.001  ### 1ms for sensor output to settle on ADC
+RES_SETTLE_TIME = 0.050  ### 50ms
+
+### Grove capacitive and generic resistive linear models from soil-moisture.py
+GROVE_CAP_POINTS = ((22000, 100), (38000, 0))
+GENERIC_RES_POINTS = ((10000, 100), (65535, 0))
+
+### name, ADC pin, mux channel or None, power pin or None,
+### lookup table file saved by soil-moisture.py or None,
+### calibration points used if there is no lookup table file,
+### read every n wakes
+SENSORS = (("pot1", board.GP26, 0, None,
+            "/grove-capacitive-datafit1.lut", GROVE_CAP_POINTS, 1),
+           ("pot2", board.GP26, 1, None, None, GROVE_CAP_POINTS, 1),
+           ("pot3", board.GP26, 2, None, None, GROVE_CAP_POINTS, 1),
+           ("pot4", board.GP26, 3, None, None, GROVE_CAP_POINTS, 1),
+           ("border", board.GP27, None, board.GP16, None, GENERIC_RES_POINTS, 4))
+
+
+def d_print(level, *args, **kwargs):
+    """A simple conditional print for debugging based on global debug level."""
+    if not isinstance(level, int):
+        print(level, *args, **kwargs)
+    elif debug >= level:
+        print(*args, **kwargs)
+
+
+class SoilSensor:
+    """One sensor on an ADC pin, optionally via a multiplexer channel and
+       optionally powered only while it is read."""
+
+    def __init__(self, name, ain, mux_channel, power, lut, every):
+        self.name = name
+        self._ain = ain
+        self._mux_channel = mux_channel
+        self._power = power
+        self.every = every
+        self._lut = lut
+
+    def read_level(self, mux, oversampler):
+        """Return moisture level in half percent steps."""
+        if self._mux_channel is not None:
+            mux.select(self._mux_channel)
+        if self._power is not None:
+            self._power.value = True
+            time.sleep(RES_SETTLE_TIME)
+        try:
+            raw = oversampler.read(self._ain)
+        finally:
+            if self._power is not None:
+                self._power.value = False
+        return self._lut.raw_to_percent(raw) * 2
+
+
+class AnalogueMux:
+    def __init__(self, *select_pins):
+        self._select = []
+        for pin in select_pins:
+            dio = digitalio.DigitalInOut(pin)
+            dio.switch_to_output(value=False)
+            self._select.append(dio)
+        self._channel = None
+
+    def select(self, channel):
+        if channel == self._channel:
+            return
+        for bit, dio in enumerate(self._select):
+            dio.value = bool(channel & (1 << bit))
+        self._channel = channel
+        time.sleep(MUX_SETTLE_TIME)
+
+
+def points_lut(points, luts):
+    """A table for calibration points shared by all the sensors using them,
+       it is built once and saved to flash rather than built on every wake."""
+    key = params_key(points)
+    lut = luts.get(key)
+    if lut is None:
+        filename = POINTS_LUT_FILE.format(key)
+        lut = MoistureLUT.load(filename, key)
+        if lut is None:
+            d_print(1, "Building", filename)
+            lut = MoistureLUT.from_points(points, key=key)
+            if not lut.save(filename):
+                d_print(1, "Cannot save", filename)
+        luts[key] = lut
+    return lut
+
+
+wake_start = time.monotonic()
+
+mux = AnalogueMux(*MUX_SELECT_PINS)
+ains = {}
+sensors = []
+points_luts = {}
+for name, pin, mux_ch, power_pin, lut_file, points, every in SENSORS:
+    if pin not in ains:
+        ains[pin] = analogio.AnalogIn(pin)
+    power = None
+    if power_pin is not None:
+        power = digitalio.DigitalInOut(power_pin)
+        power.switch_to_output(value=False)
+    lut = None
+    if lut_file is not None:
+        lut = MoistureLUT.load(lut_file)
+        if lut is None:
+            d_print(1, "Cannot load", lut_file, "for", name)
+    if lut is None:
+        lut = points_lut(points, points_luts)
+    sensors.append(SoilSensor(name, ains[pin], mux_ch, power, lut, every))
+del points_luts
+
+oversampler = OverSampler(32, reduction="median")
+
+try:
+    soil_log = SoilLog(LOG_PREFIX, len(sensors), READ_INTERVAL,
+                       start=int(time.time()))
+except OSError as ex:
+    ### Most likely a read-only CIRCUITPY
+    d_print(1, "Cannot open logs:", ex)
+    soil_log = None
+
+### The raw log record count is the schedule so nothing needs to be
+### kept in memory over deep sleep
+reading_idx = soil_log.raw.count if soil_log else 0
+levels = [sensor.read_level(mux, oversampler) if reading_idx % sensor.every == 0 else None
+          for sensor in sensors]
+
+if soil_log:
+    soil_log.append(levels)
+    soil_log.close()
+gc.collect()
+
+if supervisor.runtime.serial_connected:
+    print(tuple(None if lvl is None else lvl / 2 for lvl in levels))
+
+for ain in ains.values():
+    ain.deinit()
+
+d_print(2, "Wake time", time.monotonic() - wake_start)
+
+### Time taken while awake is subtracted to keep readings on schedule
+sleep_for = max(1.0, READ_INTERVAL - (time.monotonic() - wake_start))
+time_alarm = alarm.time.TimeAlarm(monotonic_time=time.monotonic() + sleep_for)
+alarm.exit_and_deep_sleep_until_alarms(time_alarm)
@@ -0,0 +1,328 @@
+### soil_log.py v1.0
+### Compact on-flash ring logs for soil moisture history with hourly and daily rollups
+
+### copy this file to Pi Pico alongside soil-monitor.py
+### the decoding functions are also used by soil-log-decode.py on a desktop
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Values are moisture levels in half percent steps (0-200) to match
+### the "B" tables in moisture_lut.py
+###
+### The raw log has one byte per sensor per reading, these are signed
+### deltas from the previous reading except every KEYFRAME records
+### which hold absolute values so the log can be decoded after it wraps
+### The rollup logs hold min, mean and max bytes per sensor
+###
+### Nothing is kept in RAM between readings, the state for delta encoding
+### and rollups is recovered from the end of the logs on every wake
+### which suits deep sleep on boards which reset on waking
+
+import struct
+
+
+KIND_RAW = 0
+KIND_HOURLY = 1
+KIND_DAILY = 2
+
+MAX_LEVEL = 200
+### Delta baseline for a sensor which was missing in the last keyframe,
+### any level can be reached from this in one delta
+BASELINE_LEVEL = 100
+### Missing reading markers for absolute and delta encoded bytes
+MISSING_ABS = 0xff
+MISSING_DELTA = 0x80
+
+DEF_KEYFRAME = 32
+
+_LOG_MAGIC = b"SLOG"
+_LOG_VERSION = 1
+### magic, version, kind, sensors, record length, keyframe interval,
+### capacity in records, interval in seconds, records written, start time
+_LOG_HEADER = "<4sBBBBBHIII"
+HEADER_LEN = struct.calcsize(_LOG_HEADER)
+_COUNT_OFFSET = HEADER_LEN - 8
+
+
+def read_header(fh):
+    """Read the header returning a dict or None if the file is not a log."""
+    fh.seek(0)
+    header = fh.read(HEADER_LEN)
+    if len(header) != HEADER_LEN:
+        return None
+    (magic, version, kind, sensors, rec_len, keyframe,
+     capacity, interval, count, start) = struct.unpack(_LOG_HEADER, header)
+    if magic != _LOG_MAGIC or version != _LOG_VERSION:
+        return None
+    return {"kind": kind, "sensors": sensors, "record_len": rec_len,
+            "keyframe": keyframe, "capacity": capacity,
+            "interval": interval, "count": count, "start": start}
+
+
+class RingLog:
+    """A fixed size file holding a header and a ring of fixed length records.
+       The header holds the total number of records ever written so
+       the position of the oldest record and the time of any record
+       can be calculated.
+    """
+
+    def __init__(self, filename, kind, sensors, record_len, capacity,
+                 interval, start, *, keyframe=0):
+        self._filename = filename
+        self._fh = None
+        try:
+            self._fh = open(filename, "r+b")
+            header = read_header(self._fh)
+            if (header is None or header["kind"] != kind
+                    or header["sensors"] != sensors
+                    or header["record_len"] != record_len
+                    or header["capacity"] != capacity
+                    or header["interval"] != interval):
+                self._fh.close()
+                self._fh = None
+        except OSError:
+            self._fh = None
+
+        if self._fh is None:
+            self._create(kind, sensors, record_len, keyframe,
+                         capacity, interval, start)
+            header = read_header(self._fh)
+
+        self.kind = kind
+        self.sensors = sensors
+        self.record_len = record_len
+        self.keyframe = header["keyframe"]
+        self.capacity = capacity
+        self.interval = interval
+        self.start = header["start"]
+        self.count = header["count"]
+        self._count_buf = bytearray(4)
+
+    def _create(self, kind, sensors, record_len, keyframe,
+                capacity, interval, start):
+        self._fh = open(self._filename, "w+b")
+        self._fh.write(struct.pack(_LOG_HEADER, _LOG_MAGIC, _LOG_VERSION,
+                                   kind, sensors, record_len, keyframe,
+                                   capacity, interval, 0, start))
+        blank = bytes(record_len)
+        for _ in range(capacity):
+            self._fh.write(blank)
+        self._fh.flush()
+
+    def append(self, record):
+        self._fh.seek(HEADER_LEN + (self.count % self.capacity) * self.record_len)
+        self._fh.write(record)
+        self.count += 1
+        struct.pack_into("<I", self._count_buf, 0, self.count)
+        self._fh.seek(_COUNT_OFFSET)
+        self._fh.write(self._count_buf)
+        self._fh.flush()
+
+    def read_last(self, records):
+        """Return the bytes of the last records in chronological order."""
+        records = min(records, self.count, self.capacity)
+        data = bytearray(records * self.record_len)
+        first = self.count - records
+        mv = memoryview(data)
+        for idx in range(records):
+            self._fh.seek(HEADER_LEN + ((first + idx) % self.capacity) * self.record_len)
+            self._fh.readinto(mv[idx * self.record_len:(idx + 1) * self.record_len])
+        return data
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def delta_byte(delta):
+    return delta & 0xff
+
+def byte_delta(value):
+    return value - 256 if value >= 128 else value
+
+
+def decode_raw(data, sensors, first_index, keyframe):
+    """Decode delta encoded raw records to a list of lists of levels with None
+       for missing readings. Records before the first keyframe are
+       undecodable and are returned as None too."""
+    levels = []
+    prev = None
+    for rec_idx in range(len(data) // sensors):
+        offset = rec_idx * sensors
+        if (first_index + rec_idx) % keyframe == 0:
+            prev = [BASELINE_LEVEL] * sensors
+            row = []
+            for s_idx in range(sensors):
+                value = data[offset + s_idx]
+                if value == MISSING_ABS:
+                    row.append(None)
+                else:
+                    prev[s_idx] = value
+                    row.append(value)
+        elif prev is None:
+            row = [None] * sensors
+        else:
+            row = []
+            for s_idx in range(sensors):
+                value = data[offset + s_idx]
+                if value == MISSING_DELTA:
+                    row.append(None)
+                else:
+                    prev[s_idx] += byte_delta(value)
+                    row.append(prev[s_idx])
+        levels.append(row)
+    return levels
+
+
+def rollup(rows, sensors):
+    """Reduce rows of levels to a rollup record of min, mean, max per sensor.
+       rows may be raw levels or earlier rollup records as lists of
+       (min, mean, max) tuples."""
+    record = bytearray(sensors * 3)
+    for s_idx in range(sensors):
+        r_min = MAX_LEVEL + 1
+        r_max = -1
+        total = 0
+        num = 0
+        for row in rows:
+            value = row[s_idx]
+            if value is None:
+                continue
+            if isinstance(value, tuple):
+                v_min, v_mean, v_max = value
+            else:
+                v_min = v_mean = v_max = value
+            r_min = min(r_min, v_min)
+            r_max = max(r_max, v_max)
+            total += v_mean
+            num += 1
+        if num:
+            record[s_idx * 3:s_idx * 3 + 3] = bytes((r_min, round(total / num), r_max))
+        else:
+            record[s_idx * 3:s_idx * 3 + 3] = bytes((MISSING_ABS,) * 3)
+    return record
+
+
+def decode_rollup(data, sensors):
+    """Decode rollup records into lists of (min, mean, max) tuples or None."""
+    rows = []
+    for offset in range(0, len(data), sensors * 3):
+        row = []
+        for s_off in range(offset, offset + sensors * 3, 3):
+            if data[s_off] == MISSING_ABS:
+                row.append(None)
+            else:
+                row.append((data[s_off], data[s_off + 1], data[s_off + 2]))
+        rows.append(row)
+    return rows
+
+
+class SoilLog:
+    """A raw reading log plus hourly and daily rollup logs.
+       interval is the time between readings in seconds and should divide
+       into an hour exactly. Capacities are in records.
+    """
+
+    def __init__(self, prefix, sensors, interval, *, start=0,
+                 raw_capacity=1152, hourly_capacity=744, daily_capacity=366,
+                 keyframe=DEF_KEYFRAME):
+        if 3600 % interval:
+            raise ValueError("interval must divide into 3600")
+        self._sensors = sensors
+        self._per_hour = 3600 // interval
+        if raw_capacity < self._per_hour + keyframe:
+            raise ValueError("raw_capacity must hold an hour plus a keyframe interval")
+        self.raw = RingLog(prefix + "-raw.bin", KIND_RAW, sensors, sensors,
+                           raw_capacity, interval, start,
+                           keyframe=keyframe)
+        self.hourly = RingLog(prefix + "-hourly.bin", KIND_HOURLY,
+                              sensors, sensors * 3,
+                              hourly_capacity, 3600, start)
+        self.daily = RingLog(prefix + "-daily.bin", KIND_DAILY,
+                             sensors, sensors * 3,
+                             daily_capacity, 86400, start)
+        self._record = bytearray(sensors)
+        self._prev = self._recover_prev()
+
+    def _recover_prev(self):
+        """Work out the reconstructed levels for the last record written
+           by decoding from the most recent keyframe."""
+        keyframe = self.raw.keyframe
+        since_key = self.raw.count % keyframe
+        if self.raw.count == 0 or since_key == 0:
+            return None
+        data = self.raw.read_last(since_key)
+        levels = decode_raw(data, self._sensors,
+                            self.raw.count - since_key, keyframe)
+        prev = [BASELINE_LEVEL] * self._sensors
+        for row in levels:
+            for s_idx, value in enumerate(row):
+                if value is not None:
+                    prev[s_idx] = value
+        return prev
+
+    def append(self, levels):
+        """Append one reading, a sequence of levels in half percent
+           steps or None per sensor, rolling up at hour and day boundaries."""
+        rec = self._record
+        if self.raw.count % self.raw.keyframe == 0:
+            self._prev = [BASELINE_LEVEL] * self._sensors
+            for s_idx, level in enumerate(levels):
+                if level is None:
+                    rec[s_idx] = MISSING_ABS
+                else:
+                    level = min(MAX_LEVEL, max(0, round(level)))
+                    rec[s_idx] = level
+                    self._prev[s_idx] = level
+        else:
+            for s_idx, level in enumerate(levels):
+                if level is None:
+                    rec[s_idx] = MISSING_DELTA
+                    continue
+                ### Clamp and carry any large change into the next readings
+                level = min(MAX_LEVEL, max(0, round(level)))
+                delta = min(127, max(-127, level - self._prev[s_idx]))
+                rec[s_idx] = delta_byte(delta)
+                self._prev[s_idx] += delta
+        self.raw.append(rec)
+
+        if self.raw.count % self._per_hour == 0:
+            self._rollup_hour()
+
+    def _rollup_hour(self):
+        first = self.raw.count - self._per_hour
+        ### Decoding needs to start from the preceding keyframe
+        since_key = first % self.raw.keyframe
+        data = self.raw.read_last(self._per_hour + since_key)
+        levels = decode_raw(data, self._sensors,
+                            first - since_key, self.raw.keyframe)[since_key:]
+        self.hourly.append(rollup(levels, self._sensors))
+
+        if self.hourly.count % 24 == 0:
+            hours = decode_rollup(self.hourly.read_last(24), self._sensors)
+            self.daily.append(rollup(hours, self._sensors))
+
+    def close(self):
+        for log in (self.raw, self.hourly, self.daily):
+            log.close()
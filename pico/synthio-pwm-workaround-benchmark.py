@@ -1,9 +1,12 @@
-### synthio-pwm-benchmark v1.1
+### synthio-pwm-benchmark v1.2
 ### Checking performance of various pwm techniques
 
 ### Tested with Pi Pico W (on EDU PICO) and 9.1.4
 
-### copy this file to Cytron Maker Pi Pico as code.py
+### copy this file to Cytron Maker Pi Pico as code.py with synthio_pwm.py
+
+### This is also the regression test for synthio_pwm, any difference between
+### its waveforms and the np.where version is printed as MISMATCH
 
 ### MIT License
 
@@ -45,6 +48,8 @@ import synthio
 import audiopwmio
 import ulab.numpy as np
 
+from synthio_pwm import PWMOscillator, PWMGroup
+
 ##import usb_midi
 ##import adafruit_midi
 ##from adafruit_midi.note_on import NoteOn
@@ -63,6 +68,7 @@ WAVEFORM_PEAK = 28_000
 WAVEFORM_MAX = 2**15 - 1
 WAVEFORM_LEN = 2048
 WAVEFORM_HALFLEN = WAVEFORM_LEN // 2
+PWM_VOICES = 4
 
 
 def d_print(level, *args, **kwargs):
@@ -111,6 +117,13 @@ def make_lfo_pwm():
 
 lfo_pwm = make_lfo_pwm()
 
+pwm_osc = PWMOscillator(WAVEFORM_LEN, WAVEFORM_PEAK)
+### Voices with progressively narrower pulses from the same LFO
+pwm_group = PWMGroup(lfo_pwm)
+for v_idx in range(PWM_VOICES):
+    pwm_group.add(PWMOscillator(WAVEFORM_LEN, WAVEFORM_PEAK),
+                  scale=1.0 - v_idx / (2 * PWM_VOICES))
+
 lfo_sawtoothpos = np.array([WAVEFORM_MAX, 0], dtype=np.int16)
 lfo_revsawtoothpos = np.array([0, WAVEFORM_MAX, 0], dtype=np.int16)
 
@@ -142,9 +155,12 @@ synth.blocks.append(lfo_pwm)
 sleep_times = (0.001, 0.001, 0.002, 0.005, 0.010, 0.020, 0.050)
 perf_cp_ms = [None] * len(sleep_times)
 perf_ulab_ms = [None] * len(sleep_times)
+perf_osc_ms = [None] * len(sleep_times)
+perf_group_ms = [None] * len(sleep_times)
+mismatches = 0
 delta = [None] * len(sleep_times)
 sleep_idx = 0
-t1 = t2 = t3 = 0
+t1 = t2 = t3 = t4 = t5 = 0
 while True:
 
     time.sleep(sleep_times[sleep_idx])  ### simulate doing something else in the loop
@@ -159,9 +175,21 @@ while True:
         t2 = time.monotonic_ns()
         pwm_waveform_ulab(waveform_square_pwm_ulab, pwm_idx, new_idx, WAVEFORM_PEAK)
         t3 = time.monotonic_ns()
+        pwm_osc.set_edge(new_idx)
+        t4 = time.monotonic_ns()
+        pwm_group.update()
+        t5 = time.monotonic_ns()
 
         perf_cp_ms[sleep_idx] = (t2 - t1) / 1e6
         perf_ulab_ms[sleep_idx] = (t3 - t2) / 1e6
+        perf_osc_ms[sleep_idx] = (t4 - t3) / 1e6
+        perf_group_ms[sleep_idx] = (t5 - t4) / 1e6
+
+        ### new_idx is never clamped by the LFO range so these must be identical
+        if (np.any(pwm_osc.waveform != waveform_square_pwm_ulab)
+                or np.any(waveform_square_pwm_cp != waveform_square_pwm_ulab)):
+            mismatches += 1
+            print("MISMATCH", (pwm_idx, new_idx))
 
         if debug >= 2:
             d_print(2, "FROMTO", (pwm_idx, new_idx),
@@ -175,6 +203,7 @@ while True:
         pwm_idx = new_idx
     else:
         perf_cp_ms[sleep_idx] = perf_ulab_ms[sleep_idx] = 0.0
+        perf_osc_ms[sleep_idx] = perf_group_ms[sleep_idx] = 0.0
 
     delta[sleep_idx] = diff_idx
     sleep_idx = (sleep_idx + 1) % len(sleep_times)
@@ -182,4 +211,7 @@ while True:
         print("DELTA", t1/1e9, delta)
         print("CP (ms)", perf_cp_ms)
         print("ULAB (ms)", perf_ulab_ms)
+        print("OSC (ms)", perf_osc_ms)
+        print("GROUP", PWM_VOICES, "(ms)", perf_group_ms)
+        print("MISMATCHES", mismatches, "MEM", gc.mem_free())
         gc.collect()
@@ -0,0 +1,128 @@
+### synthio_pwm.py v1.0
+### Pulse-width modulated square wave oscillators for synthio
+
+### copy this file to Pi Pico alongside code.py
+### synthio-pwm-workaround-benchmark.py checks and times this on a board
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### synthio does not have pulse-width modulation for the square wave
+### (https://github.com/adafruit/circuitpython/issues/9780) so this
+### modifies the waveform in place while a Note is playing it
+###
+### The high part of the wave is the indices below the edge index,
+### moving the edge only changes the samples between the old and
+### new edge which are set with a slice assignment of a scalar so
+### there are no temporary arrays and no Python loop over samples
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    import numpy as np  ### desktop Python
+
+
+WAVEFORM_PEAK = 28_000
+WAVEFORM_LEN = 2048
+
+
+class PWMOscillator:
+    """A square wave in an np.int16 buffer for use as a synthio.Note
+       waveform with a duty cycle which can be changed cheaply."""
+
+    def __init__(self, length=WAVEFORM_LEN, peak=WAVEFORM_PEAK, edge=None):
+        self._length = length
+        self._peak = peak
+        self._edge = length // 2 if edge is None else self._clamp(edge)
+        self._waveform = np.full(length, 0 - peak, dtype=np.int16)
+        self._waveform[:self._edge] = peak
+
+    def _clamp(self, edge):
+        ### Keep at least one sample high and one low to avoid silence
+        return min(self._length - 1, max(1, edge))
+
+    def set_edge(self, new_edge):
+        """Move the falling edge to index new_edge returning
+           the number of samples changed."""
+        new_edge = self._clamp(new_edge)
+        old_edge = self._edge
+        if new_edge > old_edge:
+            self._waveform[old_edge:new_edge] = self._peak
+        elif new_edge < old_edge:
+            self._waveform[new_edge:old_edge] = 0 - self._peak
+        else:
+            return 0
+        self._edge = new_edge
+        return abs(new_edge - old_edge)
+
+    def set_duty(self, duty):
+        """Set the duty cycle as a fraction between 0.0 and 1.0."""
+        return self.set_edge(round(duty * self._length))
+
+    @property
+    def waveform(self):
+        return self._waveform
+
+    @property
+    def edge(self):
+        return self._edge
+
+    @property
+    def length(self):
+        return self._length
+
+
+class PWMGroup:
+    """Several PWMOscillator driven by one LFO whose value is read once
+       per update(). The value of the LFO is an edge index which
+       is scaled and offset for each oscillator, e.g. for detuned
+       voices with different pulse widths.
+    """
+
+    def __init__(self, lfo, oscillators=(), *, mappings=None):
+        self._lfo = lfo
+        self._oscillators = list(oscillators)
+        if mappings is None:
+            self._mappings = [(1.0, 0)] * len(self._oscillators)
+        else:
+            self._mappings = list(mappings)
+        self._last_value = None
+
+    def add(self, oscillator, scale=1.0, offset=0):
+        self._oscillators.append(oscillator)
+        self._mappings.append((scale, offset))
+
+    def update(self):
+        """Move the edges for the current LFO value returning the total
+           number of samples changed, 0 if the LFO has not moved."""
+        value = self._lfo.value
+        if value == self._last_value:
+            return 0
+        self._last_value = value
+        changed = 0
+        for osc, (scale, offset) in zip(self._oscillators, self._mappings):
+            changed += osc.set_edge(round(value * scale) + offset)
+        return changed
+
+    @property
+    def oscillators(self):
+        return self._oscillators
@@ -1,9 +1,9 @@
-### scope-xy-lem v0.9
+### scope-xy-lem v0.10
 ### Output simple vector image of a Lunar Excursion Module to oscilloscope
 ### Needs X-Y mode and an Adafruit M4 board like Feather M4
 ### or PyGamer (best to disconnect headphones)
 
-### copy this file to PyGamer (or other M4 board) as code.py
+### copy this file to PyGamer (or other M4 board) as code.py with scope_vector.py
 
 ### MIT License
 
@@ -36,9 +36,7 @@ import busio
 import audioio
 import analogio
 
-### TODO - split up parts of image to tell addpoints not to put in
-###        extra points - could just use (None, None) or perhaps a
-###        better data structure to give more flexibility later??
+import scope_vector
 
 ### TODO - some animation - could use controls on the PyGamer
 
@@ -70,34 +68,6 @@ lem = [[(-8, -2), (-9, -3), (-9, -9), (-7, -11), (7, -11), (9, -9), (9, -3), (8,
       ]
 
 
-### add extra points to any lines if length is greater than min_dist
-def addpoints(points, min_dist):
-    newpoints = []
-    original_len = len(points)
-    for idx in range(original_len):
-        x1, y1 = points[idx]
-        x2, y2 = points[(idx + 1) % original_len]
-
-        ### Always keep the original point
-        newpoints.append((x1, y1))
-
-        diff_x = x2 - x1
-        diff_y = y2 - y1
-        dist = math.sqrt(diff_x ** 2 + diff_y ** 2)
-        if dist > min_dist:
-            ### Calculate extra intermediate points plus one
-            extrasp1 = int(dist // min_dist) + 1
-            for extra_idx in range(1, extrasp1):
-                ratio = extra_idx / extrasp1
-                newpoints.append((x1 + diff_x * ratio,
-                                  y1 + diff_y * ratio))
-        ### Two points define a straight line
-        ### so no need to connect final point back to first
-        if original_len == 2:
-            break
-
-    return newpoints
-
 data = lem
 
 ### get the range of logo points
@@ -155,6 +125,11 @@ intermediates = [100, 10, 7, 5, 4, 3, 2, 1.5, 1, 0.5, 0.25]
 mult_x = dac_x_max / max(range_x, range_y) * 0.8
 mult_y = dac_x_max / max(range_x, range_y) * 0.8
 
+### The samples for each spacing are made on the first pass
+### through intermediates and reused after that
+scene = scope_vector.Scene(scope_vector.paths_from_parts(data),
+                           mult_x, 0 - mult_y)
+
 ### 10Hz is ok for AudioOut, optimistic for AnalogOut
 frame_t = 1/1
 prev_t = time.monotonic()
@@ -163,16 +138,7 @@ while True:
     ### Add intermediate points to make line segments for each part
     ### look like continuous lines on x-y oscilloscope output
     spacing = intermediates[(frame - 1) % len(intermediates)]
-    display_data = []
-    for part in data:
-        display_data.extend(addpoints(part, spacing))
-
-    rawdata = array.array("h", (2 * len(display_data)) * [0])
-    idx = 0
-    for px, py in display_data:
-        rawdata[idx] = round(px * mult_x)
-        rawdata[idx + 1] = 0 - round(py * mult_y)
-        idx += 2
+    rawdata = scene.samples(spacing)
 
     if use_wav:
         ### 200k (maybe 166.667k) seems to be practical limit
@@ -1,9 +1,9 @@
-### scope-xy-logo-exp1 v0.8
+### scope-xy-logo-exp1 v0.11
 ### EXPERIMENTAL VERSION FOR EXPLORING BUGS
 ### Output a logo to an oscilloscope in X-Y mode on an Adafruit M4
 ### board like Feather M4 or PyGamer (best to disconnect headphones)
 
-### copy this file to PyGamer (or other M4 board) as code.py
+### copy this file to PyGamer (or other M4 board) as code.py with scope_vector.py
 
 ### MIT License
 
@@ -30,18 +30,28 @@
 import time
 import math
 import array
+import struct
+import gc
 
 import board
 import busio
 import audioio
 import analogio
 
-### TODO - split up parts of image to tell addpoints not to put in
-###        extra points - could just use (None, None) or perhaps a
-###        better data structure to give more flexibility later??
+import scope_vector
 
 ### TODO - some animation - could use controls on the PyGamer
 
+### The rotation is a cycle of frames which are calculated once,
+### these are kept in RAM if they fit, otherwise they are written
+### to a file on CIRCUITPY and read into the buffer which is not
+### playing while the other one is - this needs CIRCUITPY to be
+### writeable by CircuitPython and falls back to calculating each frame
+### if it is not, a boot.py on the PyGamer can call
+### storage.remount("/", readonly=False) when the joystick is held left
+### at power-up (board.JOYSTICK_X read with analogio.AnalogIn is low),
+### see https://learn.adafruit.com/circuitpython-essentials/circuitpython-storage
+
 ### TODO - detect and dim screen
 
 ### PyGamer voltage limit to around 2.5V
@@ -291,30 +301,6 @@ logo = [
 
 
 
-### add extra points to any lines if length is greater than min_dist
-def addpoints(points, min_dist):
-    newpoints = []
-    original_len = len(points)
-    for idx in range(original_len):
-        x1, y1 = points[idx]
-        x2, y2 = points[(idx + 1) % original_len]
-
-        ### Always keep the original point
-        newpoints.append((x1, y1))
-
-        diff_x = x2 - x1
-        diff_y = y2 - y1
-        dist = math.sqrt(diff_x ** 2 + diff_y ** 2)
-        if dist > min_dist:
-            ### Calculate extra intermediate points plus one
-            extrasp1 = int(dist // min_dist) + 1
-            for extra_idx in range(1, extrasp1):
-                ratio = extra_idx / extrasp1
-                newpoints.append((x1 + diff_x * ratio,
-                                  y1 + diff_y * ratio))
-
-    return newpoints
-
 ### If logo is off centre then correct it here
 if logo_offset_x != 0 or logo_offset_y != 0:
     data = []
@@ -338,9 +324,8 @@ for part in data:
 
 ### Add intermediate points to make line segments for each part
 ### look like continuous lines on x-y oscilloscope output
-display_data = []
-for part in data:
-    display_data.extend(addpoints(part, 3))
+scene = scope_vector.Scene(scope_vector.paths_from_parts(data))
+display_data = list(zip(*scene.points(3)))
 
 ### Calculate average
 total_x = 0
@@ -402,6 +387,98 @@ for idx, elem in enumerate(rawdata):
     if elem < 0 or elem > min(dac_x_max, dac_y_max):
         print("rawdata out of range:", idx + 1, elem)
 
+### 3 degrees per frame
+FRAME_COUNT = 120
+FRAME_CACHE_FILE = "/scope-xy-logo-frames.bin"
+RAM_RESERVE = 16 * 1024
+
+
+def rotate_into(buffer, angle):
+    """Rotate the points by angle and write them to buffer
+       as interleaved x, y values for the DACs."""
+    idx = 0
+    sine = math.sin(angle)
+    cosine = math.cos(angle)
+    for px, py in display_data:
+        pcx = px - mid_x
+        pcy = py - mid_y
+        dac_a0_x = round((-sine * pcx + cosine * pcy + halfrange_x) * mult_x)
+        dac_a1_y = round((sine * pcy + cosine * pcx + halfrange_y) * mult_y)
+        buffer[idx] = dac_a0_x - dac_x_mid   ### adjust for "h" array
+        buffer[idx + 1] = dac_a1_y - dac_y_mid   ### adjust for "h" array
+        idx += 2
+
+
+class RotationFrames:
+    """A cycle of count frames rotating the logo through 360 degrees
+       held in one array in RAM or in a file or, as a last resort,
+       calculated when needed."""
+    HEADER_FMT = "<4sII"
+    MAGIC = b"XYRF"
+
+    def __init__(self, frame_len, count, filename):
+        self.frame_len = frame_len
+        self.count = count
+        self._frames = None
+        self._file = None
+        self._header_len = struct.calcsize(self.HEADER_FMT)
+        gc.collect()
+        if count * frame_len * 2 + RAM_RESERVE < gc.mem_free():
+            self._frames = array.array("h", [0]) * (count * frame_len)
+            frames_mv = memoryview(self._frames)
+            for idx in range(count):
+                rotate_into(frames_mv[idx * frame_len:(idx + 1) * frame_len],
+                            self.angle(idx))
+            print("Frames in RAM")
+        elif filename is not None:
+            self._file = self._open_cache(filename)
+            if self._file is not None:
+                print("Frames in", filename)
+
+    def angle(self, idx):
+        return 2 * math.pi * idx / self.count
+
+    def _open_cache(self, filename):
+        """Open the cache file writing it first if it is missing or
+           has different points."""
+        header = struct.pack(self.HEADER_FMT, self.MAGIC, self.count, self.frame_len)
+        frame = array.array("h", [0]) * self.frame_len
+        check = array.array("h", [0]) * self.frame_len
+        rotate_into(frame, self.angle(self.count - 1))
+        try:
+            cache = open(filename, "rb")
+            if cache.read(self._header_len) == header:
+                cache.seek(self._header_len + (self.count - 1) * self.frame_len * 2)
+                if cache.readinto(check) == self.frame_len * 2 and check == frame:
+                    return cache
+            cache.close()
+        except OSError:
+            pass  ### does not exist yet
+
+        print("Writing", self.count, "frames to", filename)
+        try:
+            with open(filename, "wb") as cache:
+                cache.write(header)
+                for idx in range(self.count):
+                    rotate_into(frame, self.angle(idx))
+                    cache.write(frame)
+            return open(filename, "rb")
+        except OSError as ex:
+            print("Cannot write", filename, ex)
+            return None
+
+    def fill(self, buffer, idx):
+        """Put frame idx into buffer."""
+        if self._frames is not None:
+            start = idx * self.frame_len
+            memoryview(buffer)[:] = memoryview(self._frames)[start:start + self.frame_len]
+        elif self._file is not None:
+            self._file.seek(self._header_len + idx * self.frame_len * 2)
+            self._file.readinto(buffer)
+        else:
+            rotate_into(buffer, self.angle(idx))
+
+
 use_wav = True
 rubbish_wav_bug_workaround = False
 leave_wav_looping = True
@@ -415,36 +492,29 @@ else:
     a0 = analogio.AnalogOut(board.A0)
     a1 = analogio.AnalogOut(board.A1)
 
+### Two buffers with a RawSample each made once, the next frame
+### is put in the one which is not playing
+buffers = (rawdata, array.array("h", [0]) * len(rawdata))
+if use_wav:
+    ### 200k (maybe 166.667k) seems to be practical limit
+    ### 1M permissible but seems same as around 200k
+    samples = tuple(audioio.RawSample(buf,
+                                      channel_count=2,
+                                      sample_rate=200 * 1000)
+                    for buf in buffers)
+
+frames = RotationFrames(len(rawdata), FRAME_COUNT, FRAME_CACHE_FILE)
+
 ### 10Hz is ok for AudioOut, optimistic for AnalogOut
 frame_t = 1/10
 prev_t = time.monotonic()
-angle = 0
 frame = 1
+frame_idx = 0
+current = 0
+frames.fill(buffers[current], frame_idx)
 while True:
-    #print("Transforming data for frame:", frame)
-    idx = 0
-    sine = math.sin(angle)
-    cosine = math.cos(angle)
-    for px, py in display_data:
-        pcx = px - mid_x
-        pcy = py - mid_y
-        dac_a0_x = round((-sine * pcx + cosine * pcy + halfrange_x) * mult_x)
-        #dac_a0_x = min(dac_a0_x, dac_x_max)
-        #dac_a0_x = max(dac_a0_x, 0)
-        dac_a1_y = round((sine * pcy + cosine * pcx + halfrange_y) * mult_y)
-        #dac_a1_y = min(dac_a1_y, dac_y_max)
-        #dac_a1_y = max(dac_a1_y, 0)
-        rawdata[idx] = dac_a0_x - dac_x_mid   ### adjust for "h" array
-        rawdata[idx + 1] = dac_a1_y - dac_y_mid   ### adjust for "h" array
-        #print("XY", dac_a0_x, dac_a1_y)
-        idx += 2
-
     if use_wav:
-        ### 200k (maybe 166.667k) seems to be practical limit
-        ### 1M permissible but seems same as around 200k
-        output_wave = audioio.RawSample(rawdata,
-                                        channel_count=2,
-                                        sample_rate=200 * 1000)
+        output_wave = samples[current]
 
         ### The image may "warp" sometimes with loop=True due to a strange bug
         ### https://github.com/adafruit/circuitpython/issues/1992
@@ -455,11 +525,14 @@ while True:
                     break
         else:
             dacs.play(output_wave, loop=True)
+            ### Get the next frame ready while this one plays
+            frames.fill(buffers[1 - current], (frame_idx + 1) % frames.count)
             while time.monotonic() - prev_t < frame_t:
                 pass
             if not leave_wav_looping:
                 dacs.stop()
     else:
+        rawdata = buffers[current]
         while True:
             ### This gives a very flickery image with 4932 points
             ### slight flicker at 2552
@@ -469,6 +542,9 @@ while True:
                 a1.value = rawdata[idx + 1]
             if time.monotonic() - prev_t >= frame_t:
                 break
+    if not use_wav or rubbish_wav_bug_workaround:
+        frames.fill(buffers[1 - current], (frame_idx + 1) % frames.count)
     prev_t = time.monotonic()
-    angle += math.pi / 180 * 3 ### 72 degrees per frame
+    frame_idx = (frame_idx + 1) % frames.count
+    current = 1 - current
     frame += 1
@@ -0,0 +1,247 @@
+### scope-vector v1.0
+
+"""Vector paths for drawing on an oscilloscope in X-Y mode
+with resampling to a constant beam speed, ordering to reduce
+the jumps between paths and text from FONT_VECTOR_SIMPLE.
+"""
+
+### copy this file to PyGamer (or other M4 board) with the scope-xy scripts
+### and fonts/font_vector_simple.py if text is used
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### This replaces the addpoints() function which was in each scope-xy script,
+### resampling here is by position along the whole path using interp()
+### so the beam moves at the same speed along every segment and the
+### original points are kept so corners stay sharp
+
+import math
+import array
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    try:
+        import numpy as np  ### desktop Python
+    except ImportError:
+        np = None
+
+
+FONT_WIDTH = 36
+FONT_HEIGHT = 50
+FONT_GAP = 12
+
+
+class Path:
+    """A polyline stored as x, y pairs in an array,
+       closed paths have a line from the last point back to the first."""
+
+    def __init__(self, points, closed=None):
+        self.coords = array.array("f", [0.0]) * (2 * len(points))
+        for idx, (x, y) in enumerate(points):
+            self.coords[2 * idx] = x
+            self.coords[2 * idx + 1] = y
+        ### Two points define a straight line so are never closed
+        self.closed = len(points) > 2 if closed is None else closed
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def point(self, idx):
+        return self.coords[2 * idx], self.coords[2 * idx + 1]
+
+    def reversed(self):
+        return Path([self.point(idx) for idx in range(len(self) - 1, -1, -1)],
+                    self.closed)
+
+    def rotated(self, start):
+        """A closed path starting from the point at index start."""
+        count = len(self)
+        return Path([self.point((start + idx) % count) for idx in range(count)],
+                    self.closed)
+
+    def translated(self, dx, dy, scale=1.0):
+        return Path([(x * scale + dx, y * scale + dy)
+                     for x, y in (self.point(idx) for idx in range(len(self)))],
+                    self.closed)
+
+
+def paths_from_parts(parts, offset_x=0, offset_y=0):
+    """Make Paths from lists of (x, y) like the data in adafruit_logo_vector."""
+    return [Path([(x - offset_x, y - offset_y) for x, y in part])
+            for part in parts if part]
+
+
+def _vertices(path):
+    points = [path.point(idx) for idx in range(len(path))]
+    if path.closed and len(points) > 1:
+        points.append(points[0])
+    return points
+
+
+def resample(path, spacing):
+    """Return the x and y values of points along path no more than spacing
+       apart including all the original points, these are ndarrays
+       if ulab or NumPy is present otherwise arrays."""
+    vertices = _vertices(path)
+    cum = [0.0]
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:]):
+        cum.append(cum[-1] + math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2))
+    total = cum[-1]
+    steps = max(1, math.ceil(total / spacing))
+
+    ### The end point of a closed path is the start so is left out
+    end = len(vertices) - 1 if path.closed else len(vertices)
+    if np is not None:
+        cum_np = np.array(cum)
+        pos = np.concatenate((np.linspace(0, total, steps, endpoint=False),
+                              cum_np[1:end]))
+        pos = np.sort(pos)
+        xs = np.interp(pos, cum_np, np.array([v[0] for v in vertices]))
+        ys = np.interp(pos, cum_np, np.array([v[1] for v in vertices]))
+        return xs, ys
+
+    xs = array.array("f")
+    ys = array.array("f")
+    for idx in range(end):
+        x1, y1 = vertices[idx]
+        xs.append(x1)
+        ys.append(y1)
+        if idx + 1 == len(vertices):
+            break
+        x2, y2 = vertices[idx + 1]
+        extras = math.ceil((cum[idx + 1] - cum[idx]) / spacing)
+        for extra_idx in range(1, extras):
+            ratio = extra_idx / extras
+            xs.append(x1 + (x2 - x1) * ratio)
+            ys.append(y1 + (y2 - y1) * ratio)
+    return xs, ys
+
+
+def order_paths(paths, start=(0.0, 0.0)):
+    """Greedy nearest neighbour ordering of paths to shorten the jumps
+       between them, open paths may be reversed and closed ones
+       started from any point."""
+    remaining = list(paths)
+    ordered = []
+    cur_x, cur_y = start
+    while remaining:
+        best = None
+        best_dist = None
+        for r_idx, path in enumerate(remaining):
+            if path.closed:
+                candidates = range(len(path))
+            else:
+                candidates = (0, len(path) - 1)
+            for p_idx in candidates:
+                x, y = path.point(p_idx)
+                dist = (x - cur_x) ** 2 + (y - cur_y) ** 2
+                if best_dist is None or dist < best_dist:
+                    best = (r_idx, p_idx)
+                    best_dist = dist
+        r_idx, p_idx = best
+        path = remaining.pop(r_idx)
+        if path.closed:
+            if p_idx:
+                path = path.rotated(p_idx)
+            cur_x, cur_y = path.point(0)
+        else:
+            if p_idx:
+                path = path.reversed()
+            cur_x, cur_y = path.point(len(path) - 1)
+        ordered.append(path)
+    return ordered
+
+
+def text_paths(text, x=0.0, y=0.0, height=FONT_HEIGHT, font=None):
+    """Open Paths for text with its top-left at (x, y), unknown
+       characters and ones without strokes are left as spaces."""
+    if font is None:
+        from font_vector_simple import FONT_VECTOR_SIMPLE  ### pylint: disable=import-outside-toplevel
+        font = FONT_VECTOR_SIMPLE
+    scale = height / FONT_HEIGHT
+    paths = []
+    char_x = x
+    for char in text:
+        for stroke in font.get(char.upper(), ()):
+            if len(stroke) >= 2:
+                paths.append(Path(stroke, False).translated(char_x, y, scale))
+        char_x += (FONT_WIDTH + FONT_GAP) * scale
+    return paths
+
+
+class Scene:
+    """Paths which are ordered once with the resampled points and the
+       DAC sample buffers cached for each spacing used.
+       The DAC values are round(x * mult_x + add_x) and likewise for y
+       interleaved for a two channel RawSample.
+    """
+
+    def __init__(self, paths, mult_x=1.0, mult_y=1.0, add_x=0.0, add_y=0.0,
+                 *, order=True):
+        self.paths = order_paths(paths) if order else list(paths)
+        self._mult_x = mult_x
+        self._mult_y = mult_y
+        self._add_x = add_x
+        self._add_y = add_y
+        self._points = {}
+        self._samples = {}
+
+    def points(self, spacing):
+        """All the resampled x and y values for the scene."""
+        cached = self._points.get(spacing)
+        if cached is None:
+            parts = [resample(path, spacing) for path in self.paths]
+            if np is not None:
+                cached = (np.concatenate([p[0] for p in parts]),
+                          np.concatenate([p[1] for p in parts]))
+            else:
+                cached = (array.array("f"), array.array("f"))
+                for xs, ys in parts:
+                    cached[0].extend(xs)
+                    cached[1].extend(ys)
+            self._points[spacing] = cached
+        return cached
+
+    def samples(self, spacing):
+        """Interleaved signed 16 bit x, y values for the DACs."""
+        cached = self._samples.get(spacing)
+        if cached is None:
+            xs, ys = self.points(spacing)
+            if np is not None:
+                cached = np.zeros(2 * len(xs), dtype=np.int16)
+                cached[0::2] = np.array(np.around(xs * self._mult_x + self._add_x),
+                                        dtype=np.int16)
+                cached[1::2] = np.array(np.around(ys * self._mult_y + self._add_y),
+                                        dtype=np.int16)
+            else:
+                cached = array.array("h", [0]) * (2 * len(xs))
+                for idx, (x, y) in enumerate(zip(xs, ys)):
+                    cached[2 * idx] = round(x * self._mult_x + self._add_x)
+                    cached[2 * idx + 1] = round(y * self._mult_y + self._add_y)
+            self._samples[spacing] = cached
+        return cached
+
+    def clear(self):
+        self._points.clear()
+        self._samples.clear()
@@ -1,10 +1,11 @@
-### scope-xy-adafruitlogo v1.0
+### scope-xy-adafruitlogo v1.1
 
 """Output a logo to an oscilloscope in X-Y mode on an Adafruit M4
 board like Feather M4 or PyGamer (best to disconnect headphones).
 """
 
 ### copy this file to PyGamer (or other M4 board) as code.py
+### with adafruit_logo_vector.py, scope_vector.py and font_vector_simple.py
 
 ### MIT License
 
@@ -38,57 +39,30 @@ import analogio
 
 ### Vector data for logo
 import adafruit_logo_vector
+import scope_vector
+from scope_vector import np
 
 VECTOR_POINT_SPACING = 3
-
-def addpoints(points, min_dist):
-    """Add extra points to any lines if length is greater than min_dist"""
-
-    newpoints = []
-    original_len = len(points)
-    for pidx in range(original_len):
-        px1, py1 = points[pidx]
-        px2, py2 = points[(pidx + 1) % original_len]
-
-        ### Always keep the original point
-        newpoints.append((px1, py1))
-
-        diff_x = px2 - px1
-        diff_y = py2 - py1
-        dist = math.sqrt(diff_x ** 2 + diff_y ** 2)
-        if dist > min_dist:
-            ### Calculate extra intermediate points plus one
-            extrasp1 = int(dist // min_dist) + 1
-            for extra_idx in range(1, extrasp1):
-                ratio = extra_idx / extrasp1
-                newpoints.append((px1 + diff_x * ratio,
-                                  py1 + diff_y * ratio))
-        ### Two points define a straight line
-        ### so no need to connect final point back to first
-        if original_len == 2:
-            break
-
-    return newpoints
+### Text shown under the logo, font_vector_simple has
+### A C D E Z 0 3 4 5 9 so far
+TEXT = ""
+TEXT_HEIGHT = 40
 
 ### pylint: disable=invalid-name
-### If logo is off centre then correct it here
-if adafruit_logo_vector.offset_x != 0 or adafruit_logo_vector.offset_y != 0:
-    data = []
-    for part in adafruit_logo_vector.data:
-        newpart = []
-        for point in part:
-            newpart.append((point[0] - adafruit_logo_vector.offset_x,
-                            point[1] - adafruit_logo_vector.offset_y))
-        data.append(newpart)
-else:
-    data = adafruit_logo_vector.data
-
+### If logo is off centre then it is corrected by the offsets
+paths = scope_vector.paths_from_parts(adafruit_logo_vector.data,
+                                      adafruit_logo_vector.offset_x,
+                                      adafruit_logo_vector.offset_y)
+if TEXT:
+    text_width = len(TEXT) * (scope_vector.FONT_WIDTH
+                              + scope_vector.FONT_GAP) * TEXT_HEIGHT / scope_vector.FONT_HEIGHT
+    paths.extend(scope_vector.text_paths(TEXT, 256 - text_width / 2, 460, TEXT_HEIGHT))
 
 ### Add intermediate points to make line segments for each part
-### look like continuous lines on x-y oscilloscope output
-display_data = []
-for part in data:
-    display_data.extend(addpoints(part, VECTOR_POINT_SPACING))
+### look like continuous lines on x-y oscilloscope output,
+### the parts are ordered to minimise the jumps between them
+scene = scope_vector.Scene(paths)
+points_x, points_y = scene.points(VECTOR_POINT_SPACING)
 
 ### PyPortal DACs seem to stop around 53000 and there's 2 100 ohm resistors
 ### on output so maybe large values aren't good idea?
@@ -109,7 +83,7 @@ dac_y_mid = dac_y_max // 2
 ### cause the CircuitPython audio libraries to make a copy of
 ### rawdata which is useful to allow animating code to modify rawdata
 ### without affecting current DAC output
-rawdata = array.array("h", (2 * len(display_data)) * [0])
+rawdata = array.array("h", (2 * len(points_x)) * [0])
 
 range_x = 512.0
 range_y = 512.0
@@ -120,6 +94,12 @@ mid_y = 256.0
 mult_x = dac_x_max / range_x
 mult_y = dac_y_max / range_y
 
+if np is not None:
+    ### The rotation is done on whole arrays with ulab
+    rawdata = np.zeros(2 * len(points_x), dtype=np.int16)
+    points_cx = points_x - mid_x
+    points_cy = points_y - mid_y
+
 ### https://github.com/adafruit/circuitpython/issues/1992
 print("length of rawdata", len(rawdata))
 
@@ -145,23 +125,31 @@ while True:
     ##print("Transforming data for frame:", frame, "at", prev_t)
 
     ### Rotate the points of the vector graphic around its centre
-    idx = 0
     sine = math.sin(angle)
     cosine = math.cos(angle)
-    for px, py in display_data:
-        pcx = px - mid_x
-        pcy = py - mid_y
-        dac_a0_x = round((-sine * pcx + cosine * pcy + halfrange_x) * mult_x)
-        ### Keep x position within legal values (if needed)
-        ##dac_a0_x = min(dac_a0_x, dac_x_max)
-        ##dac_a0_x = max(dac_a0_x, 0)
-        dac_a1_y = round((sine * pcy + cosine * pcx + halfrange_y) * mult_y)
-        ### Keep y position within legal values (if needed)
-        ##dac_a1_y = min(dac_a1_y, dac_y_max)
-        ##dac_a1_y = max(dac_a1_y, 0)
-        rawdata[idx] = dac_a0_x - dac_x_mid      ### adjust for "h" array
-        rawdata[idx + 1] = dac_a1_y - dac_y_mid  ### adjust for "h" array
-        idx += 2
+    if np is not None:
+        rawdata[0::2] = np.array(np.around((-sine * points_cx + cosine * points_cy
+                                            + halfrange_x) * mult_x - dac_x_mid),
+                                 dtype=np.int16)
+        rawdata[1::2] = np.array(np.around((sine * points_cy + cosine * points_cx
+                                            + halfrange_y) * mult_y - dac_y_mid),
+                                 dtype=np.int16)
+    else:
+        idx = 0
+        for px, py in zip(points_x, points_y):
+            pcx = px - mid_x
+            pcy = py - mid_y
+            dac_a0_x = round((-sine * pcx + cosine * pcy + halfrange_x) * mult_x)
+            ### Keep x position within legal values (if needed)
+            ##dac_a0_x = min(dac_a0_x, dac_x_max)
+            ##dac_a0_x = max(dac_a0_x, 0)
+            dac_a1_y = round((sine * pcy + cosine * pcx + halfrange_y) * mult_y)
+            ### Keep y position within legal values (if needed)
+            ##dac_a1_y = min(dac_a1_y, dac_y_max)
+            ##dac_a1_y = max(dac_a1_y, 0)
+            rawdata[idx] = dac_a0_x - dac_x_mid      ### adjust for "h" array
+            rawdata[idx + 1] = dac_a1_y - dac_y_mid  ### adjust for "h" array
+            idx += 2
 
     if use_wav:
         ### 200k (maybe 166.667k) seems to be practical limit
@@ -1,4 +1,4 @@
-### cordlepy 1.5
+### cordlepy 1.9
 ### A port of Wordle word game
 
 ### Tested with an Adafruit PyPortal and an Adafruit CLUE
@@ -53,6 +53,7 @@ import os
 import gc
 import random
 import re
+import struct
 
 import board
 import displayio
@@ -92,6 +93,13 @@ BLUE = 0x0000d0
 
 ROUNDS = 1
 MAX_GUESSES = 6
+### The word of the day is worked out from the RTC without Wi-Fi if it
+### has been set since power-up by a sync which is less than a day old
+RTC_VALID_YEAR = 2022
+SYNC_MAX_AGE_S = 24 * 60 * 60
+### Grid scrolls up one row with an ease in and out
+SCROLL_STEPS = 12
+SCROLL_FPS = 30
 ### Whether the guess has to be from words - this is set
 ### to False later for < 100 words
 GRADE_TEXT = ["Genius",
@@ -129,6 +137,7 @@ class GameWords:
         self._threshold = threshold
         self._first_line_off = 0
         self._fh = None
+        self.state = None  ### GameState needed for RANDOM_NO_REPEAT
         self._initWords(url)
 
     def _initWords(self, url):
@@ -156,6 +165,8 @@ class GameWords:
                             self._selector = self.ONE_A_DAY
                         elif token == "dictionary":
                             self._dictionary_rule = True
+                        elif token == "no_repeat":
+                            self._selector = self.RANDOM_NO_REPEAT
                     except IndexError:
                         break
             else:
@@ -194,7 +205,9 @@ class GameWords:
         elif self._selector == self.RANDOM:
             w_idx = random.randrange(self._word_count)
         elif self._selector == self.RANDOM_NO_REPEAT:
-            raise NotImplementedError("yet!")
+            if self.state is None:
+                raise ValueError("RANDOM_NO_REPEAT needs a GameState")
+            w_idx = self.state.takeUnused()
         elif self._selector == self.INORDER:
             w_idx = self._selector_value
             self._selector_value += 1
@@ -253,43 +266,165 @@ class GameWords:
         self._selector_value = new_value
 
 
-def fetchDate(wrds):
-    word_idx = None
+class GameState:
+    """A record of the last time sync, the word of the day index and
+       a bitset of the word indices used by RANDOM_NO_REPEAT kept in
+       nvm (microcontroller.nvm) or only in RAM if nvm is None.
+       The record is discarded if the number of words changes."""
+    MAGIC = b"CDL1"
+    ### magic, word count, sync time, sync day ordinal, word index, used count
+    _HEADER_FMT = "<4sIIIiI"
+    _HEADER_LEN = struct.calcsize(_HEADER_FMT)
+
+    def __init__(self, nvm, word_count):
+        self.word_count = word_count
+        self.sync_time = 0
+        self.sync_day = 0
+        self.word_idx = 0
+        self.used_count = 0
+        self._bits = bytearray((word_count + 7) // 8)
+        self._nvm = nvm
+        if nvm is not None and len(nvm) < self._HEADER_LEN + len(self._bits):
+            d_print(1, "Not enough nvm for", word_count, "words")
+            self._nvm = None
+
+        if self._nvm is not None:
+            (magic, count, self.sync_time, self.sync_day,
+             self.word_idx, self.used_count) = struct.unpack(self._HEADER_FMT,
+                                                             bytes(self._nvm[0:self._HEADER_LEN]))
+            if magic == self.MAGIC and count == word_count:
+                self._bits[:] = self._nvm[self._HEADER_LEN:self._HEADER_LEN + len(self._bits)]
+                ### A reset between writing a bit and the header leaves
+                ### the stored count behind so the bitset is the truth
+                self.used_count = self._countUsed()
+                return
+            self.sync_time = self.sync_day = self.word_idx = 0
+        self._resetUsed()
+
+
+    def _saveHeader(self):
+        if self._nvm is not None:
+            self._nvm[0:self._HEADER_LEN] = struct.pack(self._HEADER_FMT, self.MAGIC,
+                                                        self.word_count,
+                                                        self.sync_time, self.sync_day,
+                                                        self.word_idx, self.used_count)
+
+
+    def _countUsed(self):
+        """The number of used words from the bitset less the padding bits."""
+        used = 0
+        for byte in self._bits:
+            used += bin(byte).count("1")
+        return used - (len(self._bits) * 8 - self.word_count)
+
+
+    def _resetUsed(self):
+        """Clear the bitset, the padding bits in the last byte are set
+           so every clear bit is an unused word."""
+        for idx in range(len(self._bits)):
+            self._bits[idx] = 0
+        if self.word_count & 7:
+            self._bits[-1] = 0xff & ~((1 << (self.word_count & 7)) - 1)
+        self.used_count = 0
+        if self._nvm is not None:
+            self._nvm[self._HEADER_LEN:self._HEADER_LEN + len(self._bits)] = self._bits
+        self._saveHeader()
 
-    ### alarm.sleep_memory isn't present on PyPortal
-    ### Storing the word_idx in a register on the temperature sensor - niishhh!
-    import adafruit_adt7410
-    adafruit_adt7410.ADT7410.reset = lambda self: self  ### nobble the reset
-    adt = adafruit_adt7410.ADT7410(board.I2C(), address=0x48)
-    ### Look for a value (well) below default of 10 degrees
-    if adt.low_temperature < 0.0:
-        word_idx = round((0.0 - adt.low_temperature) * 128)
+
+    @property
+    def synced(self):
+        return self.sync_day != 0
+
+
+    def setSync(self, sync_time, sync_day, word_idx):
+        self.sync_time = sync_time
+        self.sync_day = sync_day
+        self.word_idx = word_idx
+        self._saveHeader()
+
+
+    def setWordIdx(self, word_idx):
+        if word_idx != self.word_idx:
+            self.word_idx = word_idx
+            self._saveHeader()
+
+
+    def takeUnused(self):
+        """Pick a random word index which has not been used and mark it as
+           used, when they have all been used they all become unused."""
+        if self.used_count >= self.word_count:
+            self._resetUsed()
+        nth = random.randrange(self.word_count - self.used_count)
+        for byte_idx, byte in enumerate(self._bits):
+            free = 8 - bin(byte).count("1")
+            if nth >= free:
+                nth -= free
+                continue
+            for bit in range(8):
+                if not byte & (1 << bit):
+                    if nth == 0:
+                        break
+                    nth -= 1
+            self._bits[byte_idx] = byte | (1 << bit)
+            if self._nvm is not None:
+                self._nvm[self._HEADER_LEN + byte_idx] = self._bits[byte_idx]
+            self.used_count += 1
+            self._saveHeader()
+            return byte_idx * 8 + bit
+
+        ### Only reached if used_count is wrong, start again rather than fail
+        d_print(1, "Used word count", self.used_count, "does not match bitset")
+        self._resetUsed()
+        return self.takeUnused()
+
+
+def syncDate(wrds, state, wifi=True):
+    """Set the index for the word of the day from the RTC if it has been
+       set since power-up and the last sync is recent, otherwise sync the
+       time over Wi-Fi and reload as the RTC keeps its value over a reload.
+       The last word index is used if there's no Wi-Fi or it fails."""
+    import adafruit_datetime
+    start_oday = adafruit_datetime.date(*wrds.selector_value).toordinal()
+    now_s = time.time()
+    now = time.localtime()
+    if (state.synced and now.tm_year >= RTC_VALID_YEAR
+            and 0 <= now_s - state.sync_time < SYNC_MAX_AGE_S):
+        word_idx = adafruit_datetime.date(*now[:3]).toordinal() - start_oday
+        d_print(1, "word_idx", word_idx, "from RTC")
+        state.setWordIdx(word_idx)
         wrds.selector_value = word_idx
-        d_print(1, "Retrieved word_idx", word_idx)
-
-    ### If word_idx isn't set need to fetch the data from t'Internet
-    if word_idx is None:
-        import supervisor
-        import adafruit_datetime
-        from adafruit_pyportal import PyPortal
-        pyportal = PyPortal(status_neopixel=board.NEOPIXEL)
-        pyportal.get_local_time()
-        wordle_oday = adafruit_datetime.date(*wrds.selector_value).toordinal()
-        now_oday = adafruit_datetime.datetime.now().toordinal()
-        word_idx = now_oday - wordle_oday
-        d_print(1, "Saving word_idx", word_idx)
-        adt.low_temperature = (0 - word_idx ) / 128
-        time.sleep(10)
-        supervisor.reload()
+        return
+
+    if wifi:
+        try:
+            import supervisor
+            from adafruit_pyportal import PyPortal
+            d_print(1, "Fetch the time over Wi-Fi and set the word of the day")
+            pyportal = PyPortal(status_neopixel=board.NEOPIXEL)
+            pyportal.get_local_time()
+            now_oday = adafruit_datetime.date(*time.localtime()[:3]).toordinal()
+            word_idx = now_oday - start_oday
+            d_print(1, "Saving word_idx", word_idx)
+            state.setSync(time.time(), now_oday, word_idx)
+            supervisor.reload()
+        except (RuntimeError, OSError, ValueError) as ex:
+            print("Failed to sync time:", repr(ex))
+
+    d_print(1, "Using last word_idx", state.word_idx)
+    wrds.selector_value = state.word_idx
 
 
 words = GameWords()
 gc.collect()
 d_print(3, "GC after retrieveWords", gc.mem_free())
 
-if not clue and words.selector == GameWords.ONE_A_DAY:
-    d_print(1, "Fetch the time over Wi-Fi and set the word of the day")
-    fetchDate(words)
+if words.selector in (GameWords.ONE_A_DAY, GameWords.RANDOM_NO_REPEAT):
+    import microcontroller
+    words.state = GameState(microcontroller.nvm, len(words))
+    gc.collect()
+
+if words.selector == GameWords.ONE_A_DAY:
+    syncDate(words, words.state, wifi=not clue)
 
 
 if clue:
@@ -410,11 +545,105 @@ class WordGrid():
         self._dio_group.y = value
 
 
+class BitmapWordGrid(WordGrid):
+    """A WordGrid drawn as one TileGrid using tiles from a sheet Bitmap
+       with a tile for each letter and background colour, the tiles are
+       rendered from the font's glyphs when first used.
+       Changing a letter or colour is a single tile index change
+       so a row can be updated with one refresh."""
+    LETTERS = " ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    _STATES = (WordGrid.DEFAULT, WordGrid.PRESENT, WordGrid.CORRECT_POSITION)
+    _GAP = 0
+    _INK = 1
+    _STATE_COL = 2  ### palette index of first state colour
+
+    def __init__(self, word_len=5, num_words=6,
+                 font=terminalio.FONT, font_scale=2,
+                 square_size=14, tile_size=17):
+        ### tile_size * font_scale is the 34 pixel spacing used by WordGrid
+        self._font = font
+        self._square_size = square_size
+        self._tile_size = tile_size
+        self._palette = displayio.Palette(self._STATE_COL + len(self._STATES))
+        self._palette[self._GAP] = BLACK
+        self._palette.make_transparent(self._GAP)
+        self._palette[self._INK] = BLACK
+        for s_idx, colour in enumerate(self._STATES):
+            self._palette[self._STATE_COL + s_idx] = colour
+
+        num_tiles = len(self.LETTERS) * len(self._STATES)
+        self._sheet = displayio.Bitmap(tile_size * len(self.LETTERS),
+                                       tile_size * len(self._STATES),
+                                       len(self._palette))
+        self._rendered = bytearray(num_tiles)
+        self._renderTile(0)
+        self._tiles = displayio.TileGrid(self._sheet, pixel_shader=self._palette,
+                                         width=word_len, height=num_words,
+                                         tile_width=tile_size, tile_height=tile_size,
+                                         default_tile=0)
+        ### Positioned to match the padded Labels of WordGrid
+        self._tiles.x = -4
+        self._tiles.y = -7
+        self._dio_words = displayio.Group(scale=font_scale)
+        self._dio_words.append(self._tiles)
+
+        self._dio_group = displayio.Group()
+        self._dio_group.x = 86  ### TODO properly
+        self._dio_group.y = 18   ### TODO properly
+        self._dio_group.append(self._dio_words)
+
+
+    def _renderTile(self, tile_idx):
+        """Draw the background square and glyph for a tile into the sheet."""
+        s_idx, l_idx = divmod(tile_idx, len(self.LETTERS))
+        x0 = l_idx * self._tile_size
+        y0 = s_idx * self._tile_size
+        for y in range(self._square_size):
+            for x in range(self._square_size):
+                self._sheet[x0 + x, y0 + y] = self._STATE_COL + s_idx
+
+        glyph = self._font.get_glyph(ord(self.LETTERS[l_idx]))
+        if glyph is not None:
+            ### Glyphs may be tiles in a larger bitmap like terminalio.FONT
+            g_bitmap = glyph.bitmap
+            tiles_per_row = g_bitmap.width // glyph.width
+            g_x = (glyph.tile_index % tiles_per_row) * glyph.width
+            g_y = (glyph.tile_index // tiles_per_row) * glyph.height
+            width = min(glyph.width, self._square_size)
+            height = min(glyph.height, self._square_size)
+            off_x = x0 + (self._square_size - width) // 2
+            off_y = y0 + (self._square_size - height) // 2
+            for y in range(height):
+                for x in range(width):
+                    if g_bitmap[g_x + x, g_y + y]:
+                        self._sheet[off_x + x, off_y + y] = self._INK
+        self._rendered[tile_idx] = 1
+
+
+    def set(self, widx, cidx, letter, bg):
+        s_idx, l_idx = divmod(self._tiles[cidx, widx], len(self.LETTERS))
+        if letter is not None:
+            l_idx = max(0, self.LETTERS.find(letter))
+        if bg is not None:
+            s_idx = self._STATES.index(bg)
+        tile_idx = s_idx * len(self.LETTERS) + l_idx
+        if not self._rendered[tile_idx]:
+            self._renderTile(tile_idx)
+        self._tiles[cidx, widx] = tile_idx
+
+    def get(self, widx, cidx):
+        s_idx, l_idx = divmod(self._tiles[cidx, widx], len(self.LETTERS))
+        return (self.LETTERS[l_idx], self._STATES[s_idx])
+
+
 class Keyboard():
     BACKSPACE = 8
     ENTER = 13
     OFF_KEYBOARD = -1
 
+    ### Touch hit test grid is in 4x4 pixel cells
+    _HIT_SHIFT = 2
+
     _ALPHA_LAYOUT = {"QUERTY": [["qwertyuiop",0],
                                 ["asdfghjkl", 0.4],
                                 ["zxcvbnm", 0.8]]}
@@ -429,6 +658,7 @@ class Keyboard():
                  keycap_bg=0x404040,
                  keycap_font=terminalio.FONT,
                  min_press_time=0.08,  ### 80ms plus library delay required for a press
+                 sample_period=0.01,
                  max_width=None,
                  max_height=None,
                  cb=None,
@@ -448,6 +678,10 @@ class Keyboard():
         self._keycap_fg = keycap_fg
         self._keycap_bg = keycap_bg
         self._keycap_font = keycap_font
+        self._hit_grid = None
+        self._hit_cols = 0
+        self._hit_rows = 0
+        self._hit_keys = []
         self._initKeys(layout,
                        enter=enter, backspace=backspace, space=space,
                        numbers=numbers, keycaps_upper=keycaps_upper,
@@ -464,6 +698,7 @@ class Keyboard():
         self._keycursor = None
 
         self._min_press_time = min_press_time
+        self._sample_period_ns = round(sample_period * 1e9)
         self._cb = cb
         self._cb_kwargs = cb_kwargs
         self._blank_char = blank_char
@@ -527,6 +762,7 @@ class Keyboard():
                                         width=wide_width)
                 button_row.append(butt)
                 key_row.append(self.ENTER)
+                self._hit_keys.append((row_idx, col_idx, butt))
                 x_pos += wide_width + self._key_x_space
                 col_idx += 1
 
@@ -535,6 +771,7 @@ class Keyboard():
                                         char.upper() if keycaps_upper else char)
                 button_row.append(butt)
                 key_row.append(char)
+                self._hit_keys.append((row_idx, col_idx, butt))
                 x_pos += self._key_width + self._key_x_space
                 col_idx += 1
 
@@ -545,9 +782,47 @@ class Keyboard():
                                         width=wide_width)
                 button_row.append(butt)
                 key_row.append(self.BACKSPACE)
+                self._hit_keys.append((row_idx, col_idx, butt))
                 x_pos += wide_width + self._key_x_space
                 col_idx += 1
 
+        self._initHitGrid()
+
+
+    def _initHitGrid(self):
+        """Make a bytearray indexed by the quantised touch position on
+           the keyboard with the index of the key in _hit_keys plus one
+           or 0 for the gaps between keys.
+           A cell belongs to a key if the cell's centre is on the key."""
+        cell = 1 << self._HIT_SHIFT
+        half = cell // 2
+        right = max(butt.x + butt.width for _, _, butt in self._hit_keys)
+        bottom = max(butt.y + butt.height for _, _, butt in self._hit_keys)
+        self._hit_cols = (right >> self._HIT_SHIFT) + 1
+        self._hit_rows = (bottom >> self._HIT_SHIFT) + 1
+        self._hit_grid = bytearray(self._hit_cols * self._hit_rows)
+        for key_num, (_, _, butt) in enumerate(self._hit_keys, 1):
+            for g_y in range(butt.y >> self._HIT_SHIFT,
+                             ((butt.y + butt.height) >> self._HIT_SHIFT) + 1):
+                if not butt.y <= g_y * cell + half <= butt.y + butt.height:
+                    continue
+                row_off = g_y * self._hit_cols
+                for g_x in range(butt.x >> self._HIT_SHIFT,
+                                 ((butt.x + butt.width) >> self._HIT_SHIFT) + 1):
+                    if butt.x <= g_x * cell + half <= butt.x + butt.width:
+                        self._hit_grid[row_off + g_x] = key_num
+
+
+    def _keyAt(self, x, y):
+        """The (row, col) of the key at display coordinates x, y or None."""
+        g_x = int(x - self._dio_keyboard.x) >> self._HIT_SHIFT
+        g_y = int(y - self._dio_keyboard.y) >> self._HIT_SHIFT
+        if 0 <= g_x < self._hit_cols and 0 <= g_y < self._hit_rows:
+            key_num = self._hit_grid[g_y * self._hit_cols + g_x]
+            if key_num:
+                return self._hit_keys[key_num - 1][:2]
+        return None
+
 
     def showKeyboard(self):
         if len(self._dio_group) == 0:
@@ -583,57 +858,53 @@ class Keyboard():
         return key_verdict if key_verdict != self.OFF_KEYBOARD else None
 
 
+    def _samplePause(self, next_time_ns):
+        """Sleep until the next touch sample is due returning its time,
+           if sampling has fallen behind the schedule restarts from now."""
+        next_time_ns += self._sample_period_ns
+        wait_ns = next_time_ns - time.monotonic_ns()
+        if wait_ns > 0:
+            time.sleep(wait_ns / 1e9)
+            return next_time_ns
+        return time.monotonic_ns()
+
+
     def _getCharTouchScreen(self):
         key = None
 
         point = None
-        last_button = None
+        last_rowcol = None
         presses = []
         while key is None:
+            sample_time_ns = time.monotonic_ns()
             while True:
                 point = self._touch_screen.touch_point
                 if point is not None:
                     break
+                sample_time_ns = self._samplePause(sample_time_ns)
 
             while True:
-                ### Scan each key
-                key_pressed = False
-                for row_idx, row in enumerate(self._dio_keyboard):
-                    for col_idx, butt in enumerate(row):
-                        point_keyb = (point[0] - self._dio_keyboard.x,
-                                      point[1] - self._dio_keyboard.y)
-                        if butt.contains(point_keyb):
-                            key_pressed = True
-                            if last_button != butt:
-                                key = self._keys[row_idx][col_idx]
-                                presses.append([key, time.monotonic_ns()])
-                                if last_button is not None:
-                                    last_button.selected = False
-                                butt.selected = True
-                                last_button = butt
-                            break
-                    if key_pressed:
-                        break
-
-                ### Ignore press if touch has slid off the keyboard
-                if not key_pressed and key != self.OFF_KEYBOARD:
-                    key = self.OFF_KEYBOARD
+                rowcol = self._keyAt(point[0], point[1])
+                if rowcol is None:
+                    ### Ignore press if touch has slid off the keyboard
+                    if key != self.OFF_KEYBOARD:
+                        key = self.OFF_KEYBOARD
+                        presses.append([key, time.monotonic_ns()])
+                        self._buttonSelect(None, last_rowcol)
+                        last_rowcol = None
+                elif rowcol != last_rowcol:
+                    key = self._keys[rowcol[0]][rowcol[1]]
                     presses.append([key, time.monotonic_ns()])
-                    if last_button is not None:
-                        last_button.selected = False
-                        last_button = None
+                    self._buttonSelect(rowcol, last_rowcol)
+                    last_rowcol = rowcol
 
+                sample_time_ns = self._samplePause(sample_time_ns)
                 point = self._touch_screen.touch_point
                 if point is None:
                     break
 
             key = self._decodePresses(presses, time.monotonic_ns())
-            if last_button:
-                last_button.selected = False
-
-        ### Clear the visible selection
-        if last_button:
-            last_button.selected = False
+            self._buttonSelect(None, last_rowcol)
 
         return key
 
@@ -836,8 +1107,9 @@ display.show(main_group)
 
 ### Show empty word grid
 ##grid = WordGrid(font=default_font, font_scale=default_font_scale)
+##grid = WordGrid()
 gc.collect()
-grid = WordGrid()
+grid = BitmapWordGrid()
 gc.collect()
 d_print(3, "GC after WordGrid", gc.mem_free())
 main_group.append(grid.group)
@@ -852,6 +1124,10 @@ d_print(3, "GC after Keyboard", gc.mem_free())
 main_group.append(keyboard.group)
 
 grid_start_y = 18
+### smoothstep offsets for scrolling up a row
+scroll_offsets = [round(34 * (3 * (step / SCROLL_STEPS) ** 2
+                              - 2 * (step / SCROLL_STEPS) ** 3))
+                  for step in range(1, SCROLL_STEPS + 1)]
 game_round = 1
 while True:
     word = words.getNextWord()
@@ -871,15 +1147,17 @@ while True:
             popup_text(main_group, "Not in word list")
             time.sleep(2.0)
 
-        ### Score time
+        ### Score time, the whole row is shown with one refresh
         correct = 0
+        display.auto_refresh = False
         for char_idx in range(len(word)):
             if guess[char_idx] == word[char_idx]:
                 grid.set(line_idx, char_idx, None, WordGrid.CORRECT_POSITION)
                 correct += 1
             elif word.find(guess[char_idx]) >= 0:
                 grid.set(line_idx, char_idx, None, WordGrid.PRESENT)
-            time.sleep(0.5)
+        display.refresh()
+        display.auto_refresh = True
 
         if correct == len(word):
             ### Winner, winner, chicken dinner
@@ -895,9 +1173,12 @@ while True:
             d_print(1, "LOSE")
 
         if line_idx >= 3 and line_idx != MAX_GUESSES - 1:
-            for _ in range(0, 34, 2):
-                grid.y -= 2
-                time.sleep(0.025)
+            scroll_y = grid.y
+            display.auto_refresh = False
+            for offset in scroll_offsets:
+                grid.y = scroll_y - offset
+                display.refresh(target_frames_per_second=SCROLL_FPS)
+            display.auto_refresh = True
 
     game_round += 1
     if game_round > ROUNDS:
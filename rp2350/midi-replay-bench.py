@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+### midi-replay-bench.py v1.0
+### Replay a MIDI file through midi_batch to measure processing cost and note latency
+
+### This runs on a desktop with adafruit_midi installed, e.g.
+### pip install adafruit-circuitpython-midi
+### ./midi-replay-bench.py -l 10 sweeps.mid
+### without a file a dense sequence of notes and controller sweeps is generated
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### The main loop is simulated with a fixed loop time for everything other
+### than MIDI processing, messages from the file arrive on a fake port at
+### their due times. "single" mode is one receive() per loop like the
+### old main loop, "batch" mode drains and coalesces with MIDIBatch
+
+import getopt
+import struct
+import sys
+import time
+from collections import deque
+
+import adafruit_midi
+from adafruit_midi.note_on import NoteOn
+from adafruit_midi.note_off import NoteOff
+from adafruit_midi.control_change import ControlChange
+from adafruit_midi.pitch_bend import PitchBend
+from adafruit_midi.channel_pressure import ChannelPressure
+from adafruit_midi.program_change import ProgramChange
+
+from midi_batch import MIDIBatch, MAX_BATCH
+
+
+loop_ms = 5.0
+verbose = False
+
+### Bytes in each channel message by top nibble of status byte
+_DATA_LEN = {0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2, 0xc0: 1, 0xd0: 1, 0xe0: 2}
+
+
+def usage(exit_code):
+    print("midi-replay-bench: [-h] [-l loop_ms] [-v] [file.mid]",
+          file=sys.stderr)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def read_vlq(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_smf(filename):
+    """Return a list of (time in seconds, message bytes) for the channel
+       messages in a Standard MIDI File with all tracks merged."""
+    with open(filename, "rb") as fh:
+        data = fh.read()
+    if data[0:4] != b"MThd":
+        raise ValueError("Not a MIDI file: " + filename)
+    hdr_len, _, tracks, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+    pos = 8 + hdr_len
+
+    events = []  ### (tick, order, status or None for tempo, bytes)
+    order = 0
+    for _ in range(tracks):
+        chunk_type = data[pos:pos + 4]
+        chunk_len = struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        pos += 8
+        end = pos + chunk_len
+        if chunk_type != b"MTrk":
+            pos = end
+            continue
+        tick = 0
+        status = None
+        while pos < end:
+            delta, pos = read_vlq(data, pos)
+            tick += delta
+            if data[pos] & 0x80:
+                status = data[pos]
+                pos += 1
+            if status == 0xff:
+                meta_type = data[pos]
+                meta_len, pos = read_vlq(data, pos + 1)
+                if meta_type == 0x51:
+                    tempo = int.from_bytes(data[pos:pos + 3], "big")
+                    events.append((tick, order, None, tempo))
+                    order += 1
+                pos += meta_len
+                status = None
+            elif status in (0xf0, 0xf7):
+                sysex_len, pos = read_vlq(data, pos)
+                pos += sysex_len
+                status = None
+            elif status is not None:
+                d_len = _DATA_LEN[status & 0xf0]
+                events.append((tick, order, status,
+                               bytes((status,)) + data[pos:pos + d_len]))
+                order += 1
+                pos += d_len
+            else:
+                raise ValueError("Data byte without status at {:d}".format(pos))
+        pos = end
+
+    events.sort()
+    messages = []
+    tempo = 500000  ### microseconds per quarter note
+    last_tick = 0
+    now_s = 0.0
+    for tick, _, status, payload in events:
+        now_s += (tick - last_tick) * tempo / 1e6 / division
+        last_tick = tick
+        if status is None:
+            tempo = payload
+        else:
+            messages.append((now_s, payload))
+    return messages
+
+
+def generate(duration=10.0, cc_rate=500):
+    """A dense test sequence of notes with mod wheel, pitch bend and
+       aftertouch sweeps at cc_rate messages per second for each."""
+    messages = []
+    for step in range(int(duration * 4)):
+        start = step * 0.25
+        note = 48 + (step * 7) % 24
+        messages.append((start, bytes((0x90, note, 100))))
+        messages.append((start + 0.2, bytes((0x80, note, 0))))
+    for idx in range(int(duration * cc_rate)):
+        t = idx / cc_rate
+        ramp = idx % 256
+        value = ramp if ramp < 128 else 255 - ramp
+        bend = value << 7
+        messages.append((t, bytes((0xb0, 1, value))))
+        messages.append((t, bytes((0xe0, bend & 0x7f, bend >> 7))))
+        messages.append((t, bytes((0xd0, value))))
+    messages.sort(key=lambda m: m[0])
+    return messages
+
+
+class ReplayPort:
+    """A fake MIDI input port returning bytes which are due
+       at the simulated time."""
+
+    def __init__(self, messages):
+        self._messages = deque(messages)
+        self._pending = bytearray()
+        self.now_s = 0.0
+        self.note_due = deque()
+
+    def read(self, nbytes):
+        while self._messages and self._messages[0][0] <= self.now_s:
+            due_s, payload = self._messages.popleft()
+            if payload[0] & 0xf0 == 0x90 and payload[2] != 0:
+                self.note_due.append(due_s)
+            self._pending.extend(payload)
+        if not self._pending:
+            return None
+        data = bytes(self._pending[:nbytes])
+        del self._pending[:nbytes]
+        return data
+
+    @property
+    def finished(self):
+        return not self._messages and not self._pending
+
+
+def replay(messages, max_batch):
+    """Run the simulated loop returning a dict of results."""
+    port = ReplayPort(messages)
+    midi = adafruit_midi.MIDI(midi_in=port)
+    latencies = []
+    counts = {}
+
+    def count(msg):
+        counts[type(msg).__name__] = counts.get(type(msg).__name__, 0) + 1
+
+    def note_on(msg):
+        count(msg)
+        if msg.velocity != 0:
+            latencies.append(port.now_s - port.note_due.popleft())
+
+    handlers = {NoteOn: note_on, NoteOff: count, ControlChange: count,
+                PitchBend: count, ChannelPressure: count, ProgramChange: count}
+    batch = MIDIBatch(midi.receive, handlers, default=count, max_batch=max_batch)
+
+    loops = 0
+    busy_s = 0.0
+    dispatched = 1
+    ### Continue until adafruit_midi's own buffer is empty too
+    while not port.finished or dispatched:
+        t1 = time.perf_counter()
+        dispatched = batch.process()
+        busy_s += time.perf_counter() - t1
+        port.now_s += loop_ms / 1000.0
+        loops += 1
+
+    return {"loops": loops,
+            "received": batch.received,
+            "coalesced": batch.coalesced,
+            "dispatched": batch.dispatched,
+            "us_per_msg": busy_s / max(1, batch.received) * 1e6,
+            "lat_mean_ms": sum(latencies) / max(1, len(latencies)) * 1e3,
+            "lat_max_ms": max(latencies, default=0.0) * 1e3,
+            "counts": counts}
+
+
+def main(cmdlineargs):
+    global loop_ms, verbose
+
+    try:
+        opts, args = getopt.getopt(cmdlineargs,
+                                   "hl:v", ["help"])
+    except getopt.GetoptError as err:
+        print(err,
+              file=sys.stderr)
+        usage(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt == "-l":
+            loop_ms = float(arg)
+        elif opt == "-v":
+            verbose = True
+    if len(args) > 1:
+        usage(2)
+
+    messages = read_smf(args[0]) if args else generate()
+    print("Replaying", len(messages), "messages with loop time", loop_ms, "ms")
+
+    results = {}
+    for mode, max_batch in (("single", 1), ("batch", MAX_BATCH)):
+        res = replay(messages, max_batch)
+        results[mode] = res
+        print("{:s}: loops={:d} received={:d} coalesced={:d} dispatched={:d}"
+              " cost={:.1f}us/msg note latency mean={:.2f}ms max={:.2f}ms".format(
+                  mode, res["loops"], res["received"], res["coalesced"],
+                  res["dispatched"], res["us_per_msg"],
+                  res["lat_mean_ms"], res["lat_max_ms"]))
+        if verbose:
+            print(res["counts"])
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+### midi_batch.py v1.0
+### Drain, coalesce and dispatch adafruit_midi messages in batches
+
+### copy this file to Pimoroni PGA2350 alongside code.py
+### midi-replay-bench.py uses this on a desktop with a MIDI file
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Controllers like the mod wheel, pitch bend and aftertouch send a stream
+### of messages where only the latest value matters, these are coalesced
+### if there is no other type of message between them so the order
+### relative to note and program change messages is preserved
+
+from adafruit_midi.control_change import ControlChange
+from adafruit_midi.pitch_bend import PitchBend
+from adafruit_midi.channel_pressure import ChannelPressure
+
+
+### Functions returning the key for messages which can be coalesced
+COALESCE_KEYS = {ControlChange: lambda msg: (msg.channel, msg.control),
+                 PitchBend: lambda msg: msg.channel,
+                 ChannelPressure: lambda msg: msg.channel}
+
+MAX_BATCH = 64
+
+
+class MIDIBatch:
+    """Reads all the pending messages from a receive function and
+       calls a handler for each one based on its type.
+       handlers is a dict of message class to function taking the message,
+       default is called for messages without a handler.
+    """
+
+    def __init__(self, receive, handlers, *, default=None,
+                 coalesce=COALESCE_KEYS, max_batch=MAX_BATCH):
+        self._receive = receive
+        self._handlers = handlers
+        self._default = default
+        self._coalesce = coalesce
+        self._max_batch = max_batch
+        self._batch = [None] * max_batch
+        self._batch_len = 0
+        ### key to position in batch for the current run of controllers
+        self._positions = {}
+        self.received = 0
+        self.coalesced = 0
+        self.dispatched = 0
+
+    def drain(self):
+        """Read messages until there are none left or the batch is full
+           returning the number in the batch."""
+        batch = self._batch
+        positions = self._positions
+        positions.clear()
+        count = 0
+        while count < self._max_batch:
+            msg = self._receive()
+            if msg is None:
+                break
+            self.received += 1
+            key_fn = self._coalesce.get(type(msg))
+            if key_fn is None:
+                positions.clear()
+            else:
+                key = (type(msg), key_fn(msg))
+                pos = positions.get(key)
+                if pos is not None:
+                    batch[pos] = msg
+                    self.coalesced += 1
+                    continue
+                positions[key] = count
+            batch[count] = msg
+            count += 1
+        self._batch_len = count
+        return count
+
+    def dispatch(self):
+        """Call the handlers for the batch returning the number of messages."""
+        batch = self._batch
+        handlers = self._handlers
+        count = self._batch_len
+        for idx in range(count):
+            msg = batch[idx]
+            batch[idx] = None
+            handler = handlers.get(type(msg), self._default)
+            if handler is not None:
+                handler(msg)
+        self._batch_len = 0
+        self.dispatched += count
+        return count
+
+    def process(self):
+        """Drain and dispatch returning the number of messages dispatched."""
+        self.drain()
+        return self.dispatch()
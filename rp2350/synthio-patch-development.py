@@ -1,9 +1,9 @@
-### synthio-patch-development.py v1.1
+### synthio-patch-development.py v1.3
 ### Synthio patch with increasing complexity playable via MIDI
 
 ### Tested with Pimoroni PGA2350 and 9.2.0-beta.1
 
-### copy this file to Pimoroni PGA2350 as code.py
+### copy this file to Pimoroni PGA2350 as code.py with midi_batch.py
 
 ### MIT License
 
@@ -28,6 +28,7 @@
 ### SOFTWARE.
 
 
+import gc
 import math
 import os
 import random
@@ -50,6 +51,8 @@ from adafruit_midi.channel_pressure import ChannelPressure
 from adafruit_midi.program_change import ProgramChange
 from adafruit_midi import control_change_values
 
+from midi_batch import MIDIBatch
+
 
 debug = 2
 
@@ -77,6 +80,17 @@ WAVEFORM_MAX = 2**15 - 1
 WAVEFORM_LEN = 8
 WAVEFORM_HALFLEN = WAVEFORM_LEN // 2
 
+### synthio has 12 channels, each voice can use up to three
+POLYPHONY = 4
+MAX_OSCS_PER_VOICE = 3
+VOICE_STEAL = "oldest"
+### Velocity is quantised to 32 levels for cached envelopes
+ENV_VELOCITY_SHIFT = 2
+### Print note-on performance every n notes
+STATS_INTERVAL = 32
+### Modifiable filters appeared in CircuitPython 10
+BLOCK_BIQUAD = hasattr(synthio, "BlockBiquad")
+
 PRODUCT = synthio.MathOperation.PRODUCT
 SUM = synthio.MathOperation.SUM
 
@@ -138,9 +152,8 @@ waveform_saw    = np.linspace(WAVEFORM_PEAK, 0 - WAVEFORM_PEAK, num=WAVEFORM_LEN
                               dtype=np.int16)
 
 lfo_note_vibrato = synthio.LFO(rate=vibrato_note_rate, scale=vibrato_note_lfo_hi)
-lfo_slowstart_note_vibrato = synthio.LFO(waveform=np.array([0, 0, 4096, 8192, 16384, 24576, 32767],
-                                                           dtype=np.int16),
-                                         interpolate=True, once=True, rate=1/1)
+SLOWSTART_WAVEFORM = np.array([0, 0, 4096, 8192, 16384, 24576, 32767],
+                              dtype=np.int16)
 lfo_pitch_slide = synthio.LFO(waveform=np.array([0, 32767], dtype=np.int16),
                               interpolate=True, once=True, scale=0, rate=0)
 
@@ -149,8 +162,6 @@ pitch_bend_control_math = synthio.Math(SUM, 0.0, 0.0, 0.0)
 aftertouch_math = synthio.Math(SUM, 0.0, 0.0, 0.0)
 modwheel_math = synthio.Math(SUM, 0.0, 0.0, 0.0)
 
-pressed = []  ### pressed keys
-oscs = []     ### holds currently sounding oscillators
 filter_freq = 2000  # current setting of filter
 filter_note_offset = 37
 filter_res = 1.0    # current setting of filter
@@ -159,7 +170,6 @@ amp_env_attack_time = 0.300
 amp_env_decay_time = 0.100
 amp_env_sustain = 0.8
 amp_env_release_time = 1.100
-last_note = None
 last_portamento_note = None
 osc_note = None
 osc_target_note = None
@@ -171,168 +181,341 @@ def map_range(s, a1, a2, b1, b2):
     return  b1 + ((s - a1) * (b2 - b1) / (a2 - a1))
 
 
-### pylint: disable=consider-using-in,too-many-branches
-def note_on(notenum, vel, patch_no):
-
-    new_osc = []
-    level = 0.65 if patch_no >=3 else 0.50
-    f1 = synthio.midi_to_hz(notenum
-                            + random.uniform(-0.003, 0.003))
-    new_osc.append(synthio.Note(frequency=f1,
-                                waveform=waveform_saw,
-                                amplitude=level))
-    if patch_no >= 1:
-        ### Detune of 0.03 (3 cents)
-        f2 = synthio.midi_to_hz(notenum
-                                + random.uniform(-0.003, 0.003)
-                                + random.uniform(0.034, 0.036))
-        new_osc.append(synthio.Note(frequency=f2,
-                                    waveform=waveform_saw,
-                                    amplitude=level * 0.9))
-
-    if patch_no >= 2:
-        ### Detune of -0.045 (-4.5 cents)
-        f3 = synthio.midi_to_hz(notenum
-                                + random.uniform(-0.003, 0.003)
-                                + random.uniform(-0.044, -0.046))
-        new_osc.append(synthio.Note(frequency=f3,
-                                    waveform=waveform_saw,
-                                    amplitude=level * 0.9))
-
-    amp_env = None
-    if patch_no == 3 or patch_no == 4:
-        amp_env = synthio.Envelope(attack_time=amp_env_attack_time,
-                                   decay_time=amp_env_decay_time,
-                                   sustain_level=amp_env_sustain,
-                                   release_time=amp_env_release_time)
-    elif patch_no >= 5:
-        amp_level = map_range(vel,
-                              0, 127,
-                              amp_env_attack_level_lo, amp_env_attack_level_hi)
-        attack_time = map_range(math.sqrt(vel),
-                                0, math.sqrt(127),
-                                amp_env_attack_time_hi, amp_env_attack_time_lo)
-        amp_env = synthio.Envelope(attack_time=attack_time,
-                                   attack_level=amp_level,
-                                   decay_time=amp_env_decay_time,
-                                   sustain_level=amp_level*amp_env_sustain,
-                                   release_time=amp_env_release_time)
-    if amp_env:
-        for osc in new_osc:
+class Voice:
+    """A preallocated set of oscillators (synthio.Note) playing one MIDI note.
+       The Note objects are reused by changing their properties."""
+
+    def __init__(self, idx):
+        self.idx = idx
+        self.oscs = [synthio.Note(frequency=440.0, waveform=waveform_saw, amplitude=0.0)
+                     for _ in range(MAX_OSCS_PER_VOICE)]
+        self.active_oscs = self.oscs[:1]
+        self.notenum = None    ### MIDI note number while key is held
+        self.amplitude = 0.0
+        self.start_ns = 0      ### for oldest voice stealing
+        self.release_ns = None
+        ### Each voice has its own slow start so a new note does
+        ### not restart the vibrato on notes already sounding
+        self.lfo_slowstart = synthio.LFO(waveform=SLOWSTART_WAVEFORM,
+                                         interpolate=True, once=True, rate=1/1)
+        self.filter = (synthio.BlockBiquad(synthio.FilterMode.LOW_PASS, 1000.0, 1.0)
+                       if BLOCK_BIQUAD else None)
+        self.bend = None
+
+    def make_bend(self, patch_no):
+        """Create the Math tree for pitch bend for a patch, the same tree
+           is then used for every note played by this voice."""
+        bend = None
+        if patch_no == 5:
+            ### Key-triggered vibrato with delay
+            bend = synthio.Math(PRODUCT,
+                                self.lfo_slowstart,
+                                lfo_note_vibrato)
+        elif patch_no == 6:
+            ### Vibrato via mod wheel and after touch with pitch bend
+            bend = synthio.Math(SUM,
+                                synthio.Math(PRODUCT,
+                                             self.lfo_slowstart,
+                                             modwheel_math,
+                                             lfo_note_vibrato),
+                                pitch_bend_control_math,
+                                0.0)
+        elif patch_no >= 7:
+            ### Vibrato via mod wheel and after touch with pitch bend
+            ### and pitch slide using Axiom pad buttons
+            bend = synthio.Math(SUM,
+                                synthio.Math(PRODUCT,
+                                             synthio.Math(SUM,
+                                                          synthio.Math(PRODUCT,
+                                                                       aftertouch_math,
+                                                                       0.8),
+                                                          modwheel_math,
+                                                          0.0),
+                                             lfo_note_vibrato),
+                                pitch_bend_control_math,
+                                lfo_pitch_slide if patch_no >= 8 else 0.0)
+        return bend
+
+    def configure(self, patch_no):
+        osc_count = 1 if patch_no == 0 else (2 if patch_no == 1 else 3)
+        self.active_oscs = self.oscs[:osc_count]
+        self.bend = self.make_bend(patch_no)
+        for osc in self.oscs:
+            osc.envelope = None
+            osc.filter = self.filter if (patch_no >= 4 and BLOCK_BIQUAD) else None
+            osc.bend = self.bend if self.bend is not None else 0.0
+            osc.amplitude = 0.0
+
+
+class VoiceManager:
+    """Polyphonic voice allocation with voice stealing for synthio.
+       steal is "oldest" or "quietest", the latter uses the envelope
+       value from Synthesizer.note_info to find the quietest voice.
+       Note-on latency and memory allocation are recorded for each note.
+    """
+
+    def __init__(self, synthesizer, voice_count, *, steal="oldest"):
+        if steal not in ("oldest", "quietest"):
+            raise ValueError("Unknown steal: " + steal)
+        self._synth = synthesizer
+        self._steal = steal
+        self.voices = [Voice(idx) for idx in range(voice_count)]
+        self.patch_no = None
+        self._env_cache = {}
+        self._filter_cache = {}
+        self.note_on_count = 0
+        self.note_on_total_ns = 0
+        self.note_on_max_ns = 0
+        self.note_on_alloc = 0
+
+    def configure(self, patch_no):
+        """Prepare all the voices for a patch, this is the only place
+           where significant allocation takes place."""
+        self.all_off()
+        self.patch_no = patch_no
+        for voice in self.voices:
+            voice.configure(patch_no)
+        self.envelopes_changed()
+        self.filters_changed()
+        gc.collect()
+
+    def envelopes_changed(self):
+        self._env_cache.clear()
+
+    def filters_changed(self):
+        self._filter_cache.clear()
+
+    def _envelope(self, vel):
+        """Return an Envelope from a cache keyed on velocity bucket as
+           synthio.Envelope objects cannot be modified."""
+        patch_no = self.patch_no
+        if patch_no < 3:
+            return None
+        key = 0 if patch_no <= 4 else vel >> ENV_VELOCITY_SHIFT
+        amp_env = self._env_cache.get(key)
+        if amp_env is None:
+            if patch_no <= 4:
+                amp_env = synthio.Envelope(attack_time=amp_env_attack_time,
+                                           decay_time=amp_env_decay_time,
+                                           sustain_level=amp_env_sustain,
+                                           release_time=amp_env_release_time)
+            else:
+                q_vel = (key << ENV_VELOCITY_SHIFT) + (1 << ENV_VELOCITY_SHIFT) // 2
+                amp_level = map_range(q_vel,
+                                      0, 127,
+                                      amp_env_attack_level_lo, amp_env_attack_level_hi)
+                attack_time = map_range(math.sqrt(q_vel),
+                                        0, math.sqrt(127),
+                                        amp_env_attack_time_hi, amp_env_attack_time_lo)
+                amp_env = synthio.Envelope(attack_time=attack_time,
+                                           attack_level=amp_level,
+                                           decay_time=amp_env_decay_time,
+                                           sustain_level=amp_level*amp_env_sustain,
+                                           release_time=amp_env_release_time)
+            self._env_cache[key] = amp_env
+        return amp_env
+
+    def _apply_filter(self, voice, notenum):
+        if self.patch_no < 4:
+            return
+        f_hz = synthio.midi_to_hz(notenum + filter_note_offset)
+        if BLOCK_BIQUAD:
+            voice.filter.frequency = f_hz
+            voice.filter.Q = filter_res
+        else:
+            lpf = self._filter_cache.get(notenum)
+            if lpf is None:
+                lpf = self._synth.low_pass_filter(f_hz, filter_res)
+                self._filter_cache[notenum] = lpf
+            for osc in voice.active_oscs:
+                osc.filter = lpf
+
+    def _level(self, voice):
+        """Current envelope level of a voice or 0.0 if it is silent."""
+        state, value = self._synth.note_info(voice.active_oscs[0])
+        return 0.0 if state is None else value * voice.amplitude
+
+    def _allocate(self):
+        free = None
+        for voice in self.voices:
+            if voice.notenum is None:
+                if voice.release_ns is None:
+                    return voice
+                if free is None or voice.release_ns < free.release_ns:
+                    free = voice  ### oldest released voice
+        if self._steal == "quietest":
+            return min(self.voices, key=self._level)
+        if free is not None:
+            return free
+        return min(self.voices, key=lambda v: v.start_ns)
+
+    def note_on(self, notenum, vel):
+        t1 = time.monotonic_ns()
+        a1 = gc.mem_alloc()
+        patch_no = self.patch_no
+        voice = self._allocate()
+        oscs = voice.active_oscs
+
+        level = 0.65 if patch_no >= 3 else 0.50
+        oscs[0].frequency = synthio.midi_to_hz(notenum
+                                               + random.uniform(-0.003, 0.003))
+        oscs[0].amplitude = level
+        if patch_no >= 1:
+            ### Detune of 0.03 (3 cents)
+            oscs[1].frequency = synthio.midi_to_hz(notenum
+                                                   + random.uniform(-0.003, 0.003)
+                                                   + random.uniform(0.034, 0.036))
+            oscs[1].amplitude = level * 0.9
+        if patch_no >= 2:
+            ### Detune of -0.045 (-4.5 cents)
+            oscs[2].frequency = synthio.midi_to_hz(notenum
+                                                   + random.uniform(-0.003, 0.003)
+                                                   + random.uniform(-0.044, -0.046))
+            oscs[2].amplitude = level * 0.9
+
+        amp_env = self._envelope(vel)
+        for osc in oscs:
             osc.envelope = amp_env
+        self._apply_filter(voice, notenum)
+
+        voice.notenum = notenum
+        voice.amplitude = level
+        voice.start_ns = t1
+        voice.release_ns = None
+        voice.lfo_slowstart.retrigger()
+        ### Pressing a Note which is still sounding retriggers it
+        self._synth.press(oscs)
+
+        t2 = time.monotonic_ns()
+        a2 = gc.mem_alloc()
+        self.note_on_count += 1
+        self.note_on_total_ns += t2 - t1
+        self.note_on_max_ns = max(self.note_on_max_ns, t2 - t1)
+        ### gc.collect() during the note_on would make this negative
+        if a2 > a1:
+            self.note_on_alloc += a2 - a1
+        if self.note_on_count % STATS_INTERVAL == 0:
+            self.print_stats()
+        return voice
+
+    def note_off(self, notenum):
+        for voice in self.voices:
+            if voice.notenum == notenum:
+                self._synth.release(voice.active_oscs)
+                voice.notenum = None
+                voice.release_ns = time.monotonic_ns()
+
+    def all_off(self):
+        for voice in self.voices:
+            self._synth.release(voice.oscs)
+            voice.notenum = None
+            voice.release_ns = None
+
+    @property
+    def pressed(self):
+        return [v.notenum for v in self.voices if v.notenum is not None]
+
+    def print_stats(self):
+        d_print(1, "note_on count={:d} mean={:.3f}ms max={:.3f}ms alloc={:d} bytes/note".format(
+            self.note_on_count,
+            self.note_on_total_ns / self.note_on_count / 1e6,
+            self.note_on_max_ns / 1e6,
+            self.note_on_alloc // self.note_on_count))
+
+
+voices = VoiceManager(synth, POLYPHONY, steal=VOICE_STEAL)
+voices.configure(current_patch)
+
+
+def handle_program_change(msg):
+    global current_patch
+    if debug >= 2:
+        d_print(2, "PC: ", msg.patch)
+    if 0 <= msg.patch < len(patches):
+        current_patch = msg.patch
+        voices.configure(current_patch)
+
+
+def handle_pad(msg, note_on):
+    if note_on:
+        button_pad = note_to_button.get(msg.note)
+        if button_pad is not None:
+            lfo_pitch_slide.scale = -8 if button_pad <= 4 else 8
+            lfo_pitch_slide.rate = 0.0625 / ((button_pad - 1) % 4 + 1)
+            lfo_pitch_slide.retrigger()
+    else:
+        lfo_pitch_slide.scale = 0.0
+        lfo_pitch_slide.rate = 0.0
+
+
+def handle_note_on(msg):
+    if msg.velocity == 0:
+        handle_note_off(msg)
+    elif msg.channel == MIDI_KEY_CHANNEL_WIRE:
+        if debug >= 2:
+            d_print(2, "Note:", msg.note, "vel={:d}".format(msg.velocity))
+        voices.note_on(msg.note, msg.velocity)
+    elif msg.channel == MIDI_PAD_CHANNEL_WIRE:
+        handle_pad(msg, True)
 
-    if patch_no >= 4:
-        lpf = synth.low_pass_filter(synthio.midi_to_hz(notenum + filter_note_offset), filter_res)
-        for osc in new_osc:
-            osc.filter = lpf
-
-    pitch_bend = None
-    if patch_no == 5:
-        ### Key-triggered vibrato with delay
-        pitch_bend = synthio.Math(PRODUCT,
-                                  lfo_slowstart_note_vibrato,
-                                  lfo_note_vibrato)
-    elif patch_no == 6:
-        ### Vibrato via mod wheel and after touch with pitch bend
-        pitch_bend = synthio.Math(SUM,
-                                  synthio.Math(PRODUCT,
-                                               lfo_slowstart_note_vibrato,
-                                               modwheel_math,
-                                               lfo_note_vibrato),
-                                  pitch_bend_control_math,
-                                  0.0)
-    elif patch_no >= 7:
-        ### Vibrato via mod wheel and after touch with pitch bend
-        ### and pitch slide using Axiom pad buttons
-        pitch_bend = synthio.Math(SUM,
-                                  synthio.Math(PRODUCT,
-                                               synthio.Math(SUM,
-                                                            synthio.Math(PRODUCT,
-                                                                         aftertouch_math,
-                                                                         0.8),
-                                                            modwheel_math,
-                                                            0.0),
-                                               lfo_note_vibrato),
-                                  pitch_bend_control_math,
-                                  lfo_pitch_slide if patch_no >= 8 else 0.0)
-    if pitch_bend:
-        for osc in new_osc:
-            osc.bend = pitch_bend
-
-    oscs.clear()
-    pressed.clear()
-    lfo_slowstart_note_vibrato.retrigger()
-
-    ### Add oscillattors to list and presss the 'note' (a collection
-    ### of oscs acting in concert)
-    oscs.extend(new_osc)
-    synth.press(oscs)
-    pressed.append(notenum)
-
-
-def notes_off():
-
-    synth.release(oscs)
-    oscs.clear()
-    pressed.clear()
 
+def handle_note_off(msg):
+    if msg.channel == MIDI_KEY_CHANNEL_WIRE:
+        if debug >= 2:
+            d_print(2, "Note:", msg.note, "vel={:d}".format(msg.velocity))
+        voices.note_off(msg.note)
+    elif msg.channel == MIDI_PAD_CHANNEL_WIRE:
+        handle_pad(msg, False)
 
-start_ns = time.monotonic_ns()
-while True:
-    msg = midi_usb.receive()
 
-    if msg:
-        if isinstance(msg, ProgramChange):
-            d_print(2, "PC: ", msg.patch)
-            if 0 <= msg.patch < len(patches):
-                current_patch = msg.patch
+def handle_control_change(msg):
+    global filter_note_offset, filter_res, amp_env_release_time
+    if debug >= 2:
+        d_print(2, "CC:", msg.control, "=", msg.value)
+    if msg.control == control_change_values.MOD_WHEEL:  ### 1 mod wheel
+        modwheel_math.a = msg.value / 127.0
+    elif msg.control == control_change_values.CUTOFF_FREQUENCY:  ### 74
+        ##filter_freq = map_range( msg.value, 0,127, filter_freq_lo, filter_freq_hi)
+        filter_note_offset = map_range(msg.value,
+                                       0, 127,
+                                       filter_note_offset_low, filter_note_offset_high)
+        voices.filters_changed()
+    elif msg.control == control_change_values.FILTER_RESONANCE:  ### 71
+        filter_res = map_range(msg.value, 0, 127, filter_res_lo, filter_res_hi)
+        voices.filters_changed()
+    elif msg.control == control_change_values.RELEASE_TIME: ### 72
+        amp_env_release_time = map_range(msg.value, 0, 127, 0.05, 3)
+        voices.envelopes_changed()
 
-        elif msg.channel == MIDI_KEY_CHANNEL_WIRE and isinstance(msg, NoteOn) and msg.velocity != 0:
-            d_print(2, "Note:", msg.note, "vel={:d}".format(msg.velocity))
-            if last_note is not None:
-                notes_off()
-            note_on(msg.note, msg.velocity, current_patch)
-            last_note = msg.note
-
-        elif msg.channel == MIDI_KEY_CHANNEL_WIRE and (isinstance(msg, NoteOff)
-                                                       or isinstance(msg, NoteOn)
-                                                       and msg.velocity == 0):
-            d_print(2, "Note:", msg.note, "vel={:d}".format(msg.velocity))
-            if msg.note in pressed:  # only release note that's sounding
-                notes_off()
-
-        elif isinstance(msg, ControlChange):
-            d_print(2, "CC:", msg.control, "=", msg.value)
-            if msg.control == control_change_values.MOD_WHEEL:  ### 1 mod wheel
-                modwheel_math.a = msg.value / 127.0
-            elif msg.control == control_change_values.CUTOFF_FREQUENCY:  ### 74
-                ##filter_freq = map_range( msg.value, 0,127, filter_freq_lo, filter_freq_hi)
-                filter_note_offset = map_range(msg.value,
-                                               0, 127,
-                                               filter_note_offset_low, filter_note_offset_high)
-            elif msg.control == control_change_values.FILTER_RESONANCE:  ### 71
-                filter_res = map_range(msg.value, 0, 127, filter_res_lo, filter_res_hi)
-            elif msg.control == control_change_values.RELEASE_TIME: ### 72
-                amp_env_release_time = map_range(msg.value, 0, 127, 0.05, 3)
-
-        elif isinstance(msg, PitchBend):
-            d_print(2, "PB:", msg.pitch_bend)
-            pitch_bend_control_math.a = (msg.pitch_bend - 8192) / 8192
-
-        elif isinstance(msg, ChannelPressure):
-            d_print(2, "AT:", msg.pressure)
-            aftertouch_math.a = msg.pressure / 127.0
-
-        elif msg.channel == MIDI_PAD_CHANNEL_WIRE:
-            if isinstance(msg, NoteOn) and msg.velocity != 0:
-                button_pad = note_to_button.get(msg.note)
-                if button_pad is not None:
-                    lfo_pitch_slide.scale = -8 if button_pad <= 4 else 8
-                    lfo_pitch_slide.rate = 0.0625 / ((button_pad - 1) % 4 + 1)
-                    lfo_pitch_slide.retrigger()
-            elif isinstance(msg, NoteOff) or isinstance(msg, NoteOn) and msg.velocity == 0:
-                lfo_pitch_slide.scale = 0.0
-                lfo_pitch_slide.rate = 0.0
 
-        else:
-            d_print(1, "MIDI MSG:", msg)
+def handle_pitch_bend(msg):
+    if debug >= 2:
+        d_print(2, "PB:", msg.pitch_bend)
+    pitch_bend_control_math.a = (msg.pitch_bend - 8192) / 8192
+
+
+def handle_channel_pressure(msg):
+    if debug >= 2:
+        d_print(2, "AT:", msg.pressure)
+    aftertouch_math.a = msg.pressure / 127.0
+
+
+def handle_other(msg):
+    d_print(1, "MIDI MSG:", msg)
+
+
+MIDI_HANDLERS = {ProgramChange: handle_program_change,
+                 NoteOn: handle_note_on,
+                 NoteOff: handle_note_off,
+                 ControlChange: handle_control_change,
+                 PitchBend: handle_pitch_bend,
+                 ChannelPressure: handle_channel_pressure}
+
+### All pending messages are read each time around the loop with
+### runs of controller messages reduced to the latest value
+midi_batch = MIDIBatch(midi_usb.receive, MIDI_HANDLERS, default=handle_other)
+
+
+start_ns = time.monotonic_ns()
+while True:
+    midi_batch.process()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+### synthio-render.py v1.0
+### Run a synthio patch script on a desktop rendering a MIDI sequence to a wav file
+
+### This needs NumPy and adafruit_midi, scipy makes filters much faster, e.g.
+### pip install adafruit-circuitpython-midi
+### ./synthio-render.py -s patches -o patches.wav synthio-patch-development.py
+### ./synthio-render.py -s filter -o c7.wav ../pico/synthio-filter-breakdown.py
+### -g compares the spectrum with a golden wav file and exits with 1
+### if they differ by more than the tolerance, -u writes the golden file
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### The script is run unmodified with synthio_render installed as synthio
+### and minimal board, audio and usb_midi modules, the MIDI port renders
+### audio up to the time of each message before returning it and
+### raises ReplayFinished to end the script's main loop
+
+import contextlib
+import gc
+import getopt
+import io
+import os
+import random
+import runpy
+import sys
+import time
+import types
+import wave
+from collections import deque
+
+import numpy as np
+
+import synthio_render
+
+
+output = None
+golden = None
+update_golden = False
+tolerance_db = 3.0
+sequence_name = "patches"
+tail_s = 2.0
+verbose = False
+
+KEY = 0x90  ### note on channel 1
+KEY_OFF = 0x80
+CC = 0xb0
+PB = 0xe0
+AT = 0xd0
+PC = 0xc0
+
+
+def chord(start, dur, notes, vel=100):
+    events = [(start, bytes((KEY, n, vel))) for n in notes]
+    events.extend((start + dur, bytes((KEY_OFF, n, 0))) for n in notes)
+    return events
+
+
+def sweep(start, dur, status, data1=None, steps=64, lo=0, hi=127):
+    events = []
+    for idx in range(steps + 1):
+        value = round(lo + (hi - lo) * idx / steps)
+        t = start + dur * idx / steps
+        if status == PB:
+            bend = value << 7
+            events.append((t, bytes((PB, bend & 0x7f, bend >> 7))))
+        elif data1 is None:
+            events.append((t, bytes((status, value))))
+        else:
+            events.append((t, bytes((status, data1, value))))
+    return events
+
+
+def seq_patches():
+    """Every patch in synthio-patch-development.py with a chord
+       and mod wheel, aftertouch and pitch bend sweeps for later patches."""
+    events = []
+    for patch in range(9):
+        start = patch * 3.0
+        events.append((start, bytes((PC, patch))))
+        events.extend(chord(start + 0.1, 1.5, (48, 60, 64, 67)))
+        if patch >= 6:
+            events.extend(sweep(start + 0.2, 1.0, CC, 1))
+            events.extend(sweep(start + 1.2, 0.3, CC, 1, hi=0, lo=127))
+            events.extend(sweep(start + 0.2, 1.0, AT, steps=32))
+            events.extend(sweep(start + 0.5, 1.0, PB, lo=64, hi=96))
+            events.extend(sweep(start + 1.5, 0.1, PB, lo=96, hi=64, steps=4))
+    return events
+
+
+def seq_filter():
+    """C7 which is where synthio-filter-breakdown.py found problems
+       with a cutoff sweep over the range of that script."""
+    events = chord(0.1, 4.0, (84,))
+    events.extend(sweep(0.2, 3.5, CC, 74))
+    events.extend(chord(5.0, 2.0, (60,)))
+    return events
+
+
+def seq_detune():
+    """Single long notes for listening to oscillator detune."""
+    events = [(0.0, bytes((PC, 2)))]
+    events.extend(chord(0.1, 3.0, (45,)))
+    events.extend(chord(4.0, 3.0, (69,)))
+    return events
+
+
+SEQUENCES = {"patches": seq_patches,
+             "filter": seq_filter,
+             "detune": seq_detune}
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+class ReplayPort:
+    """A usb_midi port which renders audio until each message is due.
+       A read with nothing due returns None so the script processes
+       the messages it has before time moves on."""
+
+    def __init__(self, events, tail):
+        self._events = deque(sorted(events, key=lambda e: e[0]))
+        self._tail = tail
+        self._pending = bytearray()
+        self._yielded = False
+        self.now_s = 0.0
+        self.chunks = []
+        self.gain = 1.0
+
+    def _render_until(self, due_s):
+        if not synthio_render.instances:
+            return
+        synth = synthio_render.instances[-1]
+        samples = round((due_s - self.now_s) * synth.sample_rate)
+        if samples > 0:
+            pcm = synth.render(samples, self.gain)
+            self.chunks.append(pcm)
+            self.now_s += len(pcm) / synth.sample_rate
+
+    def read(self, nbytes):
+        if not self._pending:
+            if not self._yielded:
+                self._yielded = True
+                return None
+            self._yielded = False
+            if not self._events:
+                self._render_until(self.now_s + self._tail)
+                raise ReplayFinished()
+            due_s = self._events[0][0]
+            self._render_until(due_s)
+            ### Rendering is in whole blocks so may be a little past due_s
+            due_s = max(due_s, self.now_s)
+            while self._events and self._events[0][0] <= due_s:
+                self._pending.extend(self._events.popleft()[1])
+        data = bytes(self._pending[:nbytes])
+        del self._pending[:nbytes]
+        return data
+
+
+class _MixerVoice:
+    def __init__(self, port):
+        self._port = port
+        self._level = 1.0
+        self._playing_synth = False
+
+    def play(self, sample, *, loop=False):
+        self._playing_synth = isinstance(sample, synthio_render.Synthesizer)
+        if self._playing_synth:
+            self._port.gain = self._level
+
+    def stop(self):
+        self._playing_synth = False
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        self._level = value
+        if self._playing_synth:
+            self._port.gain = value
+
+
+def install_modules(port):
+    """Put the desktop versions of the CircuitPython modules in sys.modules."""
+    board = types.ModuleType("board")
+    board.__getattr__ = lambda name: name  ### pins are just their names
+    sys.modules["board"] = board
+
+    audiopwmio = types.ModuleType("audiopwmio")
+    audiopwmio.PWMAudioOut = lambda *args, **kwargs: types.SimpleNamespace(
+        play=lambda *a, **k: None, stop=lambda: None)
+    sys.modules["audiopwmio"] = audiopwmio
+
+    audiomixer = types.ModuleType("audiomixer")
+    def mixer(*, voice_count=1, **kwargs):
+        return types.SimpleNamespace(voice=[_MixerVoice(port) for _ in range(voice_count)])
+    audiomixer.Mixer = mixer
+    sys.modules["audiomixer"] = audiomixer
+
+    usb_midi = types.ModuleType("usb_midi")
+    usb_midi.ports = (port, None)
+    sys.modules["usb_midi"] = usb_midi
+
+    ulab = types.ModuleType("ulab")
+    ulab.numpy = np
+    sys.modules["ulab"] = ulab
+    sys.modules["ulab.numpy"] = np
+
+    sys.modules["synthio"] = synthio_render
+    if not hasattr(gc, "mem_alloc"):
+        gc.mem_alloc = lambda: 0
+
+
+def render_script(script, events):
+    """Run the script with the events returning the PCM and the Synthesizer."""
+    port = ReplayPort(events, tail_s)
+    install_modules(port)
+    synthio_render.instances.clear()
+    random.seed(0)  ### the patches use random detune
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    script_out = sys.stdout if verbose else io.StringIO()
+    try:
+        with contextlib.redirect_stdout(script_out):
+            runpy.run_path(script, run_name="__main__")
+    except ReplayFinished:
+        pass
+    pcm = np.concatenate(port.chunks) if port.chunks else np.zeros(0, dtype=np.int16)
+    return pcm, synthio_render.instances[-1]
+
+
+def spectrum(pcm, frame_len=4096):
+    """Average magnitude spectrum in dB relative to its peak."""
+    frames = len(pcm) // frame_len
+    if frames == 0:
+        raise ValueError("Too few samples for a spectrum")
+    window = np.hanning(frame_len)
+    data = pcm[:frames * frame_len].astype(np.float64).reshape(frames, frame_len)
+    mags = np.abs(np.fft.rfft(data * window, axis=1)).mean(axis=0)
+    db = 20 * np.log10(np.maximum(mags, 1e-9) / max(mags.max(), 1e-9))
+    return np.maximum(db, -90.0)
+
+
+def spectral_distance(pcm_a, pcm_b):
+    """RMS difference in dB between the spectra of the two signals."""
+    length = min(len(pcm_a), len(pcm_b))
+    return float(np.sqrt(np.mean((spectrum(pcm_a[:length])
+                                  - spectrum(pcm_b[:length])) ** 2)))
+
+
+def write_wav(filename, pcm, rate):
+    with wave.open(filename, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(pcm.astype("<i2").tobytes())
+
+
+def read_wav(filename):
+    with wave.open(filename, "rb") as wav_file:
+        return np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+
+
+def usage(exit_code):
+    print("synthio-render: [-h] [-g golden.wav [-t tolerance_db] [-u]] [-o output.wav]\n"
+          "                [-s " + "|".join(SEQUENCES) + "] [-v] script.py",
+          file=sys.stderr)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def main(cmdlineargs):
+    global output, golden, update_golden, tolerance_db, sequence_name, verbose
+
+    try:
+        opts, args = getopt.getopt(cmdlineargs,
+                                   "g:ho:s:t:uv", ["help", "output="])
+    except getopt.GetoptError as err:
+        print(err,
+              file=sys.stderr)
+        usage(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt == "-g":
+            golden = arg
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt == "-s":
+            sequence_name = arg
+        elif opt == "-t":
+            tolerance_db = float(arg)
+        elif opt == "-u":
+            update_golden = True
+        elif opt == "-v":
+            verbose = True
+    if len(args) != 1 or sequence_name not in SEQUENCES:
+        usage(2)
+
+    t1 = time.perf_counter()
+    pcm, synth = render_script(args[0], SEQUENCES[sequence_name]())
+    t2 = time.perf_counter()
+    rate = synth.sample_rate
+    audio_s = len(pcm) / rate
+    voice_s = synth.voice_blocks * synthio_render.BLOCK_LEN / rate
+    print("Rendered {:.2f}s of audio in {:.2f}s ({:.2f}s synth), {:.2f} voice seconds,"
+          " {:.1f}us per voice per block, peak {:d}".format(
+              audio_s, t2 - t1, synth.render_ns / 1e9, voice_s,
+              synth.render_ns / 1e3 / max(1, synth.voice_blocks),
+              int(np.abs(pcm.astype(np.int32)).max()) if len(pcm) else 0))
+
+    if output is not None:
+        write_wav(output, pcm, rate)
+    if golden is not None:
+        if update_golden:
+            write_wav(golden, pcm, rate)
+            print("Written golden file", golden)
+        else:
+            distance = spectral_distance(pcm, read_wav(golden))
+            print("Spectral distance {:.2f}dB (tolerance {:.2f}dB)".format(distance,
+                                                                          tolerance_db))
+            if distance > tolerance_db:
+                sys.exit(1)
+    return pcm
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
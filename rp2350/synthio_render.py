@@ -0,0 +1,462 @@
+### synthio_render.py v1.0
+### An offline NumPy implementation of the subset of synthio used by the synth patches
+
+### This runs on a desktop, synthio-render.py uses it to play
+### synthio-patch-development.py and synthio-filter-breakdown.py
+### by installing it as the synthio module
+
+### MIT License
+
+### Copyright (c) 2026 Kevin J. Walters
+
+### Permission is hereby granted, free of charge, to any person obtaining a copy
+### of this software and associated documentation files (the "Software"), to deal
+### in the Software without restriction, including without limitation the rights
+### to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+### copies of the Software, and to permit persons to whom the Software is
+### furnished to do so, subject to the following conditions:
+
+### The above copyright notice and this permission notice shall be included in all
+### copies or substantial portions of the Software.
+
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+### IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+### FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+### AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+### LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+### SOFTWARE.
+
+### Like synthio the audio is produced in blocks of 256 samples with LFOs,
+### Math blocks and envelopes updated once per block, each note's block
+### is calculated with NumPy array operations
+###
+### This is a model of synthio's behaviour rather than a port of its
+### fixed point C code, waveform playback is truncated like synthio but
+### envelopes and filters use floating point so the overflow which turns
+### synthio's filter into noise above the Nyquist frequency is not
+### reproduced, the filter coefficients are the same though
+
+import math
+import time
+
+import numpy as np
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+
+BLOCK_LEN = 256
+MAX_CHANNELS = 12
+
+### Every Synthesizer made is recorded for synthio-render.py to find
+instances = []
+
+
+def midi_to_hz(midi_note):
+    return 440.0 * 2.0 ** ((midi_note - 69) / 12.0)
+
+
+def voct_to_hz(ctrl):
+    return midi_to_hz(ctrl * 12.0 + 60)
+
+
+class EnvelopeState:
+    ATTACK = 1
+    DECAY = 2
+    SUSTAIN = 3
+    RELEASE = 4
+
+
+class MathOperation:
+    SUM = 0
+    ADD_SUB = 1
+    PRODUCT = 2
+    MUL_DIV = 3
+    SCALE_OFFSET = 4
+    OFFSET_SCALE = 5
+    LERP = 6
+    CONSTRAINED_LERP = 7
+    DIV_ADD = 8
+    ADD_DIV = 9
+    MID = 10
+    MAX = 11
+    MIN = 12
+    ABS = 13
+
+
+def _div(num, den):
+    return num / den if den != 0.0 else 0.0
+
+_MATH_OPS = {MathOperation.SUM: lambda a, b, c: a + b + c,
+             MathOperation.ADD_SUB: lambda a, b, c: a + b - c,
+             MathOperation.PRODUCT: lambda a, b, c: a * b * c,
+             MathOperation.MUL_DIV: lambda a, b, c: _div(a * b, c),
+             MathOperation.SCALE_OFFSET: lambda a, b, c: a * b + c,
+             MathOperation.OFFSET_SCALE: lambda a, b, c: (a + b) * c,
+             MathOperation.LERP: lambda a, b, c: a * (1 - c) + b * c,
+             MathOperation.CONSTRAINED_LERP: lambda a, b, c: a * (1 - min(1.0, max(0.0, c)))
+                                                             + b * min(1.0, max(0.0, c)),
+             MathOperation.DIV_ADD: lambda a, b, c: _div(a, b) + c,
+             MathOperation.ADD_DIV: lambda a, b, c: _div(a + b, c),
+             MathOperation.MID: lambda a, b, c: sorted((a, b, c))[1],
+             MathOperation.MAX: lambda a, b, c: max(a, b, c),
+             MathOperation.MIN: lambda a, b, c: min(a, b, c),
+             MathOperation.ABS: lambda a, b, c: abs(a)}
+
+
+def _input_value(value, tick, dt):
+    """Resolve a float or block input for this block."""
+    if isinstance(value, _BlockInput):
+        return value._tick_value(tick, dt)
+    return float(value)
+
+
+class _BlockInput:
+    """Base for values which are recalculated once per block."""
+
+    def __init__(self):
+        self._tick = None
+        self._value = 0.0
+
+    def _tick_value(self, tick, dt):
+        if tick != self._tick:
+            self._tick = tick
+            self._value = self._calculate(tick, dt)
+        return self._value
+
+    @property
+    def value(self):
+        return self._value
+
+
+class LFO(_BlockInput):
+    """A low frequency oscillator, value is offset + scale * waveform
+       where the waveform is normalised to +/- 1.0."""
+
+    _DEFAULT_WAVEFORM = np.array([0, 32767, 0, -32767], dtype=np.int16)
+
+    def __init__(self, waveform=None, *, rate=1.0, scale=1.0, offset=0.0,
+                 phase_offset=0.0, once=False, interpolate=True):
+        super().__init__()
+        self.waveform = waveform
+        self.rate = rate
+        self.scale = scale
+        self.offset = offset
+        self.phase_offset = phase_offset
+        self.once = once
+        self.interpolate = interpolate
+        self._phase = None
+
+    def retrigger(self):
+        self._phase = None
+
+    def _calculate(self, tick, dt):
+        wave = self._DEFAULT_WAVEFORM if self.waveform is None else self.waveform
+        wave_len = len(wave)
+        phase_offset = _input_value(self.phase_offset, tick, dt)
+        if self._phase is None:
+            self._phase = 0.0
+        else:
+            self._phase += _input_value(self.rate, tick, dt) * dt
+        if self.once:
+            phase = min(self._phase + phase_offset, 1.0)
+        else:
+            phase = (self._phase + phase_offset) % 1.0
+        pos = phase * wave_len
+        idx = min(int(pos), wave_len - 1)
+        sample = float(wave[idx])
+        if self.interpolate:
+            if idx + 1 < wave_len:
+                next_sample = float(wave[idx + 1])
+            else:
+                next_sample = sample if self.once else float(wave[0])
+            sample += (next_sample - sample) * (pos - idx)
+        return (_input_value(self.offset, tick, dt)
+                + _input_value(self.scale, tick, dt) * sample / 32768.0)
+
+
+class Math(_BlockInput):
+    def __init__(self, operation, a, b=0.0, c=1.0):
+        super().__init__()
+        self.operation = operation
+        self.a = a
+        self.b = b
+        self.c = c
+
+    def _calculate(self, tick, dt):
+        return _MATH_OPS[self.operation](_input_value(self.a, tick, dt),
+                                         _input_value(self.b, tick, dt),
+                                         _input_value(self.c, tick, dt))
+
+
+class Envelope:
+    def __init__(self, *, attack_time=0.1, decay_time=0.05, release_time=0.2,
+                 attack_level=1.0, sustain_level=0.8):
+        self.attack_time = attack_time
+        self.decay_time = decay_time
+        self.release_time = release_time
+        self.attack_level = attack_level
+        self.sustain_level = sustain_level
+
+
+### Used for notes without an envelope, instant on and off
+_NO_ENVELOPE = Envelope(attack_time=0.0, decay_time=0.0, release_time=0.0,
+                        attack_level=1.0, sustain_level=1.0)
+
+
+class Biquad:
+    """Filter coefficients, b0, b1, b2, a1, a2 normalised by a0."""
+
+    def __init__(self, b0, b1, b2, a0, a1, a2):
+        self.b = np.array((b0 / a0, b1 / a0, b2 / a0))
+        self.a = np.array((1.0, a1 / a0, a2 / a0))
+        self._matrices = None
+
+    def block_matrices(self, length):
+        """Return matrices giving the output and the final state of a
+           transposed direct form II filter for a block of length
+           samples from the input and the initial state.
+           These are calculated by running the filter on an impulse at
+           every position and on each unit initial state at the same time."""
+        if self._matrices is not None and self._matrices[0].shape[0] == length:
+            return self._matrices
+        b0, b1, b2 = self.b
+        a1, a2 = self.a[1], self.a[2]
+        cols = length + 2
+        inputs = np.zeros((length, cols))
+        inputs[:, :length] = np.eye(length)
+        z1 = np.zeros(cols)
+        z2 = np.zeros(cols)
+        z1[length] = 1.0
+        z2[length + 1] = 1.0
+        outputs = np.empty((length, cols))
+        for idx in range(length):
+            x = inputs[idx]
+            y = b0 * x + z1
+            z1 = b1 * x - a1 * y + z2
+            z2 = b2 * x - a2 * y
+            outputs[idx] = y
+        final = np.stack((z1, z2))
+        self._matrices = (outputs[:, :length], outputs[:, length:],
+                          final[:, :length], final[:, length:])
+        return self._matrices
+
+
+class Note:
+    def __init__(self, frequency, *, panning=0.0, waveform=None, envelope=None,
+                 amplitude=1.0, bend=0.0, filter=None):
+        self.frequency = frequency
+        self.panning = panning
+        self.waveform = waveform
+        self.envelope = envelope
+        self.amplitude = amplitude
+        self.bend = bend
+        self.filter = filter
+
+
+class _Channel:
+    """The playback state of a pressed or releasing Note."""
+
+    def __init__(self, note):
+        self.note = note
+        self.phase = 0.0
+        self.level = 0.0
+        self.state = EnvelopeState.ATTACK
+        self.zi = np.zeros(2)
+        self.filter = None
+
+
+class Synthesizer:
+    """Mixes the notes which are playing, render() is the addition
+       for desktop use which returns the next samples as int16."""
+
+    _DEFAULT_WAVEFORM = np.concatenate((np.full(BLOCK_LEN // 2, 32767, dtype=np.int16),
+                                        np.full(BLOCK_LEN // 2, -32767, dtype=np.int16)))
+
+    def __init__(self, *, sample_rate=11025, channel_count=1,
+                 waveform=None, envelope=None):
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.waveform = waveform
+        self.envelope = envelope
+        self.blocks = []
+        self._channels = []
+        self._tick = 0
+        self._block_buf = np.zeros(BLOCK_LEN)
+        self._offsets = np.arange(BLOCK_LEN, dtype=np.float64)
+        self.voice_blocks = 0
+        self.render_ns = 0
+        instances.append(self)
+
+    def _find(self, note):
+        for chan in self._channels:
+            if chan.note is note:
+                return chan
+        return None
+
+    def press(self, press=()):
+        if isinstance(press, Note):
+            press = (press,)
+        for note in press:
+            chan = self._find(note)
+            if chan is None:
+                if len(self._channels) >= MAX_CHANNELS:
+                    continue
+                chan = _Channel(note)
+                self._channels.append(chan)
+            ### Retriggering starts the attack from the current level
+            chan.state = EnvelopeState.ATTACK
+
+    def release(self, release=()):
+        if isinstance(release, Note):
+            release = (release,)
+        for note in release:
+            chan = self._find(note)
+            if chan is not None:
+                chan.state = EnvelopeState.RELEASE
+
+    def release_all(self):
+        for chan in self._channels:
+            chan.state = EnvelopeState.RELEASE
+
+    def change(self, release=(), press=()):
+        self.release(release)
+        self.press(press)
+
+    def release_then_press(self, release=(), press=()):
+        self.change(release, press)
+
+    @property
+    def pressed(self):
+        return tuple(c.note for c in self._channels
+                     if c.state != EnvelopeState.RELEASE)
+
+    def note_info(self, note):
+        chan = self._find(note)
+        if chan is None:
+            return (None, 0.0)
+        return (chan.state, chan.level)
+
+    def low_pass_filter(self, frequency, Q=0.7071067811865475):
+        ### Audio EQ cookbook low-pass as used by synthio
+        w0 = 2 * math.pi * frequency / self.sample_rate
+        alpha = math.sin(w0) / (2 * Q)
+        cos_w0 = math.cos(w0)
+        return Biquad((1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2,
+                      1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    def high_pass_filter(self, frequency, Q=0.7071067811865475):
+        w0 = 2 * math.pi * frequency / self.sample_rate
+        alpha = math.sin(w0) / (2 * Q)
+        cos_w0 = math.cos(w0)
+        return Biquad((1 + cos_w0) / 2, -1 - cos_w0, (1 + cos_w0) / 2,
+                      1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    def _step_envelope(self, chan, env, dt):
+        """Advance the envelope by one block, returns False when finished."""
+        if chan.state == EnvelopeState.ATTACK:
+            if env.attack_time <= 0.0:
+                chan.level = env.attack_level
+            else:
+                chan.level += env.attack_level * dt / env.attack_time
+            if chan.level >= env.attack_level:
+                chan.level = env.attack_level
+                chan.state = EnvelopeState.DECAY
+        elif chan.state == EnvelopeState.DECAY:
+            if env.decay_time <= 0.0:
+                chan.level = env.sustain_level
+            else:
+                chan.level -= (env.attack_level - env.sustain_level) * dt / env.decay_time
+            if chan.level <= env.sustain_level:
+                chan.level = env.sustain_level
+                chan.state = EnvelopeState.SUSTAIN
+        elif chan.state == EnvelopeState.RELEASE:
+            if env.release_time <= 0.0:
+                chan.level = 0.0
+            else:
+                chan.level -= env.attack_level * dt / env.release_time
+            if chan.level <= 0.0:
+                chan.level = 0.0
+                return False
+        return True
+
+    def _render_block(self, out):
+        dt = BLOCK_LEN / self.sample_rate
+        tick = self._tick
+        out[:] = 0.0
+        for block in self.blocks:
+            _input_value(block, tick, dt)
+
+        finished = []
+        for chan in self._channels:
+            note = chan.note
+            env = note.envelope or self.envelope or _NO_ENVELOPE
+            if not self._step_envelope(chan, env, dt):
+                finished.append(chan)
+                continue
+            amplitude = _input_value(note.amplitude, tick, dt) * chan.level
+            freq = (_input_value(note.frequency, tick, dt)
+                    * 2.0 ** _input_value(note.bend, tick, dt))
+            wave = note.waveform if note.waveform is not None else self.waveform
+            if wave is None:
+                wave = self._DEFAULT_WAVEFORM
+            wave_len = len(wave)
+
+            ### Truncated table lookup from a phase accumulator
+            step = freq / self.sample_rate
+            phases = (self._offsets * step + chan.phase) % 1.0
+            chan.phase = (chan.phase + step * BLOCK_LEN) % 1.0
+            samples = np.asarray(wave, dtype=np.float64)[(phases * wave_len).astype(np.intp)
+                                                         % wave_len]
+            samples *= amplitude
+
+            if note.filter is not None:
+                samples = self._filter(chan, note.filter, samples)
+            elif chan.filter is not None:
+                chan.filter = None
+                chan.zi[:] = 0.0
+            out += samples
+            self.voice_blocks += 1
+
+        for chan in finished:
+            self._channels.remove(chan)
+        self._tick += 1
+
+    def _filter(self, chan, biquad, samples):
+        if chan.filter is not biquad:
+            chan.filter = biquad
+        b = biquad.b
+        a = biquad.a
+        if lfilter is not None:
+            samples, chan.zi = lfilter(b, a, samples, zi=chan.zi)
+            return samples
+        ### Without scipy the filter for a whole block is a matrix product
+        y_x, y_z, z_x, z_z = biquad.block_matrices(len(samples))
+        result = y_x @ samples + y_z @ chan.zi
+        chan.zi = z_x @ samples + z_z @ chan.zi
+        return result
+
+    def render(self, samples, gain=1.0):
+        """Return the next samples, rounded up to a whole number of blocks,
+           as an int16 array."""
+        t1 = time.perf_counter_ns()
+        blocks = (samples + BLOCK_LEN - 1) // BLOCK_LEN
+        out = np.empty(blocks * BLOCK_LEN)
+        for b_idx in range(blocks):
+            self._render_block(out[b_idx * BLOCK_LEN:(b_idx + 1) * BLOCK_LEN])
+        if gain != 1.0:
+            out *= gain
+        pcm = np.clip(np.round(out), -32768, 32767).astype(np.int16)
+        self.render_ns += time.perf_counter_ns() - t1
+        return pcm
+
+    @property
+    def playing(self):
+        return len(self._channels)
+
+    def deinit(self):
+        if self in instances:
+            instances.remove(self)